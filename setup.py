@@ -30,6 +30,10 @@ setup(name='pyramid_twitcher',
       zip_safe=False,
       test_suite='twitcher',
       install_requires=reqs,
+      extras_require={
+          # YAML files in twitcherctl import and export
+          'yaml': ['PyYAML'],
+      },
       entry_points="""\
       [paste.app_factory]
       main = twitcher:main
@@ -13,18 +13,22 @@ PY3 = not PY2
 if PY2:
     LOGGER.debug('Python 2.x')
     text_type = unicode  # noqa
+    integer_types = (int, long)  # noqa
     from StringIO import StringIO
     # from flufl.enum import Enum
     from urlparse import urlparse
     from urlparse import urljoin
     from urllib2 import urlopen
     import xmlrpclib
+    from cookielib import DefaultCookiePolicy
 else:
     LOGGER.debug('Python 3.x')
     text_type = str
+    integer_types = (int, )
     from io import StringIO
     # from enum import Enum
     from urllib.parse import urlparse
     from urllib.parse import urljoin
     from urllib.request import urlopen
     import xmlrpc.client as xmlrpclib
+    from http.cookiejar import DefaultCookiePolicy
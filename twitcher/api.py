@@ -1,4 +1,6 @@
 from twitcher.datatype import Service
+from twitcher.exceptions import AccessTokenNotFound
+from twitcher.utils import expires_at
 
 import logging
 LOGGER = logging.getLogger("TWITCHER")
@@ -40,12 +42,30 @@ class IRegistry(object):
         """
         raise NotImplementedError
 
+    def register_services(self, services, overwrite):
+        """
+        Adds several OWS services to the service store.
+
+        :param services: a list of dicts with the ``url`` and additional information of each service.
+        :return: a list with the registered service or a dict with the ``url``
+                 and an ``error`` message for each service.
+        """
+        raise NotImplementedError
+
     def unregister_service(self, name):
         """
         Removes OWS service with the given ``name`` from the service store.
         """
         raise NotImplementedError
 
+    def unregister_services(self, names):
+        """
+        Removes the OWS services with the given ``names`` from the service store.
+
+        :return: a list with a flag for each name which is ``True`` if the service was removed.
+        """
+        raise NotImplementedError
+
     def get_service_by_name(self, name):
         """
         Gets service with given ``name`` from service store.
@@ -76,15 +96,28 @@ class TokenManager(ITokenManager):
     Implementation of :class:`twitcher.api.ITokenManager`.
     """
 
-    def __init__(self, tokengenerator, tokenstore):
+    def __init__(self, tokengenerator, tokenstore, revocationlist=None, credentials=None, workdir=None,
+                 prefix='twitcher_'):
         self.tokengenerator = tokengenerator
         self.store = tokenstore
+        self.revocationlist = revocationlist
+        self.credentials = credentials
+        self.workdir = workdir
+        self.prefix = prefix
 
     def generate_token(self, valid_in_hours=1, data=None):
         """
         Implementation of :meth:`twitcher.api.ITokenManager.generate_token`.
+
+        The ESGF certificate of a token with ESGF data is fetched in the background
+        and the location of the credentials is stored with the token as ``esgf_workdir``.
         """
         data = data or {}
+        if self.credentials is not None and self.workdir:
+            location = self.credentials.provision(data, workdir=self.workdir, prefix=self.prefix,
+                                                  expires_at=expires_at(hours=valid_in_hours))
+            if location is not None:
+                data = dict(data, esgf_workdir=location)
         access_token = self.tokengenerator.create_access_token(
             valid_in_hours=valid_in_hours,
             data=data,
@@ -97,6 +130,8 @@ class TokenManager(ITokenManager):
         Implementation of :meth:`twitcher.api.ITokenManager.revoke_token`.
         """
         try:
+            if self.revocationlist is not None:
+                self._record_revocation(token)
             self.store.delete_token(token)
         except Exception:
             LOGGER.exception('Failed to remove token.')
@@ -109,6 +144,8 @@ class TokenManager(ITokenManager):
         Implementation of :meth:`twitcher.api.ITokenManager.revoke_all_tokens`.
         """
         try:
+            if self.revocationlist is not None:
+                self.revocationlist.revoke_all()
             self.store.clear_tokens()
         except Exception:
             LOGGER.exception('Failed to remove tokens.')
@@ -116,6 +153,15 @@ class TokenManager(ITokenManager):
         else:
             return True
 
+    def _record_revocation(self, token):
+        # self-contained tokens stay valid until they are recorded as revoked
+        try:
+            access_token = self.tokengenerator.verify(token) or self.store.fetch_by_token(token)
+        except AccessTokenNotFound:
+            LOGGER.debug('Revoked token is unknown.')
+        else:
+            self.revocationlist.revoke(token, expires_at=access_token.expires_at)
+
 
 class Registry(IRegistry):
     """
@@ -136,6 +182,26 @@ class Registry(IRegistry):
         service = self.store.save_service(service, overwrite=overwrite)
         return service.params
 
+    def register_services(self, services, overwrite=True):
+        """
+        Implementation of :meth:`twitcher.api.IRegistry.register_services`.
+        """
+        results = [None] * len(services)
+        valid = []
+        for index, data in enumerate(services):
+            try:
+                valid.append((index, Service(**dict(data))))
+            except Exception as e:
+                results[index] = {'url': dict(data).get('url', ''), 'error': str(e)}
+        saved = self.store.save_services([service for _, service in valid], overwrite=overwrite)
+        for (index, service), result in zip(valid, saved):
+            if isinstance(result, Exception):
+                LOGGER.warn('Could not register service %s: %s', service.url, result)
+                results[index] = {'url': service.url, 'error': str(result)}
+            else:
+                results[index] = result.params
+        return results
+
     def unregister_service(self, name):
         """
         Implementation of :meth:`twitcher.api.IRegistry.unregister_service`.
@@ -148,6 +214,16 @@ class Registry(IRegistry):
         else:
             return True
 
+    def unregister_services(self, names):
+        """
+        Implementation of :meth:`twitcher.api.IRegistry.unregister_services`.
+        """
+        try:
+            return self.store.delete_services(names)
+        except Exception:
+            LOGGER.exception('unregister failed')
+            return [False] * len(names)
+
     def get_service_by_name(self, name):
         """
         Implementation of :meth:`twitcher.api.IRegistry.get_service_by_name`.
@@ -0,0 +1,155 @@
+"""
+In-process caches used to avoid round trips to the storage backends.
+"""
+
+import os
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+
+from twitcher.db import mongodb
+from twitcher.invalidation import InvalidationChannel
+from twitcher.invalidation import MongodbGenerationCounter, FileGenerationCounter
+from twitcher.stats import add_stats_provider
+
+import logging
+LOGGER = logging.getLogger("TWITCHER")
+
+
+class TTLCache(object):
+    """
+    A thread-safe LRU cache with a time-to-live for each entry.
+
+    :param maxsize: maximum number of entries. The least recently used entry is dropped
+                    when the cache is full.
+    :param ttl: default time-to-live of an entry in seconds.
+    :param timer: function returning the current time in seconds.
+    """
+
+    def __init__(self, maxsize=1000, ttl=60, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the value for ``key`` or ``default`` if the key is not cached or has expired.
+        """
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires <= self.timer():
+                self.misses += 1
+                return default
+            # mark as most recently used
+            self._data[key] = (expires, value)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Caches ``value`` for ``key``. The entry expires after ``ttl`` seconds
+        (default: the ttl of this cache).
+        """
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            while len(self._data) >= self.maxsize:
+                self._data.popitem(last=False)
+            self._data[key] = (self.timer() + ttl, value)
+
+    def pop(self, key):
+        """
+        Removes ``key`` from the cache.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """
+        Removes all entries from the cache.
+        """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Returns a dict with the number of ``hits``, ``misses`` and cached entries.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._data), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > self.timer()
+
+
+_cache_lock = threading.Lock()
+
+
+def get_cache(registry, name, ttl=30, maxsize=1000):
+    """
+    Returns the in-process cache ``name`` which is shared by all users of this registry.
+    The ttl and size can be configured with the settings ``twitcher.<name>_ttl`` and
+    ``twitcher.<name>_size``. The cache is subscribed to the invalidation channel
+    of the registry (see :func:`invalidation_channel_factory`).
+
+    :return: An instance of :class:`twitcher.cache.TTLCache` or ``None`` when the ttl is 0.
+    """
+    caches = getattr(registry, 'caches', None)
+    if caches is None or name not in caches:
+        with _cache_lock:
+            caches = getattr(registry, 'caches', None)
+            if caches is None:
+                registry.invalidation_channel = invalidation_channel_factory(registry)
+                caches = registry.caches = {}
+            if name not in caches:
+                settings = registry.settings or {}
+                ttl = int(settings.get('twitcher.{}_ttl'.format(name), ttl))
+                maxsize = int(settings.get('twitcher.{}_size'.format(name), maxsize))
+                cache = caches[name] = TTLCache(maxsize=maxsize, ttl=ttl) if ttl > 0 else None
+                if cache is not None:
+                    add_stats_provider(registry, name, cache.stats)
+                    if registry.invalidation_channel is not None:
+                        registry.invalidation_channel.subscribe(cache)
+    return caches[name]
+
+
+def invalidation_channel_factory(registry):
+    """
+    Creates the channel used to invalidate the caches of all worker processes.
+    The backend is selected with the setting ``twitcher.cache_invalidation``:
+    "mongodb" (default), "file" or "none".
+
+    :return: An instance of :class:`twitcher.invalidation.InvalidationChannel` or ``None``.
+    """
+    settings = registry.settings or {}
+    backend = settings.get('twitcher.cache_invalidation') or 'mongodb'
+    if backend == 'mongodb':
+        counter = MongodbGenerationCounter(mongodb(registry).generations)
+    elif backend == 'file':
+        path = settings.get('twitcher.cache_invalidation_file')
+        if not path:
+            workdir = settings.get('twitcher.workdir') or tempfile.gettempdir()
+            path = os.path.join(workdir, 'twitcher_cache_generation')
+        counter = FileGenerationCounter(path)
+    else:
+        return None
+    poll_interval = float(settings.get('twitcher.cache_invalidation_poll_interval', 1))
+    return InvalidationChannel(counter, poll_interval=poll_interval)
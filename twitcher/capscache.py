@@ -0,0 +1,175 @@
+"""
+Cache of the (rewritten) GetCapabilities and DescribeProcess responses of the OWS proxy.
+
+These public requests are frequent and their result rarely changes. A cached response is
+served without contacting the service until its ttl is over. Afterwards it is revalidated
+with a conditional request when the service sent an ``ETag`` or ``Last-Modified`` header.
+The cache is cleared when services are registered or removed (see :mod:`twitcher.invalidation`).
+"""
+
+import time
+
+from pyramid.response import Response
+
+from twitcher.cache import get_cache
+from twitcher.utils import token_params
+
+import logging
+LOGGER = logging.getLogger("TWITCHER")
+
+cacheable_request_types = ('getcapabilities', 'describeprocess')
+
+# parameters which don't change the response
+ignored_params = token_params
+
+# request headers of a user, responses to different values are cached separately
+private_request_headers = ('Authorization', 'Cookie')
+
+# response headers of a user which are not sent with a cached response
+private_response_headers = ('set-cookie', 'set-cookie2')
+
+
+def capscache_factory(registry):
+    """
+    Returns the response cache of this registry. It can be configured with the settings
+    ``twitcher.caps_cache_ttl`` (default: 60 seconds, 0 disables the cache),
+    ``twitcher.caps_cache_size`` (number of responses, default: 100),
+    ``twitcher.caps_cache_stale_ttl`` (how long responses are kept for revalidation, default: 3600 seconds)
+    and ``twitcher.caps_cache_max_bytes`` (largest cached response, default: 10 MB).
+
+    :return: An instance of :class:`CapabilitiesCache` or ``None`` when the cache is disabled.
+    """
+    cache = get_cache(registry, 'caps_cache', ttl=60, maxsize=100)
+    if cache is None:
+        return None
+    settings = registry.settings or {}
+    return CapabilitiesCache(
+        cache,
+        channel=registry.invalidation_channel,
+        stale_ttl=int(settings.get('twitcher.caps_cache_stale_ttl', 3600)),
+        max_bytes=int(settings.get('twitcher.caps_cache_max_bytes', 10 * 1024 * 1024)))
+
+
+def cache_key(request, service, extra_path=None):
+    """
+    Returns the cache key of a proxied request or ``None`` if its response is not cacheable.
+
+    The key consists of the service name and url, the extra path, the normalized OWS
+    parameters, the url of the proxy (used in the rewritten documents) and the credentials
+    sent by the user.
+    """
+    if request.method != 'GET':
+        return None
+    params = []
+    request_type = None
+    for key, value in request.GET.items():
+        key = key.lower()
+        if key in ignored_params:
+            continue
+        if key in ('service', 'request'):
+            value = value.lower()
+        if key == 'request':
+            request_type = value
+        params.append((key, value))
+    if request_type not in cacheable_request_types:
+        return None
+    proxy_url = request.route_url('owsproxy', service_name=service['name'])
+    credentials = tuple(request.headers.get(name) for name in private_request_headers)
+    return (service['name'], service['url'], extra_path or '', tuple(sorted(params)), proxy_url) + credentials
+
+
+class CachedResponse(object):
+    """
+    A cached response with its headers and the validators sent by the service.
+    """
+
+    def __init__(self, body, status=200, headers=None, etag=None, last_modified=None, fresh_until=0):
+        self.body = body
+        self.status = status
+        self.headers = headers or {}
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fresh_until = fresh_until
+
+    def can_revalidate(self):
+        return bool(self.etag or self.last_modified)
+
+    def conditional_headers(self):
+        """
+        Returns the headers of a conditional request for this response.
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def response(self):
+        return Response(self.body, status=self.status, headers=dict(self.headers))
+
+
+class CapabilitiesCache(object):
+    """
+    Keeps :class:`CachedResponse` objects in a :class:`twitcher.cache.TTLCache`.
+
+    Responses are fresh for the ttl of the cache. Responses which can be revalidated are kept
+    ``stale_ttl`` seconds longer. The cache is cleared when a change of the services is
+    published to the invalidation ``channel``.
+    """
+
+    def __init__(self, cache, stale_ttl=3600, max_bytes=10 * 1024 * 1024, timer=time.time, channel=None):
+        self.cache = cache
+        self.channel = channel
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self.timer = timer
+
+    def get(self, key):
+        """
+        Returns a tuple of the cached response for ``key`` (or ``None``) and a flag
+        which is ``True`` if the response is fresh.
+        """
+        if self.channel is not None:
+            self.channel.poll()
+        cached = self.cache.get(key)
+        if cached is None:
+            return None, False
+        return cached, cached.fresh_until > self.timer()
+
+    def set(self, key, resp, body, headers=None):
+        """
+        Caches the ``body`` of the ``requests`` response ``resp`` if it was successful. The cached
+        response is sent with ``headers`` (default: the content type of ``resp``) without the
+        cookies set by the service.
+        """
+        if resp.status_code != 200:
+            return None
+        if len(body) > self.max_bytes:
+            LOGGER.debug('response is too large to be cached.')
+            return None
+        if headers is None:
+            content_type = resp.headers.get('Content-Type')
+            headers = {'Content-Type': content_type} if content_type else {}
+        headers = dict((k, v) for k, v in headers.items() if k.lower() not in private_response_headers)
+        cached = CachedResponse(
+            body,
+            status=resp.status_code,
+            headers=headers,
+            etag=resp.headers.get('ETag'),
+            last_modified=resp.headers.get('Last-Modified'))
+        self._store(key, cached)
+        return cached
+
+    def revalidated(self, key, cached):
+        """
+        Marks the response as fresh after the service confirmed that it is unchanged.
+        """
+        self._store(key, cached)
+
+    def _store(self, key, cached):
+        cached.fresh_until = self.timer() + self.cache.ttl
+        ttl = self.cache.ttl
+        if cached.can_revalidate():
+            ttl += self.stale_ttl
+        self.cache.set(key, cached, ttl=ttl)
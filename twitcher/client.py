@@ -84,10 +84,18 @@ class TwitcherService(object):
         data = data or {}
         return self.server.register_service(url, data, overwrite)
 
+    @xmlrpc_error_handler
+    def register_services(self, services, overwrite=True):
+        return self.server.register_services(services, overwrite)
+
     @xmlrpc_error_handler
     def unregister_service(self, name):
         return self.server.unregister_service(name)
 
+    @xmlrpc_error_handler
+    def unregister_services(self, names):
+        return self.server.unregister_services(names)
+
     @xmlrpc_error_handler
     def list_services(self):
         return self.server.list_services()
@@ -103,3 +111,15 @@ class TwitcherService(object):
     @xmlrpc_error_handler
     def get_service_by_name(self, name):
         return self.server.get_service_by_name(name)
+
+    # statistics
+
+    @xmlrpc_error_handler
+    def get_stats(self):
+        return self.server.get_stats()
+
+    # database
+
+    @xmlrpc_error_handler
+    def migrate(self):
+        return self.server.migrate()
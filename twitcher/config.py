@@ -1,17 +1,18 @@
 import os
-import tempfile
 
 from pyramid.settings import asbool
 
+from twitcher.owsrequest import OWSRequest
+from twitcher.owssecurity import owssecurity_factory
+from twitcher.workdirs import workdir_path, workdir_prefix
+
 
 import logging
 LOGGER = logging.getLogger("TWITCHER")
 
 
 def _workdir(request):
-    settings = request.registry.settings
-    workdir = settings.get('twitcher.workdir')
-    workdir = workdir or tempfile.gettempdir()
+    workdir = workdir_path(request.registry.settings)
     if not os.path.exists(workdir):
         os.makedirs(workdir)
     LOGGER.debug('using workdir %s', workdir)
@@ -19,10 +20,19 @@ def _workdir(request):
 
 
 def _prefix(request):
-    settings = request.registry.settings
-    prefix = settings.get('twitcher.prefix')
-    prefix = prefix or 'twitcher_'
-    return prefix
+    return workdir_prefix(request.registry.settings)
+
+
+def _ows_request(request):
+    return OWSRequest(request)
+
+
+def _ows_service(request):
+    return owssecurity_factory(request.registry).get_service(request)
+
+
+def _access_token(request):
+    return owssecurity_factory(request.registry).get_access_token(request)
 
 
 def includeme(config):
@@ -32,3 +42,7 @@ def includeme(config):
 
     config.add_request_method(_workdir, 'workdir', reify=True)
     config.add_request_method(_prefix, 'prefix', reify=True)
+    # the OWS security tween sets these properties when it checks a request
+    config.add_request_method(_ows_request, 'ows_request', reify=True)
+    config.add_request_method(_ows_service, 'ows_service', reify=True)
+    config.add_request_method(_access_token, 'access_token', reify=True)
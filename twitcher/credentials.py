@@ -0,0 +1,248 @@
+"""
+Cache of the ESGF credentials of access tokens.
+
+A protected request with ESGF data in its access token needs a workdir with the ESGF
+certificate (``credentials.pem``) and a ``.dodsrc`` file. Fetching a certificate generates
+a key pair and asks the SLCS service to sign it, which is slow. The workdir is therefore
+kept per token (the key is a hash of the ESGF data) and reused until the certificate expires.
+
+Each fetch writes a new workdir. The current workdir of a token is published with a symbolic
+link ``<prefix>esgf_<key>`` in the twitcher workdir, so that all worker processes of a host
+share it and no request sees a partially written workdir.
+
+The certificate of a new token can be fetched in the background when the token is generated
+(see :meth:`CredentialsCache.provision`). The link is then stored with the token as ``esgf_workdir``.
+"""
+
+import os
+import time
+import errno
+import shutil
+import hashlib
+import calendar
+import tempfile
+import threading
+
+from OpenSSL import crypto
+
+from twitcher.cache import get_cache
+from twitcher.esgf import fetch_certificate, ESGF_CREDENTIALS, TIMEOUT
+from twitcher.keypool import keypool_factory
+from twitcher.sessions import session_registry_factory
+from twitcher.singleflight import SingleFlight
+from twitcher.workdirs import workdirs_factory
+from twitcher.stats import add_stats_provider
+
+import logging
+LOGGER = logging.getLogger("TWITCHER")
+
+_lock = threading.Lock()
+
+
+def credentials_factory(registry):
+    """
+    Returns the :class:`CredentialsCache` of this registry. A new certificate is fetched
+    ``twitcher.esgf_credentials_margin`` seconds (default: 300) before the current one expires.
+    The requests to the SLCS service and credentials urls time out after
+    ``twitcher.esgf_connect_timeout`` (default: 5) and ``twitcher.esgf_read_timeout`` (default: 30) seconds.
+    """
+    credentials = getattr(registry, 'credentials', None)
+    if credentials is None:
+        with _lock:
+            credentials = getattr(registry, 'credentials', None)
+            if credentials is None:
+                settings = registry.settings or {}
+                credentials = registry.credentials = CredentialsCache(
+                    margin=int(settings.get('twitcher.esgf_credentials_margin', 300)),
+                    key_pool=keypool_factory(registry),
+                    workdirs=workdirs_factory(registry),
+                    sessions=session_registry_factory(registry),
+                    downloads=get_cache(registry, 'esgf_downloads', ttl=86400, maxsize=100),
+                    timeout=(float(settings.get('twitcher.esgf_connect_timeout', TIMEOUT[0])),
+                             float(settings.get('twitcher.esgf_read_timeout', TIMEOUT[1]))))
+                add_stats_provider(registry, 'esgf_credentials', credentials.stats)
+    return credentials
+
+
+def credentials_key(data):
+    """
+    Returns the cache key of the ESGF data of an access token or ``None`` if there is no ESGF data.
+    """
+    if not (data.get('esgf_access_token') or data.get('esgf_credentials')):
+        return None
+    text = u'\n'.join(data.get(name) or u'' for name in
+                      ('esgf_slcs_service_url', 'esgf_access_token', 'esgf_credentials'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def certificate_not_after(path):
+    """
+    Returns the expiry time (seconds since the epoch) of the certificate in the file ``path``
+    or ``None`` if the file has no valid certificate.
+    """
+    try:
+        with open(path, 'rb') as fh:
+            cert = crypto.load_certificate(crypto.FILETYPE_PEM, fh.read())
+        not_after = cert.get_notAfter().decode('ascii')
+        return calendar.timegm(time.strptime(not_after[:14], '%Y%m%d%H%M%S'))
+    except (IOError, OSError, ValueError, crypto.Error):
+        return None
+
+
+class CredentialsCache(object):
+    """
+    Keeps the workdir with the ESGF credentials of each token until ``margin`` seconds
+    before the certificate expires. Credentials without a readable certificate are not cached.
+    The keys of new certificates are taken from ``key_pool`` (see :mod:`twitcher.keypool`).
+    The workdirs are created by ``workdirs`` (see :mod:`twitcher.workdirs`), which removes them
+    after the certificate or the tokens using them expired. The certificates are fetched with
+    the kept-alive ``sessions`` (see :mod:`twitcher.sessions`) and downloaded credentials are
+    revalidated with the ``downloads`` cache (see :class:`twitcher.esgf.ESGFAccessManager`).
+    """
+
+    def __init__(self, margin=300, key_pool=None, workdirs=None, sessions=None, downloads=None, timeout=TIMEOUT,
+                 timer=time.time):
+        self.margin = margin
+        self.key_pool = key_pool
+        self.workdirs = workdirs
+        self.sessions = sessions
+        self.downloads = downloads
+        self.timeout = timeout
+        self.timer = timer
+        self.hits = 0
+        self.fetches = 0
+        self.failures = 0
+        self.provisioned = 0
+        # key -> (workdir, not_after)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._singleflight = SingleFlight()
+
+    def link(self, key, workdir, prefix):
+        """
+        Returns the path of the link to the current workdir of ``key``.
+        """
+        return os.path.join(workdir, '{}esgf_{}'.format(prefix, key))
+
+    def workdir(self, data, workdir, prefix='twitcher_', expires_at=None):
+        """
+        Returns a workdir with the credentials of the ESGF ``data`` of an access token. A new
+        workdir is created in ``workdir`` when there is no valid one. Returns ``None`` if the
+        certificate could not be fetched.
+
+        :param expires_at: expiry time of the access token. The workdir is kept at least until then
+                           (or until the certificate expires).
+        """
+        key = credentials_key(data)
+        if key is None:
+            return None
+        entry = self._valid(key) or self._published(key, data.get('esgf_workdir') or self.link(key, workdir, prefix))
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            self._expire(entry, expires_at)
+            return entry[0]
+        # concurrent requests with the same token fetch only one certificate
+        return self._singleflight.do(key, lambda: self._fetch(key, data, workdir, prefix, expires_at))
+
+    def provision(self, data, workdir, prefix='twitcher_', expires_at=None):
+        """
+        Fetches the credentials of the ESGF ``data`` of a new token in a background thread.
+        Returns the link to the workdir of the credentials or ``None`` if there is no ESGF data.
+        """
+        key = credentials_key(data)
+        if key is None:
+            return None
+        with self._lock:
+            self.provisioned += 1
+
+        def provision():
+            try:
+                self.workdir(data, workdir, prefix, expires_at=expires_at)
+            except Exception:
+                LOGGER.exception('Could not provision ESGF credentials.')
+        thread = threading.Thread(target=provision, name='twitcher-credentials')
+        thread.daemon = True
+        thread.start()
+        return self.link(key, workdir, prefix)
+
+    def stats(self):
+        """
+        Returns a dict with the number of cache ``hits``, certificate ``fetches``, ``failures``,
+        certificates ``provisioned`` for new tokens and cached ``tokens``.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'fetches': self.fetches, 'failures': self.failures,
+                    'provisioned': self.provisioned, 'tokens': len(self._entries)}
+
+    def _valid(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        path, not_after = entry
+        if not_after - self.margin > self.timer() and os.path.isdir(path):
+            return entry
+        with self._lock:
+            if self._entries.get(key) == entry:
+                del self._entries[key]
+        return None
+
+    def _published(self, key, link):
+        # the workdir may be published by another worker process
+        path = os.path.realpath(link)
+        not_after = certificate_not_after(os.path.join(path, ESGF_CREDENTIALS))
+        if not_after is None or not_after - self.margin <= self.timer():
+            return None
+        entry = (path, not_after)
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def _fetch(self, key, data, workdir, prefix, expires_at=None):
+        # another call may have fetched the certificate in the meantime
+        entry = self._valid(key)
+        if entry is not None:
+            self._expire(entry, expires_at)
+            return entry[0]
+        if self.workdirs is not None:
+            path = self.workdirs.create(workdir, prefix)
+        else:
+            path = tempfile.mkdtemp(prefix=prefix, dir=workdir)
+        with self._lock:
+            self.fetches += 1
+        if not fetch_certificate(workdir=path, data=data, key_pool=self.key_pool, sessions=self.sessions,
+                                 downloads=self.downloads, timeout=self.timeout):
+            with self._lock:
+                self.failures += 1
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        not_after = certificate_not_after(os.path.join(path, ESGF_CREDENTIALS))
+        self._expire((path, not_after), expires_at)
+        if not_after is None:
+            LOGGER.warn('Could not read the expiry of the ESGF certificate, it is not cached.')
+            return path
+        self._publish(self.link(key, workdir, prefix), path)
+        with self._lock:
+            self._entries[key] = (path, not_after)
+        return path
+
+    def _expire(self, entry, expires_at):
+        # the workdir is needed until the certificate or the token expires
+        if self.workdirs is None:
+            return
+        path, not_after = entry
+        times = [t for t in (not_after, expires_at) if t]
+        if times:
+            self.workdirs.expire_at(path, min(times))
+
+    def _publish(self, link, path):
+        # replace the link atomically
+        tmp_link = '{}.{}.{}'.format(link, os.getpid(), threading.current_thread().ident)
+        try:
+            os.remove(tmp_link)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        os.symlink(path, tmp_link)
+        os.rename(tmp_link, link)
@@ -43,6 +43,11 @@ class Service(dict):
         """Authentication method: public, token, cert."""
         return self.get('auth', 'token')
 
+    @property
+    def tile_cache(self):
+        """Flag if GetMap responses of this service are cached (see :mod:`twitcher.tilecache`)."""
+        return self.get('tile_cache', False)
+
     @property
     def params(self):
         return {
@@ -50,7 +55,8 @@ class Service(dict):
             'name': self.name,
             'type': self.type,
             'public': self.public,
-            'auth': self.auth}
+            'auth': self.auth,
+            'tile_cache': self.tile_cache}
 
     def __str__(self):
         return self.name
@@ -76,6 +82,11 @@ class AccessToken(dict):
         """Access token string."""
         return self['token']
 
+    @property
+    def issued_at(self):
+        """Time when the token was issued in seconds since the Epoch (0 if unknown)."""
+        return float(self.get("issued_at", 0))
+
     @property
     def expires_at(self):
         return int(self.get("expires_at", 0))
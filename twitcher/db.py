@@ -2,26 +2,144 @@
 # http://docs.pylonsproject.org/projects/pyramid-cookbook/en/latest/database/mongodb.html
 # maybe use event to register mongodb
 
+import os
+import threading
+from datetime import datetime
+
 import pymongo
+from pymongo.errors import PyMongoError
+from pyramid.events import ApplicationCreated
+from pyramid.settings import asbool
 
 import logging
 logger = logging.getLogger(__name__)
 
+# settings which are passed as keyword arguments to pymongo.MongoClient
+CLIENT_OPTIONS = (
+    ('mongodb.max_pool_size', 'maxPoolSize'),
+    ('mongodb.min_pool_size', 'minPoolSize'),
+    ('mongodb.max_idle_time_ms', 'maxIdleTimeMS'),
+    ('mongodb.connect_timeout_ms', 'connectTimeoutMS'),
+    ('mongodb.socket_timeout_ms', 'socketTimeoutMS'),
+    ('mongodb.server_selection_timeout_ms', 'serverSelectionTimeoutMS'),
+    ('mongodb.wait_queue_timeout_ms', 'waitQueueTimeoutMS'),
+)
+
+_client_lock = threading.Lock()
+
+
+def client_options(settings):
+    """
+    Returns the ``pymongo.MongoClient`` keyword arguments configured with ``mongodb.*`` settings.
+    """
+    options = {}
+    for key, option in CLIENT_OPTIONS:
+        value = settings.get(key)
+        if value not in (None, ''):
+            options[option] = int(value)
+    return options
+
+
+def _create_client(settings, **kwargs):
+    options = client_options(settings)
+    options.update(kwargs)
+    return pymongo.MongoClient(settings['mongodb.host'], int(settings['mongodb.port']), **options)
+
+
+def mongodb_client(registry):
+    """
+    Returns the ``pymongo.MongoClient`` of the current process.
+
+    The client is created on first use and kept on the registry. It is created again
+    when the process id changes, so that each forked (gunicorn) worker gets its own
+    connection pool and monitor threads.
+    """
+    pid = os.getpid()
+    client = getattr(registry, 'mongodb_client', None)
+    if client is not None and registry.mongodb_client_pid == pid:
+        return client
+    with _client_lock:
+        client = getattr(registry, 'mongodb_client', None)
+        if client is None or registry.mongodb_client_pid != pid:
+            settings = registry.settings
+            logger.debug('create mongodb client for process %s', pid)
+            # connect=False: don't open connections before the first operation (fork-safe)
+            client = _create_client(settings, connect=False)
+            registry.mongodb_client = client
+            registry.mongodb_client_pid = pid
+    return client
+
 
 def mongodb(registry):
     settings = registry.settings
-    client = pymongo.MongoClient(settings['mongodb.host'], int(settings['mongodb.port']))
-    db = client[settings['mongodb.db_name']]
+    client = mongodb_client(registry)
+    return client[settings['mongodb.db_name']]
+
+
+def ensure_indexes(db):
+    """
+    Creates the indexes of the twitcher collections if they do not exist yet.
+    """
     db.services.create_index("name", unique=True)
     db.services.create_index("url", unique=True)
-    return db
+    db.tokens.create_index("token", unique=True)
+    # expired tokens are removed by mongodb
+    db.tokens.create_index("expires", expireAfterSeconds=0)
+    migrate_token_expiry(db.tokens)
+    db.revoked_tokens.create_index("token", unique=True)
+    db.revoked_tokens.create_index("revoked_at")
+    db.revoked_tokens.create_index("expires", expireAfterSeconds=0)
+
+
+def migrate_token_expiry(collection, batch_size=1000):
+    """
+    Sets the ``expires`` date of tokens saved by older versions, which only have ``expires_at``.
+    The TTL index removes only documents with an ``expires`` date.
+
+    :return: The number of updated tokens.
+    """
+    query = {'expires': {'$exists': False}, 'expires_at': {'$type': 'number'}}
+    count = 0
+    requests = []
+    for document in collection.find(query, {'expires_at': True}):
+        requests.append(pymongo.UpdateOne(
+            {'_id': document['_id']}, {'$set': {'expires': datetime.utcfromtimestamp(document['expires_at'])}}))
+        if len(requests) >= batch_size:
+            count += collection.bulk_write(requests, ordered=False).modified_count
+            requests = []
+    if requests:
+        count += collection.bulk_write(requests, ordered=False).modified_count
+    if count:
+        logger.info('set the expiry date of %s tokens', count)
+    return count
+
+
+def _ensure_indexes_on_startup(event):
+    registry = event.app.registry
+    settings = registry.settings
+    # use a short-lived client which is closed before gunicorn forks its workers.
+    client = _create_client(settings)
+    try:
+        logger.info('ensure indexes of mongodb %s', settings['mongodb.db_name'])
+        ensure_indexes(client[settings['mongodb.db_name']])
+    except PyMongoError as e:
+        # the workers can start without mongodb, the indexes are created later with "twitcherctl migrate"
+        logger.warn("Could not create the indexes of mongodb %s: %s. Run 'twitcherctl migrate' when "
+                    "mongodb is available.", settings['mongodb.db_name'], e)
+    finally:
+        client.close()
 
 
 def includeme(config):
-    config.registry.db = mongodb(config.registry)
+    settings = config.registry.settings
+
+    if asbool(settings.get('mongodb.ensure_indexes', True)) and \
+            not getattr(config.registry, 'mongodb_indexes_subscriber', False):
+        config.registry.mongodb_indexes_subscriber = True
+        config.add_subscriber(_ensure_indexes_on_startup, ApplicationCreated)
 
     def _add_db(request):
-        db = request.registry.db
+        db = mongodb(request.registry)
         # if db_url.username and db_url.password:
         #     db.authenticate(db_url.username, db_url.password)
         return db
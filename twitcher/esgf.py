@@ -16,7 +16,6 @@ import shutil
 from OpenSSL import crypto
 import base64
 import requests
-from requests_oauthlib import OAuth2Session
 
 from twitcher.utils import is_valid_url
 
@@ -29,6 +28,9 @@ ESGF_CREDENTIALS = 'credentials.pem'
 HTTP_RC = '.httprc'
 DAP_CONFIG = '.dodsrc'
 DAP_CONFIG_MARKER = '<<< Managed by twitcher >>>'
+# (connect, read) timeout of the requests to the SLCS service and credentials urls
+TIMEOUT = (5, 30)
+CHUNK_SIZE = 64 * 1024
 
 DAP_CONFIG_TEMPL = """\
 # BEGIN {marker}
@@ -42,13 +44,22 @@ HTTP.SSL.CAPATH={esgf_certs_dir}
 """
 
 
-def fetch_certificate(workdir='.', data={}):
+def generate_key_pair(bits=2048):
+    """
+    Returns a new RSA key pair.
+    """
+    key_pair = crypto.PKey()
+    key_pair.generate_key(crypto.TYPE_RSA, bits)
+    return key_pair
+
+
+def fetch_certificate(workdir='.', data={}, key_pool=None, sessions=None, downloads=None, timeout=TIMEOUT):
     try:
         url = data.get('esgf_slcs_service_url')
         access_token = data.get('esgf_access_token')
         test_credentials = data.get('esgf_credentials')
-        mgr = ESGFAccessManager(url, base_dir=workdir)
-        mgr.logon(access_token, test_credentials)
+        mgr = ESGFAccessManager(url, base_dir=workdir, key_pool=key_pool, sessions=sessions, downloads=downloads)
+        mgr.logon(access_token, test_credentials, timeout=timeout)
         logger.debug('Prepared twitcher workdir %s', workdir)
     except Exception:
         logger.exception("Could not fetch certificate.")
@@ -57,7 +68,20 @@ def fetch_certificate(workdir='.', data={}):
 
 
 class ESGFAccessManager(object):
-    def __init__(self, slcs_service_url, base_dir=None):
+    """
+    Fetches the ESGF credentials into ``base_dir``.
+
+    :param key_pool: a :class:`twitcher.keypool.KeyPool` with the keys of new certificates.
+    :param sessions: a :class:`twitcher.sessions.SessionRegistry` with kept-alive sessions per host.
+    :param downloads: a :class:`twitcher.cache.TTLCache` with the content and validators (ETag,
+                      Last-Modified) of downloaded credentials, which are then downloaded with
+                      a conditional GET.
+    """
+
+    def __init__(self, slcs_service_url, base_dir=None, key_pool=None, sessions=None, downloads=None):
+        self.key_pool = key_pool
+        self.sessions = sessions
+        self.downloads = downloads
         self.certificate_url = "{}/oauth/certificate/".format(slcs_service_url)
         self.base_dir = base_dir or '.'
         self.esgf_credentials = os.path.join(self.base_dir, ESGF_CREDENTIALS)
@@ -65,13 +89,11 @@ class ESGFAccessManager(object):
         self.dap_config = os.path.join(self.base_dir, DAP_CONFIG)
         self.httprc = os.path.join(self.base_dir, HTTP_RC)
 
-        os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
-
-    def logon(self, access_token, cert_url=None, timeout=1):
+    def logon(self, access_token, cert_url=None, timeout=TIMEOUT):
         if access_token:
             self._retrieve_certificate(access_token, timeout=timeout)
         elif cert_url:
-            self._download_certificate(cert_url)
+            self._download_certificate(cert_url, timeout=timeout)
         else:
             raise Exception("Need either access_token or cert_url.")
         self._write_dap_config()
@@ -82,27 +104,56 @@ class ESGFAccessManager(object):
             logger.warn("Could not update permission of credentials.")
         return True
 
-    def _download_certificate(self, url):
+    def _session(self, url):
+        # requests to the same host reuse a kept-alive connection. The sessions are shared by all
+        # users and don't store cookies (see :mod:`twitcher.sessions`).
+        if self.sessions is not None:
+            return self.sessions.session(url)
+        return requests
+
+    def _download_certificate(self, url, timeout=TIMEOUT):
         if is_valid_url(url):
             logger.debug('Download cert from %s', url)
-            response = requests.get(url, stream=True)
+            cached = self.downloads.get(url) if self.downloads is not None else None
+            headers = {}
+            if cached is not None:
+                validators, _ = cached
+                if 'ETag' in validators:
+                    headers['If-None-Match'] = validators['ETag']
+                if 'Last-Modified' in validators:
+                    headers['If-Modified-Since'] = validators['Last-Modified']
+            response = self._session(url).get(url, headers=headers, stream=True, timeout=timeout)
+            try:
+                if response.status_code == 304 and cached is not None:
+                    logger.debug('Cert at %s is not modified.', url)
+                    content = cached[1]
+                else:
+                    response.raise_for_status()
+                    content = b''.join(response.iter_content(chunk_size=CHUNK_SIZE))
+                    validators = dict((name, response.headers[name]) for name in ('ETag', 'Last-Modified')
+                                      if name in response.headers)
+                    if validators and self.downloads is not None:
+                        self.downloads.set(url, (validators, content))
+            finally:
+                response.close()
             with open(self.esgf_credentials, 'wb') as fd:
-                for chunk in response.iter_content(chunk_size=128):
-                    fd.write(chunk)
+                fd.write(content)
             return True
         else:
             return False
 
-    def _retrieve_certificate(self, access_token, timeout=3):
+    def _retrieve_certificate(self, access_token, timeout=TIMEOUT):
         """
         Generates a new private key and certificate request, submits the request to be
         signed by the SLCS CA and returns the certificate.
         """
         logger.debug("Retrieve certificate with token.")
 
-        # Generate a new key pair
-        key_pair = crypto.PKey()
-        key_pair.generate_key(crypto.TYPE_RSA, 2048)
+        # Generate a new key pair or take a pre-generated one
+        if self.key_pool is not None:
+            key_pair = self.key_pool.get()
+        else:
+            key_pair = generate_key_pair()
         private_key = crypto.dump_privatekey(crypto.FILETYPE_PEM, key_pair).decode("utf-8")
 
         # Generate a certificate request using that key-pair
@@ -117,13 +168,11 @@ class ESGFAccessManager(object):
 
         encoded_cert_req = base64.b64encode(der_cert_req)
 
-        # Build the OAuth session object
-        token = {'access_token': access_token, 'token_type': 'Bearer'}
-        client = OAuth2Session(token=token)
-
-        response = client.post(
+        # The OAuth bearer token is sent with the request, the session is shared with other tokens
+        response = self._session(self.certificate_url).post(
             self.certificate_url,
             data={'certificate_request': encoded_cert_req},
+            headers={'Authorization': 'Bearer {}'.format(access_token)},
             verify=False,
             timeout=timeout,
         )
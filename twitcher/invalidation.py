@@ -0,0 +1,145 @@
+"""
+Invalidation of the in-process caches across worker processes.
+
+All workers share a generation counter. A worker which changes a service or token
+increments the counter, the other workers poll it at most every ``poll_interval``
+seconds and clear their caches when it has changed.
+"""
+
+import os
+import time
+import errno
+import fcntl
+import tempfile
+import threading
+
+import logging
+LOGGER = logging.getLogger("TWITCHER")
+
+
+class GenerationCounter(object):
+    """
+    Base class of a counter shared by all worker processes.
+    """
+
+    def get(self):
+        """
+        Returns the current generation.
+        """
+        raise NotImplementedError
+
+    def increment(self):
+        """
+        Increments the generation.
+        """
+        raise NotImplementedError
+
+
+class MongodbGenerationCounter(GenerationCounter):
+    """
+    Generation counter stored in a mongodb document.
+    """
+
+    def __init__(self, collection, name='caches'):
+        self.collection = collection
+        self.name = name
+
+    def get(self):
+        document = self.collection.find_one({'_id': self.name})
+        if not document:
+            return 0
+        return document['generation']
+
+    def increment(self):
+        self.collection.update_one({'_id': self.name}, {'$inc': {'generation': 1}}, upsert=True)
+
+
+class FileGenerationCounter(GenerationCounter):
+    """
+    Generation counter stored in a local file. Useful when all workers run on one host
+    and for testing purposes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def get(self):
+        try:
+            with open(self.path) as fh:
+                return int(fh.read().strip() or 0)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return 0
+            raise
+
+    def increment(self):
+        with open(self.path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                generation = self.get() + 1
+                # replace the file atomically so that readers never see a partial write
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)))
+                with os.fdopen(fd, 'w') as fh:
+                    fh.write(str(generation))
+                os.rename(tmp_path, self.path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class InvalidationChannel(object):
+    """
+    Clears the subscribed caches when another worker process publishes a change.
+
+    :param counter: An instance of :class:`twitcher.invalidation.GenerationCounter`.
+    :param poll_interval: minimum number of seconds between two reads of the counter.
+    """
+
+    def __init__(self, counter, poll_interval=1, timer=time.time):
+        self.counter = counter
+        self.poll_interval = poll_interval
+        self.timer = timer
+        self.subscribers = []
+        self.generation = None
+        self.last_poll = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, cache):
+        """
+        Adds a cache with a ``clear()`` method to the subscribers.
+        """
+        self.subscribers.append(cache)
+
+    def publish(self):
+        """
+        Clears the local caches and notifies the other workers.
+        """
+        self._clear()
+        try:
+            self.counter.increment()
+        except Exception:
+            LOGGER.exception('Could not publish cache invalidation.')
+
+    def poll(self):
+        """
+        Clears the local caches when the generation has changed since the last poll.
+        """
+        now = self.timer()
+        with self._lock:
+            if self.last_poll is not None and now - self.last_poll < self.poll_interval:
+                return
+            self.last_poll = now
+        try:
+            generation = self.counter.get()
+        except Exception:
+            LOGGER.exception('Could not poll cache invalidation.')
+            # don't trust the caches when we can't tell whether they are up to date
+            self._clear()
+            return
+        if self.generation is not None and generation != self.generation:
+            LOGGER.debug('cache generation changed to %s', generation)
+            self._clear()
+        self.generation = generation
+
+    def _clear(self):
+        for cache in self.subscribers:
+            cache.clear()
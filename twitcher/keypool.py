@@ -0,0 +1,130 @@
+"""
+Pool of pre-generated RSA key pairs for the ESGF certificate requests.
+
+Generating a 2048 bit RSA key takes tens to hundreds of milliseconds of CPU. A background
+thread of each worker process keeps a few key pairs ready, so that a certificate request
+doesn't generate its key on the request thread. When the pool is empty the key is generated
+inline.
+"""
+
+import os
+import threading
+
+from twitcher._compat import PY2
+from twitcher.esgf import generate_key_pair
+from twitcher.stats import add_stats_provider
+
+if PY2:
+    from Queue import Queue, Empty, Full
+else:
+    from queue import Queue, Empty, Full
+
+import logging
+LOGGER = logging.getLogger("TWITCHER")
+
+_lock = threading.Lock()
+
+
+def keypool_factory(registry):
+    """
+    Returns the key pool of this registry or ``None`` when the setting ``twitcher.esgf_key_pool_size``
+    (number of pre-generated keys, default: 4) is 0.
+    """
+    settings = registry.settings or {}
+    size = int(settings.get('twitcher.esgf_key_pool_size', 4))
+    if size <= 0:
+        return None
+    keypool = getattr(registry, 'keypool', None)
+    if keypool is None:
+        with _lock:
+            keypool = getattr(registry, 'keypool', None)
+            if keypool is None:
+                keypool = registry.keypool = KeyPool(size=size)
+                add_stats_provider(registry, 'esgf_key_pool', keypool.stats)
+    return keypool
+
+
+class KeyPool(object):
+    """
+    A bounded pool of RSA key pairs which is refilled by a background thread.
+
+    The thread is started on the first :meth:`get` and again in a forked worker process.
+
+    :param size: maximum number of keys in the pool.
+    :param bits: size of the keys.
+    """
+
+    def __init__(self, size=4, bits=2048, generate=generate_key_pair):
+        self.size = size
+        self.bits = bits
+        self.generate = generate
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self._queue = None
+        self._pid = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns a key pair of the pool or a new one if the pool is empty.
+        """
+        queue = self._start()
+        try:
+            key_pair = queue.get_nowait()
+        except Empty:
+            with self._lock:
+                self.misses += 1
+            LOGGER.debug('Key pool is empty, generate key inline.')
+            return self.generate(self.bits)
+        with self._lock:
+            self.hits += 1
+        return key_pair
+
+    def stats(self):
+        """
+        Returns a dict with the ``size`` of the pool, the number of ``available`` keys, keys taken
+        from the pool (``hits``), keys generated inline (``misses``) and in the background (``generated``).
+        """
+        with self._lock:
+            return {'size': self.size, 'available': self._queue.qsize() if self._queue is not None else 0,
+                    'hits': self.hits, 'misses': self.misses, 'generated': self.generated}
+
+    def close(self):
+        """
+        Stops the background thread.
+        """
+        self._stopped.set()
+
+    def _start(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return self._queue
+        with self._lock:
+            if self._pid != pid:
+                # threads don't survive a fork, the keys of the parent process are not shared
+                self._queue = Queue(maxsize=self.size)
+                self._pid = pid
+                thread = threading.Thread(target=self._fill, args=(self._queue, ), name='twitcher-keypool')
+                thread.daemon = True
+                thread.start()
+            return self._queue
+
+    def _fill(self, queue):
+        while not self._stopped.is_set() and self._pid == os.getpid():
+            try:
+                key_pair = self.generate(self.bits)
+            except Exception:
+                LOGGER.exception('Could not generate key.')
+                self._stopped.wait(1)
+                continue
+            with self._lock:
+                self.generated += 1
+            # wait until a key is taken from the full pool
+            while not self._stopped.is_set():
+                try:
+                    queue.put(key_pair, timeout=1)
+                    break
+                except Full:
+                    pass
@@ -13,8 +13,12 @@ from pyramid.settings import asbool
 from twitcher._compat import urlparse
 
 from twitcher.owsexceptions import OWSAccessForbidden, OWSAccessFailed
-from twitcher.utils import replace_caps_url
+from twitcher.utils import iter_replace_caps_url, replace_caps_url, seekable_body_file
 from twitcher.store import servicestore_factory
+from twitcher.sessions import session_registry_factory
+from twitcher.capscache import capscache_factory, cache_key
+from twitcher.tilecache import tilecache_factory, tile_key
+from twitcher.singleflight import singleflight_factory, request_key
 
 
 import logging
@@ -41,6 +45,9 @@ allowed_content_types = (
     "application/json;charset=ISO-8859-1",
 )
 
+# Headers meaningful only for a single transport-level connection
+hop_by_hop_headers = ('Connection', 'Keep-Alive', 'Public', 'Proxy-Authenticate', 'Transfer-Encoding', 'Upgrade')
+
 # TODO: configure allowed hosts
 allowed_hosts = (
     # list allowed hosts here (no port limiting)
@@ -56,6 +63,55 @@ class BufferedResponse():
     def __iter__(self):
         return self.resp.iter_content(64 * 1024)
 
+    def close(self):
+        # release the connection to the pool even if the client did not read the whole response
+        self.resp.close()
+
+
+class RewrittenResponse(BufferedResponse):
+    """
+    Replaces the service urls in a capabilities document with the proxy url while it is streamed.
+    """
+    def __init__(self, resp, url, prev_url=None):
+        BufferedResponse.__init__(self, resp)
+        self.url = url
+        self.prev_url = prev_url
+
+    def __iter__(self):
+        return iter_replace_caps_url(BufferedResponse.__iter__(self), self.url, self.prev_url)
+
+
+class RequestBody(object):
+    """
+    The body of the client request which is read in chunks while it is sent to the service.
+    The length makes ``requests`` send a Content-Length header instead of a chunked request.
+    """
+    def __init__(self, fileobj, length):
+        self.fileobj = fileobj
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        return self.fileobj.read(size)
+
+
+def request_body(request):
+    """
+    Returns the body of ``request`` as a file object which can be streamed to the service
+    or ``None`` if the request has no body.
+
+    A body with a Content-Length is read directly from ``wsgi.input``. A chunked body is
+    copied first, to a temporary file when it is larger than the setting
+    ``twitcher.request_body_tempfile_limit`` (default: 1 MB), so that its length is known.
+    """
+    if not request.is_body_readable:
+        return None
+    if request.is_body_seekable or request.content_length is None:
+        return seekable_body_file(request)
+    return RequestBody(request.body_file, request.content_length)
+
 
 def _send_request(request, service, extra_path=None, request_params=None):
 
@@ -71,23 +127,40 @@ def _send_request(request, service, extra_path=None, request_params=None):
     h = dict(request.headers)
     h.pop("Host", h)
     h['Accept-Encoding'] = None
-
-    #
+    # don't forward the connection handling of the client, the upstream connections are pooled
+    h.pop("Connection", None)
+    h.pop("Keep-Alive", None)
+    # the body is sent with a Content-Length
+    h.pop("Transfer-Encoding", None)
+    sessions = session_registry_factory(request.registry)
+
+    key = cache_key(request, service, extra_path)
+    if key is not None:
+        capscache = capscache_factory(request.registry)
+        if capscache is not None:
+            return _send_cached_request(request, service, url, h, sessions, capscache, key)
+
+    if service.get('tile_cache'):
+        tilecache = tilecache_factory(request.registry)
+        key = tile_key(request, service, extra_path) if tilecache is not None else None
+        if key is not None:
+            return _send_tile_request(request, url, h, sessions, tilecache, key)
+
+    body = request_body(request)
     service_type = service['type']
     if service_type and (service_type.lower() != 'wps'):
         try:
-            resp_iter = requests.request(method=request.method.upper(), url=url, data=request.body, headers=h,
+            resp_iter = sessions.request(method=request.method.upper(), url=url, data=body, headers=h,
                                          stream=True)
         except Exception as e:
             return OWSAccessFailed("Request failed: {}".format(e.message))
 
-        # Headers meaningful only for a single transport-level connection
-        HopbyHop = ['Connection', 'Keep-Alive', 'Public', 'Proxy-Authenticate', 'Transfer-Encoding', 'Upgrade']
         return Response(app_iter=BufferedResponse(resp_iter),
-                        headers={k: v for k, v in resp_iter.headers.iteritems() if k not in HopbyHop})
+                        headers={k: v for k, v in resp_iter.headers.iteritems() if k not in hop_by_hop_headers})
     else:
         try:
-            resp = requests.request(method=request.method.upper(), url=url, data=request.body, headers=h)
+            resp = sessions.request(method=request.method.upper(), url=url, data=body, headers=h,
+                                    stream=True)
         except Exception, e:
             return OWSAccessFailed("Request failed: {}".format(e.message))
 
@@ -103,6 +176,7 @@ def _send_request(request, service, extra_path=None, request_params=None):
         if "Content-Type" in resp.headers:
             ct = resp.headers["Content-Type"]
             if not ct.split(";")[0] in allowed_content_types:
+                resp.close()
                 msg = "Content type is not allowed: {}.".format(ct)
                 LOGGER.error(msg)
                 return OWSAccessForbidden(msg)
@@ -110,22 +184,121 @@ def _send_request(request, service, extra_path=None, request_params=None):
             # return OWSAccessFailed("Could not get content type from response.")
             LOGGER.warn("Could not get content type from response")
 
-        try:
-            if ct in ['text/xml', 'application/xml', 'text/xml;charset=ISO-8859-1']:
-                # replace urls in xml content
-                proxy_url = request.route_url('owsproxy', service_name=service['name'])
-                # TODO: where do i need to replace urls?
-                content = replace_caps_url(resp.content, proxy_url, service.get('url'))
-            else:
-                # raw content
-                content = resp.content
-        except Exception:
-            return OWSAccessFailed("Could not decode content.")
-
         headers = {}
         if ct:
             headers["Content-Type"] = ct
-        return Response(content, status=resp.status_code, headers=headers)
+        if ct in ['text/xml', 'application/xml', 'text/xml;charset=ISO-8859-1']:
+            # replace urls in xml content while it is streamed to the client
+            proxy_url = request.route_url('owsproxy', service_name=service['name'])
+            # TODO: where do i need to replace urls?
+            return Response(app_iter=RewrittenResponse(resp, proxy_url, service.get('url')),
+                            status=resp.status_code, headers=headers)
+        # stream raw content (like outputs of an execute request) without keeping it in memory
+        return Response(app_iter=BufferedResponse(resp), status=resp.status_code, headers=headers)
+
+
+def _fetch(request, sessions, url, headers):
+    """
+    Sends a GET request and reads the whole response. Identical concurrent requests
+    are coalesced (see :mod:`twitcher.singleflight`).
+    """
+    def fetch():
+        resp = sessions.request(method='GET', url=url, headers=headers)
+        # read the content before the response is shared
+        resp.content
+        return resp
+    singleflight = singleflight_factory(request.registry)
+    if singleflight is None:
+        return fetch()
+    return singleflight.do(request_key('GET', url, headers), fetch)
+
+
+def _buffered_response_headers(resp):
+    """
+    Returns the headers of a response which was read completely. The body is already decoded
+    and its length is set again.
+    """
+    return dict((k, v) for k, v in resp.headers.items()
+                if k not in hop_by_hop_headers and k.lower() not in ('content-length', 'content-encoding'))
+
+
+def _send_cached_request(request, service, url, headers, sessions, capscache, key):
+    """
+    Sends a GetCapabilities or DescribeProcess request using the response cache.
+    """
+    cached, fresh = capscache.get(key)
+    if fresh:
+        return cached.response()
+    # only use the conditional headers of the cached response
+    headers.pop('If-None-Match', None)
+    headers.pop('If-Modified-Since', None)
+    if cached is not None:
+        headers.update(cached.conditional_headers())
+    try:
+        resp = _fetch(request, sessions, url, headers)
+    except Exception as e:
+        return OWSAccessFailed("Request failed: {}".format(e.message))
+
+    if resp.status_code == 304 and cached is not None:
+        LOGGER.debug('cached response of %s is not modified.', service['name'])
+        capscache.revalidated(key, cached)
+        return cached.response()
+
+    service_type = service.get('type')
+    if service_type and service_type.lower() != 'wps':
+        # pass the response of other services on like a proxied response, with its headers and status
+        # the response to this request keeps the cookies, which are not cached
+        headers = _buffered_response_headers(resp)
+        capscache.set(key, resp, resp.content, headers=headers)
+        return Response(resp.content, status=resp.status_code, headers=headers)
+
+    if resp.ok is False:
+        if 'ExceptionReport' in resp.content:
+            return Response(resp.content, status=resp.status_code,
+                            headers={'Content-Type': resp.headers.get('Content-Type', 'text/xml')})
+        else:
+            return OWSAccessFailed("Response is not ok: {}".format(resp.reason))
+
+    # check for allowed content types
+    ct = resp.headers.get("Content-Type")
+    if ct and not ct.split(";")[0] in allowed_content_types:
+        msg = "Content type is not allowed: {}.".format(ct)
+        LOGGER.error(msg)
+        return OWSAccessForbidden(msg)
+
+    content = resp.content
+    if ct in ['text/xml', 'application/xml', 'text/xml;charset=ISO-8859-1']:
+        # replace urls in xml content
+        proxy_url = request.route_url('owsproxy', service_name=service['name'])
+        content = replace_caps_url(content, proxy_url, service.get('url'))
+    cached = capscache.set(key, resp, content)
+    if cached is not None:
+        return cached.response()
+    return Response(content, status=resp.status_code, headers={'Content-Type': ct} if ct else {})
+
+
+def _send_tile_request(request, url, headers, sessions, tilecache, key):
+    """
+    Sends a GetMap request using the tile cache.
+    """
+    key, image_format = key
+    response = tilecache.response(request, key, image_format)
+    if response is not None:
+        return response
+    try:
+        resp = _fetch(request, sessions, url, headers)
+    except Exception as e:
+        return OWSAccessFailed("Request failed: {}".format(e.message))
+
+    ct = resp.headers.get("Content-Type")
+    # don't cache service exceptions which are returned with status 200
+    if resp.status_code == 200 and ct and ct.split(";")[0].strip().lower() == image_format:
+        try:
+            tilecache.store(key, image_format, resp.content)
+        except (IOError, OSError):
+            LOGGER.exception('Could not store tile.')
+    # like other requests to a WMS, the response is passed on with its headers and status
+    return Response(resp.content, status=resp.status_code, headers=_buffered_response_headers(resp))
 
 
 def owsproxy_url(request):
@@ -145,15 +318,16 @@ def owsproxy(request):
     """
     TODO: use ows exceptions
     """
+    service_name = request.matchdict.get('service_name')
+    extra_path = request.matchdict.get('extra_path')
     try:
-        service_name = request.matchdict.get('service_name')
-        extra_path = request.matchdict.get('extra_path')
-        store = servicestore_factory(request.registry)
-        service = store.fetch_by_name(service_name)
+        # the service is usually looked up by the security tween already
+        service = request.ows_service
+        if service is None or service.name != service_name:
+            service = servicestore_factory(request.registry).fetch_by_name(service_name)
     except Exception as err:
         return OWSAccessFailed("Could not find service: {}.".format(err.message))
-    else:
-        return _send_request(request, service, extra_path, request_params=request.query_string)
+    return _send_request(request, service, extra_path, request_params=request.query_string)
 
 
 def owsproxy_delegate(request):
@@ -172,8 +346,10 @@ def owsproxy_delegate(request):
     # forward request to target (without Host Header)
     # h = dict(request.headers)
     # h.pop("Host", h)
-    resp = requests.request(method=request.method.upper(), url=url, data=request.body,
-                            headers=request.headers, verify=False)
+    h = dict(request.headers)
+    h.pop("Transfer-Encoding", None)
+    resp = requests.request(method=request.method.upper(), url=url, data=request_body(request),
+                            headers=h, verify=False)
     return Response(resp.content, status=resp.status_code, headers=resp.headers)
 
 
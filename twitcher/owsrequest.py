@@ -5,13 +5,16 @@ The OWSRequest is based on pywps code:
 * https://github.com/geopython/pywps/blob/master/pywps/app/WPSRequest.py
 """
 
+import io
+
 import lxml.etree
 
+from pyramid.decorator import reify
 from pyramid.httpexceptions import HTTPBadRequest
 from twitcher.owsexceptions import (OWSNoApplicableCode,
                                     OWSInvalidParameterValue,
                                     OWSMissingParameterValue)
-from twitcher.utils import lxml_strip_ns
+from twitcher.utils import seekable_body_file
 
 import logging
 logger = logging.getLogger(__name__)
@@ -91,16 +94,17 @@ class OWSParser(object):
 
 class Get(OWSParser):
 
-    def _request_params(self):
-        new_params = {}
-        for param in self.request.params:
-            # new_params[param.lower()] = self.request.params.getone(param)
-            new_params[param.lower()] = self.request.params[param]
-        return new_params
+    @reify
+    def request_params(self):
+        """
+        The parameters of the request with lowercase names. It is built once on the first lookup.
+        The last value of a parameter wins like in ``request.params[param]``.
+        """
+        return dict((param.lower(), value) for param, value in self.request.params.items())
 
     def _get_param(self, param, allowed_values=None, optional=False):
         """Get parameter in GET request."""
-        request_params = self._request_params()
+        request_params = self.request_params
         if param in request_params:
             value = request_params[param].lower()
             if allowed_values is not None:
@@ -126,27 +130,44 @@ class Get(OWSParser):
         """Find requested version in GET request."""
         version = self._get_param(param="version", allowed_values=allowed_versions[self.params['service']],
                                   optional=True)
-        if version is None and self._get_request_type() != "getcapabilities":
+        if version is None and self.params['request'] != "getcapabilities":
             raise OWSMissingParameterValue('Parameter "version" is missing', value="version")
         else:
             return version
 
 
 class Post(OWSParser):
+    """
+    Parses the root element of an XML request. The parser stops after the start tag
+    of the root element, so that the size of the document doesn't matter.
+    """
 
     def __init__(self, request):
         super(Post, self).__init__(request)
 
+        body = self._body_file()
         try:
-            self.document = lxml.etree.fromstring(self.request.body)
-            lxml_strip_ns(self.document)
+            for _, element in lxml.etree.iterparse(body, events=('start', )):
+                # the local name of the root element without its namespace
+                self.tag = lxml.etree.QName(element).localname
+                self.attrib = dict(element.attrib)
+                break
         except Exception as e:
             raise OWSNoApplicableCode(e.message)
+        finally:
+            # rewind the body for the request to the service
+            body.seek(0)
+
+    def _body_file(self):
+        if hasattr(self.request, 'body_file_seekable'):
+            return seekable_body_file(self.request)
+        # a request without a webob body file (like a testing.DummyRequest)
+        return io.BytesIO(self.request.body)
 
     def _get_service(self):
         """Check mandatory service name parameter in POST request."""
-        if "service" in self.document.attrib:
-            value = self.document.attrib["service"].lower()
+        if "service" in self.attrib:
+            value = self.attrib["service"].lower()
             if value in allowed_service_types:
                 self.params["service"] = value
             else:
@@ -157,7 +178,7 @@ class Post(OWSParser):
 
     def _get_request_type(self):
         """Find requested request type in POST request."""
-        value = self.document.tag.lower()
+        value = self.tag.lower()
         if value in allowed_request_types[self.params['service']]:
             self.params["request"] = value
         else:
@@ -166,8 +187,8 @@ class Post(OWSParser):
 
     def _get_version(self):
         """Find requested version in POST request."""
-        if "version" in self.document.attrib:
-            value = self.document.attrib["version"].lower()
+        if "version" in self.attrib:
+            value = self.attrib["version"].lower()
             if value in allowed_versions[self.params['service']]:
                 self.params["version"] = value
             else:
@@ -1,22 +1,41 @@
-import tempfile
+import threading
 
 from twitcher.exceptions import AccessTokenNotFound
 from twitcher.exceptions import ServiceNotFound
 from twitcher.owsexceptions import OWSAccessForbidden, OWSInvalidParameterValue
-from twitcher.utils import path_elements
+from twitcher.utils import path_elements, token_params
 from twitcher.store import tokenstore_factory
 from twitcher.store import servicestore_factory
+from twitcher.tokengenerator import tokengenerator_factory
+from twitcher.revocation import revocationlist_factory
 from twitcher.utils import parse_service_name
 from twitcher.owsrequest import OWSRequest
-from twitcher.esgf import fetch_certificate, ESGF_CREDENTIALS
+from twitcher.esgf import ESGF_CREDENTIALS
+from twitcher.credentials import CredentialsCache, credentials_factory
 from twitcher.datatype import Service
 
 import logging
 LOGGER = logging.getLogger("TWITCHER")
 
+_lock = threading.Lock()
+
 
 def owssecurity_factory(registry):
-    return OWSSecurity(tokenstore_factory(registry), servicestore_factory(registry))
+    """
+    Returns the :class:`OWSSecurity` which is shared by the security tween and the
+    request properties of this registry.
+    """
+    security = getattr(registry, 'owssecurity', None)
+    if security is None:
+        with _lock:
+            security = getattr(registry, 'owssecurity', None)
+            if security is None:
+                security = registry.owssecurity = OWSSecurity(
+                    tokenstore_factory(registry), servicestore_factory(registry),
+                    tokengenerator=tokengenerator_factory(registry),
+                    revocationlist=revocationlist_factory(registry),
+                    credentials=credentials_factory(registry))
+    return security
 
 
 def verify_cert(request):
@@ -26,16 +45,18 @@ def verify_cert(request):
 
 class OWSSecurity(object):
 
-    def __init__(self, tokenstore, servicestore):
+    def __init__(self, tokenstore, servicestore, tokengenerator=None, revocationlist=None, credentials=None):
         self.tokenstore = tokenstore
         self.servicestore = servicestore
+        self.tokengenerator = tokengenerator
+        self.revocationlist = revocationlist
+        self.credentials = credentials or CredentialsCache()
 
     def get_token_param(self, request):
         token = None
-        if 'token' in request.params:
-            token = request.params['token']   # in params
-        elif 'access_token' in request.params:
-            token = request.params['access_token']   # in params
+        param = next((name for name in token_params if name in request.params), None)
+        if param:
+            token = request.params[param]   # in params
         elif 'Access-Token' in request.headers:
             token = request.headers['Access-Token']  # in header
         else:  # in path
@@ -46,20 +67,48 @@ class OWSSecurity(object):
 
     def prepare_headers(self, request, access_token):
         if "esgf_access_token" in access_token.data or "esgf_credentials" in access_token.data:
-            workdir = tempfile.mkdtemp(prefix=request.prefix, dir=request.workdir)
-            if fetch_certificate(workdir=workdir, data=access_token.data):
+            # the credentials are reused until the certificate expires
+            workdir = self.credentials.workdir(access_token.data, workdir=request.workdir, prefix=request.prefix,
+                                               expires_at=access_token.expires_at or None)
+            if workdir is not None:
                 request.headers['X-Requested-Workdir'] = workdir
                 request.headers['X-X509-User-Proxy'] = workdir + '/' + ESGF_CREDENTIALS
                 LOGGER.debug("Prepared request headers.")
         return request
 
+    def get_service(self, request):
+        """
+        Returns the registered service of the request path or ``None``.
+        """
+        protected_path = request.registry.settings.get('twitcher.ows_proxy_protected_path ', '/ows')
+        try:
+            service_name = parse_service_name(request.path, protected_path)
+            return self.servicestore.fetch_by_name(service_name)
+        except ServiceNotFound:
+            return None
+
+    def get_access_token(self, request):
+        """
+        Returns the valid access token of the request or ``None``.
+        """
+        try:
+            return self._verify_access_token(request)
+        except OWSAccessForbidden:
+            return None
+
     def verify_access(self, request, service):
         # TODO: public service access handling is confusing.
         try:
             if service.auth == 'cert':
                 verify_cert(request)
             else:  # token
-                self._verify_access_token(request)
+                access_token = self._verify_access_token(request)
+                # share the validated token with the view
+                request.access_token = access_token
+                # update request with data from access token
+                # request.environ.update(access_token.data)
+                # TODO: is this realy the way we want to do this?
+                self.prepare_headers(request, access_token)
         except OWSAccessForbidden:
             if not service.public:
                 raise
@@ -68,30 +117,40 @@ class OWSSecurity(object):
         try:
             # try to get access_token ... if no access restrictions then don't complain.
             token = self.get_token_param(request)
-            access_token = self.tokenstore.fetch_by_token(token)
+            access_token = self._fetch_access_token(token)
             if access_token.is_expired():
                 raise OWSAccessForbidden("Access token is expired.")
-            # update request with data from access token
-            # request.environ.update(access_token.data)
-            # TODO: is this realy the way we want to do this?
-            request = self.prepare_headers(request, access_token)
+            if self.revocationlist is not None and self.revocationlist.is_revoked(access_token):
+                raise OWSAccessForbidden("Access token is revoked.")
+            return access_token
         except AccessTokenNotFound:
             raise OWSAccessForbidden("Access token is required to access this service.")
 
+    def _fetch_access_token(self, token):
+        # self-contained tokens are verified without a token store lookup
+        access_token = None
+        if self.tokengenerator is not None:
+            access_token = self.tokengenerator.verify(token)
+        if access_token is None:
+            access_token = self.tokenstore.fetch_by_token(token)
+        return access_token
+
     def check_request(self, request):
+        """
+        Verifies the access to a protected service. The parsed OWS request, the registered
+        service and the valid access token are kept as the request properties ``ows_request``,
+        ``ows_service`` and ``access_token`` (see :mod:`twitcher.config`) for the views.
+        """
         protected_path = request.registry.settings.get('twitcher.ows_proxy_protected_path ', '/ows')
         if request.path.startswith(protected_path):
-            # TODO: refactor this code
-            try:
-                service_name = parse_service_name(request.path, protected_path)
-                service = self.servicestore.fetch_by_name(service_name)
-                if service.public is True:
-                    LOGGER.warn('public access for service %s', service_name)
-            except ServiceNotFound:
+            service = request.ows_service = self.get_service(request)
+            if service is None:
                 # TODO: why not raising an exception?
                 service = Service(url='unregistered', public=False, auth='token')
                 LOGGER.warn("Service not registered.")
-            ows_request = OWSRequest(request)
+            elif service.public is True:
+                LOGGER.warn('public access for service %s', service.name)
+            ows_request = request.ows_request = OWSRequest(request)
             if not ows_request.service_allowed():
                 raise OWSInvalidParameterValue(
                     "service %s not supported" % ows_request.service, value="service")
@@ -0,0 +1,147 @@
+"""
+In-process list of revoked access tokens.
+
+Self-contained tokens (see :class:`twitcher.tokengenerator.HmacTokenGenerator`) are verified
+without a token store lookup and tokens may be cached by each worker, so a revocation has to be
+checked separately. The :class:`RevocationList` keeps the revocations recorded in a
+:class:`twitcher.store.RevokedTokenStore` in memory and refreshes them periodically.
+"""
+
+import time
+import threading
+
+from twitcher.store import revokedtokenstore_factory
+from twitcher.stats import add_stats_provider
+
+import logging
+LOGGER = logging.getLogger("TWITCHER")
+
+# token used to record that all tokens issued before the revocation are revoked
+REVOKE_ALL = '*'
+
+_lock = threading.Lock()
+
+
+def revocationlist_factory(registry):
+    """
+    Returns the revocation list which is shared by all users of this registry.
+    The refresh interval can be configured with ``twitcher.revocation_refresh_interval``.
+    """
+    revocationlist = getattr(registry, 'revocationlist', None)
+    if revocationlist is None:
+        with _lock:
+            revocationlist = getattr(registry, 'revocationlist', None)
+            if revocationlist is None:
+                settings = registry.settings or {}
+                revocationlist = registry.revocationlist = RevocationList(
+                    revokedtokenstore_factory(registry),
+                    refresh_interval=float(settings.get('twitcher.revocation_refresh_interval', 1)))
+                add_stats_provider(registry, 'revocationlist', revocationlist.stats)
+    return revocationlist
+
+
+class RevocationList(object):
+    """
+    Revoked access tokens of a :class:`twitcher.store.RevokedTokenStore` kept in memory.
+
+    Revoked tokens are kept in a dict which maps them to their expiration time, so that a
+    token is checked with a single lookup. Revocations of expired tokens are dropped, so the
+    list does not grow without limit.
+
+    The list is refreshed incrementally: only revocations recorded since the last refresh
+    (minus ``margin`` seconds to tolerate clock differences between hosts) are fetched.
+
+    :param refresh_interval: minimum number of seconds between two refreshes from the store.
+    :param prune_interval: minimum number of seconds between two removals of expired revocations.
+    """
+
+    def __init__(self, store, refresh_interval=1, prune_interval=300, margin=60, timer=time.time):
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.prune_interval = prune_interval
+        self.margin = margin
+        self.timer = timer
+        self.tokens = {}
+        self.revoked_before = 0
+        self.last_refresh = None
+        self.last_revoked_at = None
+        self.next_prune = None
+        self._lock = threading.RLock()
+
+    def revoke(self, token, expires_at=None):
+        """
+        Revokes a single token.
+        """
+        revoked_at = self.timer()
+        self.store.save_revocation(token, expires_at=expires_at, revoked_at=revoked_at)
+        with self._lock:
+            self._add({'token': token, 'expires_at': expires_at, 'revoked_at': revoked_at})
+
+    def revoke_all(self):
+        """
+        Revokes all tokens issued until now.
+        """
+        revoked_at = self.timer()
+        self.store.save_revocation(REVOKE_ALL, revoked_at=revoked_at)
+        with self._lock:
+            self._add({'token': REVOKE_ALL, 'expires_at': None, 'revoked_at': revoked_at})
+
+    def is_revoked(self, access_token):
+        """
+        Returns ``True`` if the given :class:`twitcher.datatype.AccessToken` has been revoked.
+        """
+        self.refresh()
+        if access_token.issued_at < self.revoked_before:
+            return True
+        return access_token.token in self.tokens
+
+    def refresh(self):
+        """
+        Fetches new revocations from the store at most every ``refresh_interval`` seconds.
+        """
+        now = self.timer()
+        with self._lock:
+            if self.last_refresh is not None and now - self.last_refresh < self.refresh_interval:
+                return
+            self.last_refresh = now
+            since = None
+            if self.last_revoked_at is not None:
+                since = self.last_revoked_at - self.margin
+        try:
+            revocations = self.store.fetch_revocations(since=since)
+        except Exception:
+            LOGGER.exception('Could not refresh revoked tokens.')
+            return
+        with self._lock:
+            for revocation in revocations:
+                self._add(revocation)
+            if self.next_prune is not None and self.next_prune <= now:
+                self._prune(now)
+
+    def stats(self):
+        """
+        Returns a dict with the number of revoked tokens.
+        """
+        return {'tokens': len(self.tokens)}
+
+    def _add(self, revocation):
+        token = revocation['token']
+        expires_at = revocation.get('expires_at')
+        revoked_at = revocation['revoked_at']
+        self.last_revoked_at = max(self.last_revoked_at or 0, revoked_at)
+        if token == REVOKE_ALL:
+            self.revoked_before = max(self.revoked_before, revoked_at)
+        elif token not in self.tokens:
+            if expires_at and expires_at <= self.timer():
+                return
+            self.tokens[token] = expires_at
+            if expires_at and self.next_prune is None:
+                self.next_prune = max(expires_at, self.timer() + self.prune_interval)
+
+    def _prune(self, now):
+        self.tokens = dict((token, expires_at) for token, expires_at in self.tokens.items()
+                           if not expires_at or expires_at > now)
+        expiration_times = [expires_at for expires_at in self.tokens.values() if expires_at]
+        self.next_prune = None
+        if expiration_times:
+            self.next_prune = max(min(expiration_times), now + self.prune_interval)
@@ -7,6 +7,10 @@ from twitcher.api import IRegistry, Registry
 from twitcher.tokengenerator import tokengenerator_factory
 from twitcher.store import tokenstore_factory
 from twitcher.store import servicestore_factory
+from twitcher.revocation import revocationlist_factory
+from twitcher.credentials import credentials_factory
+from twitcher.stats import collect_stats
+from twitcher.db import mongodb, ensure_indexes
 
 import logging
 LOGGER = logging.getLogger("TWITCHER")
@@ -18,7 +22,11 @@ class RPCInterface(ITokenManager, IRegistry):
         self.request = request
         self.tokenmgr = TokenManager(
             tokengenerator_factory(request.registry),
-            tokenstore_factory(request.registry))
+            tokenstore_factory(request.registry),
+            revocationlist_factory(request.registry),
+            credentials=credentials_factory(request.registry),
+            workdir=request.workdir,
+            prefix=request.prefix)
         self.srvreg = Registry(servicestore_factory(request.registry))
 
     def generate_token(self, valid_in_hours=1, environ=None):
@@ -45,12 +53,24 @@ class RPCInterface(ITokenManager, IRegistry):
         """
         return self.srvreg.register_service(url, data, overwrite)
 
+    def register_services(self, services, overwrite=True):
+        """
+        Implementation of :meth:`twitcher.api.IRegistry.register_services`.
+        """
+        return self.srvreg.register_services(services, overwrite)
+
     def unregister_service(self, name):
         """
         Implementation of :meth:`twitcher.api.IRegistry.unregister_service`.
         """
         return self.srvreg.unregister_service(name)
 
+    def unregister_services(self, names):
+        """
+        Implementation of :meth:`twitcher.api.IRegistry.unregister_services`.
+        """
+        return self.srvreg.unregister_services(names)
+
     def get_service_by_name(self, name):
         """
         Implementation of :meth:`twitcher.api.IRegistry.get_service_by_name`.
@@ -75,6 +95,21 @@ class RPCInterface(ITokenManager, IRegistry):
         """
         return self.srvreg.clear_services()
 
+    def get_stats(self):
+        """
+        Returns runtime statistics (like cache hits and misses) of the worker process handling this call.
+        """
+        return collect_stats(self.request.registry)
+
+    def migrate(self):
+        """
+        Creates the indexes of the mongodb collections and updates the tokens of older versions.
+        It is needed when the indexes could not be created on startup or when ``mongodb.ensure_indexes``
+        is disabled.
+        """
+        ensure_indexes(mongodb(self.request.registry))
+        return True
+
 
 def includeme(config):
     """ The callable makes it possible to include rpcinterface
@@ -109,8 +144,13 @@ def includeme(config):
         config.add_xmlrpc_method(RPCInterface, attr='revoke_token', endpoint='api', method='revoke_token')
         config.add_xmlrpc_method(RPCInterface, attr='revoke_all_tokens', endpoint='api', method='revoke_all_tokens')
         config.add_xmlrpc_method(RPCInterface, attr='register_service', endpoint='api', method='register_service')
+        config.add_xmlrpc_method(RPCInterface, attr='register_services', endpoint='api', method='register_services')
         config.add_xmlrpc_method(RPCInterface, attr='unregister_service', endpoint='api', method='unregister_service')
+        config.add_xmlrpc_method(RPCInterface, attr='unregister_services', endpoint='api',
+                                 method='unregister_services')
         config.add_xmlrpc_method(RPCInterface, attr='get_service_by_name', endpoint='api', method='get_service_by_name')
         config.add_xmlrpc_method(RPCInterface, attr='get_service_by_url', endpoint='api', method='get_service_by_url')
         config.add_xmlrpc_method(RPCInterface, attr='clear_services', endpoint='api', method='clear_services')
         config.add_xmlrpc_method(RPCInterface, attr='list_services', endpoint='api', method='list_services')
+        config.add_xmlrpc_method(RPCInterface, attr='get_stats', endpoint='api', method='get_stats')
+        config.add_xmlrpc_method(RPCInterface, attr='migrate', endpoint='api', method='migrate')
@@ -0,0 +1,155 @@
+"""
+Pooled HTTP sessions used to send requests to the upstream OWS services.
+
+Each worker process keeps one ``requests.Session`` per upstream scheme and host, so that
+consecutive requests to the same service reuse a kept-alive connection instead of paying
+a TCP (and TLS) handshake each time.
+
+A session is shared by the requests of all users, so it doesn't store cookies. Cookies set by
+a service are only passed on to the client of the response.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+from pyramid.settings import asbool
+
+from twitcher._compat import urlparse
+from twitcher._compat import DefaultCookiePolicy
+from twitcher.stats import add_stats_provider
+
+import logging
+LOGGER = logging.getLogger("TWITCHER")
+
+_lock = threading.Lock()
+
+
+def session_registry_factory(registry):
+    """
+    Returns the session registry of the current process. It is created again when the process id
+    changes, so that forked workers don't share connections.
+
+    The pools can be configured with the settings ``twitcher.http_pool_maxsize`` (connections kept
+    per host), ``twitcher.http_pool_block``, ``twitcher.http_keep_alive`` and
+    ``twitcher.http_max_hosts`` (number of hosts with a session).
+    """
+    pid = os.getpid()
+    sessions = getattr(registry, 'session_registry', None)
+    if sessions is not None and registry.session_registry_pid == pid:
+        return sessions
+    with _lock:
+        sessions = getattr(registry, 'session_registry', None)
+        if sessions is None or registry.session_registry_pid != pid:
+            settings = registry.settings or {}
+            sessions = registry.session_registry = SessionRegistry(
+                pool_maxsize=int(settings.get('twitcher.http_pool_maxsize', 10)),
+                pool_block=asbool(settings.get('twitcher.http_pool_block', False)),
+                keep_alive=asbool(settings.get('twitcher.http_keep_alive', True)),
+                max_hosts=int(settings.get('twitcher.http_max_hosts', 100)))
+            registry.session_registry_pid = pid
+            add_stats_provider(registry, 'http_sessions', sessions.stats)
+    return sessions
+
+
+class SessionRegistry(object):
+    """
+    Keeps a ``requests.Session`` for each upstream scheme and host.
+
+    :param pool_maxsize: maximum number of connections kept open per host.
+    :param pool_block: wait for a free connection when all connections of a host are in use
+                       instead of opening (and discarding) an additional one.
+    :param keep_alive: keep connections open after a request.
+    :param max_hosts: maximum number of sessions. The least recently used session is closed
+                      when a session for another host is needed.
+    """
+
+    def __init__(self, pool_maxsize=10, pool_block=False, keep_alive=True, max_hosts=100):
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.max_hosts = max_hosts
+        self.requests = 0
+        # counts of the connection pools of closed sessions
+        self.closed_requests = 0
+        self.closed_connections = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def session(self, url):
+        """
+        Returns the session used for requests to ``url``.
+        """
+        parsed = urlparse(url)
+        key = (parsed.scheme.lower(), parsed.netloc.lower())
+        with self._lock:
+            self.requests += 1
+            session = self._sessions.pop(key, None)
+            if session is None:
+                while len(self._sessions) >= self.max_hosts:
+                    _, expired = self._sessions.popitem(last=False)
+                    self._close(expired)
+                session = self._create_session()
+            # mark as most recently used
+            self._sessions[key] = session
+        return session
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends a request like ``requests.request`` using the pooled session of the host.
+        """
+        return self.session(url).request(method=method, url=url, **kwargs)
+
+    def stats(self):
+        """
+        Returns a dict with the number of ``hosts``, ``requests`` and pooled ``connections``.
+        ``reused`` is the number of requests which were sent on an already pooled connection.
+        """
+        with self._lock:
+            sent = self.closed_requests
+            connections = self.closed_connections
+            for session in self._sessions.values():
+                for pool in _connection_pools(session):
+                    sent += pool.num_requests
+                    connections += pool.num_connections
+            return {'hosts': len(self._sessions), 'requests': self.requests,
+                    'connections': connections, 'reused': max(sent - connections, 0)}
+
+    def close(self):
+        """
+        Closes all sessions and their connections.
+        """
+        with self._lock:
+            while self._sessions:
+                _, session = self._sessions.popitem()
+                self._close(session)
+
+    def _create_session(self):
+        session = requests.Session()
+        # don't send the cookies of one user with the requests of another user
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, pool_block=self.pool_block)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def _close(self, session):
+        for pool in _connection_pools(session):
+            self.closed_requests += pool.num_requests
+            self.closed_connections += pool.num_connections
+        session.close()
+
+
+def _connection_pools(session):
+    pools = []
+    for adapter in session.adapters.values():
+        container = adapter.poolmanager.pools
+        for key in container.keys():
+            pool = container.get(key)
+            if pool is not None and pool not in pools:
+                pools.append(pool)
+    return pools
@@ -0,0 +1,102 @@
+"""
+Coalescing of identical concurrent requests to the upstream OWS services.
+
+When many clients request the same document at once (like the GetCapabilities of a
+service or the same map tile), only the first request is sent to the service. The
+other requests of the worker process wait for its response and share it.
+"""
+
+import threading
+
+from pyramid.settings import asbool
+
+from twitcher.stats import add_stats_provider
+
+import logging
+LOGGER = logging.getLogger("TWITCHER")
+
+# request headers which may change the response
+relevant_headers = ('Accept', 'Accept-Language', 'Authorization', 'Cookie', 'If-None-Match', 'If-Modified-Since')
+
+_lock = threading.Lock()
+
+
+def singleflight_factory(registry):
+    """
+    Returns the :class:`SingleFlight` of this registry or ``None`` when the setting
+    ``twitcher.coalesce_requests`` is false.
+    """
+    settings = registry.settings or {}
+    if not asbool(settings.get('twitcher.coalesce_requests', True)):
+        return None
+    singleflight = getattr(registry, 'singleflight', None)
+    if singleflight is None:
+        with _lock:
+            singleflight = getattr(registry, 'singleflight', None)
+            if singleflight is None:
+                singleflight = registry.singleflight = SingleFlight()
+                add_stats_provider(registry, 'coalesced_requests', singleflight.stats)
+    return singleflight
+
+
+def request_key(method, url, headers):
+    """
+    Returns the key of a request built from the method, url and the relevant headers.
+    """
+    lowered = dict((name.lower(), value) for name, value in headers.items() if value is not None)
+    return (method.upper(), url) + tuple(lowered.get(name.lower()) for name in relevant_headers)
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Runs only one call for each key at the same time. Callers with the same key
+    wait for the running call and get its result (or exception).
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Returns the result of ``fn()`` or of the call with the same ``key`` which is running.
+        """
+        with self._lock:
+            call = self._running.get(key)
+            leader = call is None
+            if leader:
+                call = self._running[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._running[key]
+            call.event.set()
+        return call.result
+
+    def stats(self):
+        """
+        Returns a dict with the number of ``calls`` and the number of callers which ``shared`` a call.
+        """
+        with self._lock:
+            return {'calls': self.calls, 'shared': self.shared, 'running': len(self._running)}
@@ -0,0 +1,30 @@
+"""
+Runtime statistics of a twitcher worker process, like cache hits and misses.
+"""
+
+from twitcher._compat import integer_types
+from twitcher._compat import xmlrpclib
+
+
+def add_stats_provider(registry, name, provider):
+    """
+    Registers a callable ``provider`` which returns a dict with statistics for ``name``.
+    """
+    providers = getattr(registry, 'stats_providers', None)
+    if providers is None:
+        providers = registry.stats_providers = {}
+    providers[name] = provider
+
+
+def collect_stats(registry):
+    """
+    Returns the statistics of all registered providers.
+    """
+    providers = getattr(registry, 'stats_providers', None) or {}
+    return dict((name, _marshallable(provider())) for name, provider in providers.items())
+
+
+def _marshallable(stats):
+    # XML-RPC can't marshal integers larger than 2**31 - 1
+    return dict((key, float(value) if isinstance(value, integer_types) and abs(value) > xmlrpclib.MAXINT else value)
+                for key, value in stats.items())
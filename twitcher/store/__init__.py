@@ -4,17 +4,22 @@ Factories to create storage backends.
 
 # Interfaces
 from twitcher.store.base import AccessTokenStore
+from twitcher.store.base import RevokedTokenStore
+from twitcher.store.base import ServiceStore
 
 # Factories
 from twitcher.db import mongodb as _mongodb
 from twitcher.store.mongodb import MongodbTokenStore
 from twitcher.store.memory import MemoryTokenStore
+from twitcher.store.cached import CachedTokenStore
+from twitcher.cache import get_cache
 
 
 def tokenstore_factory(registry, database=None):
     """
     Creates a token store with the interface of :class:`twitcher.store.AccessTokenStore`.
-    By default the mongodb implementation will be used.
+    By default the mongodb implementation will be used. Fetched tokens are cached in-process
+    (see settings ``twitcher.token_cache_ttl`` and ``twitcher.token_cache_negative_ttl``).
 
     :param database: A string with the store implementation name: "mongodb" or "memory".
     :return: An instance of :class:`twitcher.store.AccessTokenStore`.
@@ -23,19 +28,48 @@ def tokenstore_factory(registry, database=None):
     if database == 'mongodb':
         db = _mongodb(registry)
         store = MongodbTokenStore(db.tokens)
+        cache = get_cache(registry, 'token_cache')
+        if cache is not None:
+            negative_ttl = int((registry.settings or {}).get('twitcher.token_cache_negative_ttl', 5))
+            store = CachedTokenStore(store, cache, negative_ttl=negative_ttl,
+                                     channel=registry.invalidation_channel)
     else:
         store = MemoryTokenStore()
     return store
 
 
+from twitcher.store.mongodb import MongodbRevokedTokenStore
+from twitcher.store.memory import MemoryRevokedTokenStore
+
+
+def revokedtokenstore_factory(registry, database=None):
+    """
+    Creates a store for revoked tokens with the interface of :class:`twitcher.store.RevokedTokenStore`.
+    By default the mongodb implementation will be used.
+
+    :return: An instance of :class:`twitcher.store.RevokedTokenStore`.
+    """
+    database = database or 'mongodb'
+    if database == 'mongodb':
+        db = _mongodb(registry)
+        store = MongodbRevokedTokenStore(db.revoked_tokens)
+    else:
+        store = MemoryRevokedTokenStore()
+    return store
+
+
 from twitcher.store.mongodb import MongodbServiceStore
 from twitcher.store.memory import MemoryServiceStore
+from twitcher.store.cached import CachedServiceStore
+from twitcher.store.cached import InvalidatingServiceStore
 
 
 def servicestore_factory(registry, database=None):
     """
     Creates a service store with the interface of :class:`twitcher.store.ServiceStore`.
-    By default the mongodb implementation will be used.
+    By default the mongodb implementation will be used. Fetched services are cached in-process
+    (see setting ``twitcher.service_cache_ttl``). Changes are published to the invalidation
+    channel in any case, they also clear the capabilities cache.
 
     :return: An instance of :class:`twitcher.store.ServiceStore`.
     """
@@ -43,6 +77,11 @@ def servicestore_factory(registry, database=None):
     if database == 'mongodb':
         db = _mongodb(registry)
         store = MongodbServiceStore(collection=db.services)
+        cache = get_cache(registry, 'service_cache')
+        if cache is not None:
+            store = CachedServiceStore(store, cache, channel=registry.invalidation_channel)
+        elif registry.invalidation_channel is not None:
+            store = InvalidatingServiceStore(store, channel=registry.invalidation_channel)
     else:
         store = MemoryServiceStore()
     return store
@@ -44,6 +44,38 @@ class AccessTokenStore(object):
         raise NotImplementedError
 
 
+class RevokedTokenStore(object):
+    """
+    Storage for revoked access tokens.
+    """
+
+    def save_revocation(self, token, expires_at=None, revoked_at=None):
+        """
+        Records that an access token has been revoked.
+
+        :param token: A string containing the token or ``'*'`` to revoke all tokens
+                      issued before ``revoked_at``.
+        :param expires_at: Expiration time of the token. The record is not needed afterwards.
+        :param revoked_at: Time of the revocation in seconds since the Epoch (default: now).
+        """
+        raise NotImplementedError
+
+    def fetch_revocations(self, since=None):
+        """
+        Fetches the revocations recorded at or after ``since``.
+
+        :param since: Time in seconds since the Epoch or ``None`` for all revocations.
+        :return: A list of dicts with the keys ``token``, ``expires_at`` and ``revoked_at``.
+        """
+        raise NotImplementedError
+
+    def clear_revocations(self):
+        """
+        Removes all revocations from database.
+        """
+        raise NotImplementedError
+
+
 class ServiceStore(object):
     """
     Storage for OWS services.
@@ -57,12 +89,44 @@ class ServiceStore(object):
         """
         raise NotImplementedError
 
+    def save_services(self, services, overwrite=True):
+        """
+        Stores several OWS services in storage.
+
+        :param services: A list of :class:`twitcher.datatype.Service` instances.
+        :return: A list with the saved :class:`twitcher.datatype.Service` or
+                 the exception raised for each service.
+        """
+        results = []
+        for service in services:
+            try:
+                results.append(self.save_service(service, overwrite=overwrite))
+            except Exception as e:
+                results.append(e)
+        return results
+
     def delete_service(self, name):
         """
         Removes service from database.
         """
         raise NotImplementedError
 
+    def delete_services(self, names):
+        """
+        Removes several services from database.
+
+        :return: A list with a flag for each name which is ``True`` if the service was removed.
+        """
+        results = []
+        for name in names:
+            try:
+                self.fetch_by_name(name)
+            except Exception:
+                results.append(False)
+            else:
+                results.append(self.delete_service(name) is not False)
+        return results
+
     def list_services(self):
         """
         Lists all services in database.
@@ -0,0 +1,167 @@
+"""
+Store adapters which wrap another store and keep recently fetched items in
+an in-process :class:`twitcher.cache.TTLCache`.
+
+When an :class:`twitcher.invalidation.InvalidationChannel` is given, changes are
+published to the caches of the other worker processes.
+"""
+
+from twitcher.store.base import AccessTokenStore
+from twitcher.store.base import ServiceStore
+from twitcher.datatype import AccessToken
+from twitcher.datatype import Service
+from twitcher.exceptions import AccessTokenNotFound
+from twitcher.utils import baseurl
+
+import logging
+LOGGER = logging.getLogger(__name__)
+
+
+# marker for tokens which are not in the store
+_NOT_FOUND = object()
+
+
+def _publish(channel):
+    if channel is not None:
+        channel.publish()
+
+
+def _poll(channel):
+    if channel is not None:
+        channel.poll()
+
+
+class CachedTokenStore(AccessTokenStore):
+    """
+    Read-through cache for a :class:`twitcher.store.AccessTokenStore`.
+
+    A token is cached at most until it expires. Unknown tokens are cached for ``negative_ttl``
+    seconds, so that repeated requests with an invalid token do not reach the store.
+    """
+
+    def __init__(self, store, cache, negative_ttl=5, channel=None):
+        self.store = store
+        self.cache = cache
+        self.negative_ttl = negative_ttl
+        self.channel = channel
+
+    def save_token(self, access_token):
+        try:
+            return self.store.save_token(access_token)
+        finally:
+            # new tokens are unknown to other workers, only the local negative cache needs an update
+            self.cache.pop(access_token.token)
+
+    def delete_token(self, token):
+        try:
+            return self.store.delete_token(token)
+        finally:
+            self.cache.pop(token)
+            _publish(self.channel)
+
+    def fetch_by_token(self, token):
+        _poll(self.channel)
+        access_token = self.cache.get(token)
+        if access_token is _NOT_FOUND:
+            raise AccessTokenNotFound
+        if access_token is None:
+            try:
+                access_token = self.store.fetch_by_token(token)
+            except AccessTokenNotFound:
+                self.cache.set(token, _NOT_FOUND, ttl=self.negative_ttl)
+                raise
+            self.cache.set(token, access_token, ttl=min(self.cache.ttl, access_token.expires_in))
+        # return a copy so that callers can not modify the cached token
+        return AccessToken(access_token)
+
+    def clear_tokens(self):
+        try:
+            return self.store.clear_tokens()
+        finally:
+            self.cache.clear()
+            _publish(self.channel)
+
+
+class InvalidatingServiceStore(ServiceStore):
+    """
+    Publishes the changes of a :class:`twitcher.store.ServiceStore` to the invalidation channel,
+    so that the caches which depend on the services (like the capabilities cache) are cleared.
+    """
+
+    def __init__(self, store, channel=None):
+        self.store = store
+        self.channel = channel
+
+    def save_service(self, service, overwrite=True):
+        try:
+            return self.store.save_service(service, overwrite=overwrite)
+        finally:
+            self._invalidate()
+
+    def save_services(self, services, overwrite=True):
+        try:
+            return self.store.save_services(services, overwrite=overwrite)
+        finally:
+            self._invalidate()
+
+    def delete_service(self, name):
+        try:
+            return self.store.delete_service(name)
+        finally:
+            self._invalidate()
+
+    def delete_services(self, names):
+        try:
+            return self.store.delete_services(names)
+        finally:
+            self._invalidate()
+
+    def list_services(self):
+        return self.store.list_services()
+
+    def fetch_by_name(self, name):
+        return self.store.fetch_by_name(name)
+
+    def fetch_by_url(self, url):
+        return self.store.fetch_by_url(url)
+
+    def clear_services(self):
+        try:
+            return self.store.clear_services()
+        finally:
+            self._invalidate()
+
+    def _invalidate(self):
+        _publish(self.channel)
+
+
+class CachedServiceStore(InvalidatingServiceStore):
+    """
+    Read-through cache for a :class:`twitcher.store.ServiceStore`.
+
+    Services are cached by name and url. All cached services are invalidated when a
+    service is saved or deleted, because a registration may replace other services.
+    """
+
+    def __init__(self, store, cache, channel=None):
+        InvalidatingServiceStore.__init__(self, store, channel=channel)
+        self.cache = cache
+
+    def fetch_by_name(self, name):
+        return self._fetch(('name', name), self.store.fetch_by_name, name)
+
+    def fetch_by_url(self, url):
+        return self._fetch(('url', baseurl(url)), self.store.fetch_by_url, url)
+
+    def _invalidate(self):
+        self.cache.clear()
+        _publish(self.channel)
+
+    def _fetch(self, key, fetch, value):
+        _poll(self.channel)
+        service = self.cache.get(key)
+        if service is None:
+            service = fetch(value)
+            self.cache.set(key, service)
+        # return a copy so that callers can not modify the cached service
+        return Service(service)
@@ -37,6 +37,32 @@ class MemoryTokenStore(AccessTokenStore):
         self.access_tokens = {}
 
 
+import time
+
+from twitcher.store.base import RevokedTokenStore
+
+
+class MemoryRevokedTokenStore(RevokedTokenStore):
+    """
+    Stores revoked tokens in memory. Useful for testing purposes.
+    """
+    def __init__(self):
+        self.revocations = {}
+
+    def save_revocation(self, token, expires_at=None, revoked_at=None):
+        self.revocations[token] = {
+            'token': token,
+            'expires_at': expires_at,
+            'revoked_at': revoked_at or time.time()}
+
+    def fetch_revocations(self, since=None):
+        return [dict(revocation) for revocation in self.revocations.values()
+                if since is None or revocation['revoked_at'] >= since]
+
+    def clear_revocations(self):
+        self.revocations = {}
+
+
 from twitcher.store.base import ServiceStore
 from twitcher.datatype import Service
 from twitcher.exceptions import ServiceRegistrationError
@@ -95,7 +121,8 @@ class MemoryServiceStore(ServiceStore):
             name=name,
             type=service.type,
             public=service.public,
-            auth=service.auth))
+            auth=service.auth,
+            tile_cache=service.tile_cache))
         return self.fetch_by_url(url=service_url)
 
     def delete_service(self, name):
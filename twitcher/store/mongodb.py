@@ -1,6 +1,9 @@
 """
 Store adapters to read/write data to from/to mongodb using pymongo.
 """
+import time
+from datetime import datetime
+
 import pymongo
 
 from twitcher.store.base import AccessTokenStore
@@ -21,8 +24,17 @@ class MongodbStore(object):
 
 
 class MongodbTokenStore(AccessTokenStore, MongodbStore):
+    """
+    Stores access tokens in mongodb.
+
+    Each token document has an additional ``expires`` date which is used by a TTL index
+    to remove expired tokens (see :func:`twitcher.db.ensure_indexes`).
+    """
+
     def save_token(self, access_token):
-        self.collection.insert_one(access_token)
+        document = dict(access_token)
+        document['expires'] = datetime.utcfromtimestamp(access_token.expires_at)
+        self.collection.insert_one(document)
 
     def delete_token(self, token):
         self.collection.delete_one({'token': token})
@@ -34,7 +46,37 @@ class MongodbTokenStore(AccessTokenStore, MongodbStore):
         return AccessToken(token)
 
     def clear_tokens(self):
-        self.collection.drop()
+        # keep the indexes of the collection
+        self.collection.delete_many({})
+
+
+from twitcher.store.base import RevokedTokenStore
+
+
+class MongodbRevokedTokenStore(RevokedTokenStore, MongodbStore):
+    """
+    Stores revoked tokens in mongodb. Records are removed by a TTL index on ``expires``
+    when the revoked token has expired.
+    """
+
+    def save_revocation(self, token, expires_at=None, revoked_at=None):
+        document = {
+            'token': token,
+            'expires_at': expires_at,
+            'revoked_at': revoked_at or time.time()}
+        if expires_at is not None:
+            document['expires'] = datetime.utcfromtimestamp(expires_at)
+        self.collection.replace_one({'token': token}, document, upsert=True)
+
+    def fetch_revocations(self, since=None):
+        query = {}
+        if since is not None:
+            query['revoked_at'] = {'$gte': since}
+        projection = {'_id': False, 'token': True, 'expires_at': True, 'revoked_at': True}
+        return list(self.collection.find(query, projection))
+
+    def clear_revocations(self):
+        self.collection.delete_many({})
 
 
 from twitcher.store.base import ServiceStore
@@ -53,33 +95,139 @@ class MongodbServiceStore(ServiceStore, MongodbStore):
     def save_service(self, service, overwrite=True):
         """
         Stores an OWS service in mongodb.
+
+        The service is saved with a single atomic operation which relies on the unique
+        ``name`` and ``url`` indexes (see :func:`twitcher.db.ensure_indexes`). With ``overwrite``
+        a service with the same url is replaced and a service with the same name is removed.
         """
+        self._check_unique_indexes()
+        document, random_name = self._service_document(service)
+        service_url, name = document.url, document.name
+        for retry in range(3):
+            document['name'] = name
+            try:
+                if overwrite:
+                    saved = self.collection.find_one_and_replace(
+                        {'url': service_url}, document,
+                        upsert=True, return_document=pymongo.ReturnDocument.AFTER)
+                else:
+                    self.collection.insert_one(document)
+                    saved = document
+            except pymongo.errors.DuplicateKeyError as e:
+                if self._duplicate_key(e, service_url) == 'url':
+                    if not overwrite:
+                        raise ServiceRegistrationError("service url already registered.")
+                    # concurrent upsert of the same url, try again
+                elif random_name:
+                    name = namesgenerator.get_random_name(retry=True)
+                elif overwrite:
+                    # name is used by a service with another url
+                    self.collection.delete_one({'name': name, 'url': {'$ne': service_url}})
+                else:
+                    raise ServiceRegistrationError("service name already registered.")
+            else:
+                return Service(saved)
+        raise ServiceRegistrationError("service could not be registered.")
 
-        service_url = baseurl(service.url)
-        # check if service is already registered
-        if self.collection.count({'url': service_url}) > 0:
-            if overwrite:
-                self.collection.delete_one({'url': service_url})
+    def save_services(self, services, overwrite=True):
+        """
+        Stores several OWS services in mongodb with bulk writes.
+
+        With ``overwrite`` services using one of the names with another url are removed
+        in a first bulk write and the services are upserted in a second one.
+        """
+        self._check_unique_indexes()
+        results = []
+        documents = []
+        for service in services:
+            try:
+                documents.append(self._service_document(service))
+            except Exception as e:
+                documents.append(None)
+                results.append(e)
             else:
-                raise ServiceRegistrationError("service url already registered.")
+                results.append(None)
+        valid = [(index, document) for index, document in enumerate(documents) if document is not None]
+        if not valid:
+            return results
+        if overwrite:
+            deletes = [pymongo.DeleteOne({'name': document.name, 'url': {'$ne': document.url}})
+                       for _, (document, random_name) in valid if not random_name]
+            if deletes:
+                self.collection.bulk_write(deletes, ordered=False)
+            requests = [pymongo.ReplaceOne({'url': document.url}, document, upsert=True)
+                        for _, (document, _) in valid]
+        else:
+            requests = [pymongo.InsertOne(document) for _, (document, _) in valid]
+        errors = {}
+        try:
+            self.collection.bulk_write(requests, ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                errors[error['index']] = error
+        for position, (index, (document, random_name)) in enumerate(valid):
+            error = errors.get(position)
+            if error is None:
+                results[index] = Service(document)
+            elif random_name:
+                # generated name is already used, save it on its own with a new generated name
+                # instead of replacing the service with that name
+                try:
+                    results[index] = self.save_service(Service(document, name=None), overwrite=overwrite)
+                except Exception as e:
+                    results[index] = e
+            else:
+                duplicate = pymongo.errors.DuplicateKeyError(error.get('errmsg', ''), error.get('code'), error)
+                key = self._duplicate_key(duplicate, document.url)
+                results[index] = ServiceRegistrationError("service {} already registered.".format(key))
+        return results
 
+    def _check_unique_indexes(self):
+        """
+        Raises a :class:`ServiceRegistrationError` if the unique ``name`` and ``url`` indexes are missing.
+        Without them services with the same name or url would be saved twice.
+        """
+        unique = [tuple(field for field, _ in info['key'])
+                  for info in self.collection.index_information().values() if info.get('unique')]
+        missing = [field for field in ('name', 'url') if (field, ) not in unique]
+        if missing:
+            LOGGER.error("Unique indexes of the services collection are missing: %s.", ', '.join(missing))
+            raise ServiceRegistrationError(
+                "unique indexes on {} are missing, run 'twitcherctl migrate'.".format(', '.join(missing)))
+
+    def _service_document(self, service):
+        """
+        Returns the document stored for ``service`` and a flag if the name was generated.
+        """
+        service_url = baseurl(service.url)
         name = namesgenerator.get_sane_name(service.name)
-        if not name:
+        random_name = not name
+        if random_name:
             name = namesgenerator.get_random_name()
-            if self.collection.count({'name': name}) > 0:
-                name = namesgenerator.get_random_name(retry=True)
-        if self.collection.count({'name': name}) > 0:
-            if overwrite:
-                self.collection.delete_one({'name': name})
-            else:
-                raise Exception("service name already registered.")
-        self.collection.insert_one(Service(
+        document = Service(
             url=service_url,
             name=name,
             type=service.type,
             public=service.public,
-            auth=service.auth))
-        return self.fetch_by_url(url=service_url)
+            auth=service.auth,
+            tile_cache=service.tile_cache)
+        return document, random_name
+
+    def _duplicate_key(self, error, url):
+        """
+        Returns the key ("name" or "url") which caused a duplicate key error.
+        """
+        details = error.details or {}
+        key_pattern = details.get('keyPattern')
+        if key_pattern:
+            return 'url' if 'url' in key_pattern else 'name'
+        message = details.get('errmsg') or str(error)
+        if 'url_1' in message:
+            return 'url'
+        elif 'name_1' in message:
+            return 'name'
+        # fallback for servers which don't report the index
+        return 'url' if self.collection.find_one({'url': url}, {'_id': True}) else 'name'
 
     def delete_service(self, name):
         """
@@ -88,6 +236,16 @@ class MongodbServiceStore(ServiceStore, MongodbStore):
         self.collection.delete_one({'name': name})
         return True
 
+    def delete_services(self, names):
+        """
+        Removes several services from mongodb storage.
+        """
+        found = set(service['name'] for service in
+                    self.collection.find({'name': {'$in': list(names)}}, {'_id': False, 'name': True}))
+        if found:
+            self.collection.delete_many({'name': {'$in': list(found)}})
+        return [name in found for name in names]
+
     def list_services(self):
         """
         Lists all services in mongodb storage.
@@ -119,5 +277,6 @@ class MongodbServiceStore(ServiceStore, MongodbStore):
         """
         Removes all OWS services from mongodb storage.
         """
-        self.collection.drop()
+        # keep the unique indexes of the collection
+        self.collection.delete_many({})
         return True
@@ -0,0 +1,45 @@
+"""
+Benchmark of the per-request cost to get a service store backed by mongodb.
+"""
+import pytest
+import timeit
+
+import pymongo
+from pyramid import testing
+
+from twitcher.db import mongodb
+from twitcher.datatype import Service
+from twitcher.store.mongodb import MongodbServiceStore
+from twitcher.tests.functional.common import setup_with_mongodb, setup_mongodb_servicestore
+
+NUMBER = 200
+
+
+@pytest.mark.slow
+@pytest.mark.online
+def test_pooled_client_latency():
+    config = setup_with_mongodb()
+    setup_mongodb_servicestore(config)
+    settings = config.registry.settings
+    MongodbServiceStore(collection=mongodb(config.registry).services).save_service(
+        Service(url='http://localhost/wps', name='emu'))
+
+    def new_client():
+        client = pymongo.MongoClient(settings['mongodb.host'], int(settings['mongodb.port']))
+        store = MongodbServiceStore(collection=client[settings['mongodb.db_name']].services)
+        store.fetch_by_name('emu')
+        client.close()
+
+    def pooled_client():
+        # bypass the service cache
+        store = MongodbServiceStore(collection=mongodb(config.registry).services)
+        store.fetch_by_name('emu')
+
+    try:
+        new_secs = timeit.timeit(new_client, number=NUMBER) / NUMBER
+        pooled_secs = timeit.timeit(pooled_client, number=NUMBER) / NUMBER
+    finally:
+        testing.tearDown()
+    print("new client per request: {:.3f} ms, pooled client: {:.3f} ms".format(
+        new_secs * 1000, pooled_secs * 1000))
+    assert pooled_secs < new_secs
@@ -0,0 +1,43 @@
+"""
+Benchmark of token lookups in a mongodb token store with many stored tokens.
+"""
+import pytest
+import random
+import timeit
+
+from pyramid import testing
+
+from twitcher.db import mongodb, ensure_indexes
+from twitcher.tokengenerator import UuidTokenGenerator
+from twitcher.store.mongodb import MongodbTokenStore
+from twitcher.tests.functional.common import setup_with_mongodb
+
+NUM_TOKENS = 10 ** 6
+BATCH_SIZE = 10 ** 4
+NUMBER = 1000
+
+
+@pytest.mark.slow
+@pytest.mark.online
+def test_fetch_by_token_latency():
+    config = setup_with_mongodb()
+    db = mongodb(config.registry)
+    db.tokens.drop()
+    ensure_indexes(db)
+    store = MongodbTokenStore(db.tokens)
+    generator = UuidTokenGenerator()
+    tokens = []
+    try:
+        for _ in range(NUM_TOKENS // BATCH_SIZE):
+            batch = [generator.create_access_token() for _ in range(BATCH_SIZE)]
+            db.tokens.insert_many([dict(token) for token in batch], ordered=False)
+            tokens.append(batch[0].token)
+        # the lookup uses the unique token index
+        plan = db.tokens.find({'token': tokens[0]}).explain()
+        assert 'IXSCAN' in str(plan['queryPlanner']['winningPlan'])
+
+        secs = timeit.timeit(lambda: store.fetch_by_token(random.choice(tokens)), number=NUMBER) / NUMBER
+        print("fetch_by_token with {} tokens: {:.3f} ms".format(db.tokens.count(), secs * 1000))
+    finally:
+        db.tokens.drop()
+        testing.tearDown()
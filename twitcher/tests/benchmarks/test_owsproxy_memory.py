@@ -0,0 +1,100 @@
+"""
+Memory usage of the OWS proxy when a WPS returns a large (2 GB) response
+or receives a large execute request.
+"""
+import pytest
+import resource
+
+from pyramid import testing
+from pyramid.request import Request
+
+from twitcher.datatype import Service
+from twitcher.owsproxy import _send_request
+from twitcher.tests.common import StubHandler, start_server, stop_server, server_url
+
+SIZE = 2 * 1024 ** 3
+CHUNK = b'\x00' * (1024 * 1024)
+
+
+class LargeOutputHandler(StubHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(SIZE))
+        self.end_headers()
+        for _ in range(SIZE // len(CHUNK)):
+            self.wfile.write(CHUNK)
+
+    def do_POST(self):
+        todo = int(self.headers['Content-Length'])
+        while todo > 0:
+            todo -= len(self.rfile.read(min(todo, len(CHUNK))))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+
+class LargeInput(object):
+    """
+    ``wsgi.input`` of a large request body which is not kept in memory.
+    """
+    def __init__(self, size):
+        self.todo = size
+
+    def read(self, size=-1):
+        if size < 0 or size > self.todo:
+            size = self.todo
+        size = min(size, len(CHUNK))
+        self.todo -= size
+        return CHUNK[:size]
+
+
+def max_rss_mb():
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+
+@pytest.mark.slow
+def test_large_wps_output():
+    server = start_server(LargeOutputHandler)
+    config = testing.setUp(settings={'twitcher.cache_invalidation': 'none'})
+    try:
+        service = Service(name='emu', url=server_url(server, '/wps'), type='wps')
+        rss_before = max_rss_mb()
+        request = Request.blank('/ows/proxy/emu?service=wps&request=execute')
+        request.registry = config.registry
+        response = _send_request(request, service, request_params='service=wps&request=execute')
+        size = 0
+        for chunk in response.app_iter:
+            size += len(chunk)
+        response.app_iter.close()
+        rss_after = max_rss_mb()
+        print("proxied {} MB, max rss {} MB before, {} MB after".format(size // 1024 ** 2, rss_before, rss_after))
+        assert size == SIZE
+        assert rss_after - rss_before < 100
+    finally:
+        testing.tearDown()
+        stop_server(server)
+
+
+@pytest.mark.slow
+def test_large_wps_input():
+    server = start_server(LargeOutputHandler)
+    config = testing.setUp(settings={'twitcher.cache_invalidation': 'none'})
+    try:
+        service = Service(name='emu', url=server_url(server, '/wps'), type='wps')
+        rss_before = max_rss_mb()
+        request = Request.blank('/ows/proxy/emu', method='POST', content_type='text/xml')
+        request.environ['wsgi.input'] = LargeInput(SIZE)
+        request.content_length = SIZE
+        request.registry = config.registry
+        response = _send_request(request, service)
+        assert b''.join(response.app_iter) == b'{}'
+        rss_after = max_rss_mb()
+        print("uploaded {} MB, max rss {} MB before, {} MB after".format(SIZE // 1024 ** 2, rss_before, rss_after))
+        assert rss_after - rss_before < 100
+    finally:
+        testing.tearDown()
+        stop_server(server)
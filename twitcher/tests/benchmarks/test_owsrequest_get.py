@@ -0,0 +1,60 @@
+"""
+Benchmark of the parsing of WMS GetMap requests with many parameters.
+"""
+import pytest
+import timeit
+
+from pyramid import testing
+from pyramid.request import Request
+
+from twitcher.owsrequest import OWSRequest, Get
+
+NUMBER = 10000
+
+GETMAP = ('/ows/proxy/ncwms?SERVICE=WMS&REQUEST=GetMap&VERSION=1.3.0&LAYERS=tasmax&STYLES=default-scalar'
+          '&CRS=EPSG:4326&BBOX=-90,0,0,90&WIDTH=256&HEIGHT=256&FORMAT=image/png&TRANSPARENT=true'
+          '&TIME=2050-01-01T00:00:00Z&ELEVATION=0&COLORSCALERANGE=250,320&NUMCOLORBANDS=250'
+          '&ABOVEMAXCOLOR=extend&BELOWMINCOLOR=extend&LOGSCALE=false&access_token=0123456789abcdef')
+
+
+class RebuildingGet(Get):
+    """
+    The parser before the parameter index: the lowercase parameters are built on every lookup.
+    """
+
+    def _request_params(self):
+        new_params = {}
+        for param in self.request.params:
+            new_params[param.lower()] = self.request.params[param]
+        return new_params
+
+    @property
+    def request_params(self):
+        return self._request_params()
+
+    def _get_version(self):
+        self._get_request_type()
+        return Get._get_version(self)
+
+
+def parse(parser_class, request):
+    parser = parser_class(request)
+    return parser.parse()
+
+
+@pytest.mark.slow
+def test_parse_getmap_request():
+    config = testing.setUp()
+    try:
+        request = Request.blank(GETMAP)
+        request.registry = config.registry
+        assert OWSRequest(request).request == 'getmap'
+        assert parse(RebuildingGet, request) == parse(Get, request)
+
+        rebuilding_secs = timeit.timeit(lambda: parse(RebuildingGet, request), number=NUMBER) / NUMBER
+        index_secs = timeit.timeit(lambda: parse(Get, request), number=NUMBER) / NUMBER
+        print("parse GetMap request with {} params: rebuilding {:.1f} us, index {:.1f} us".format(
+            len(request.params), rebuilding_secs * 1e6, index_secs * 1e6))
+        assert index_secs < rebuilding_secs
+    finally:
+        testing.tearDown()
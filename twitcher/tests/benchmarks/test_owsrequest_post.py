@@ -0,0 +1,76 @@
+"""
+Benchmark of the parsing of large WPS execute requests (inline complex inputs).
+"""
+import pytest
+import timeit
+from lxml import etree
+
+from pyramid import testing
+from pyramid.request import Request
+
+from twitcher.owsrequest import OWSRequest
+from twitcher.utils import lxml_strip_ns
+
+NUMBER = 5
+
+EXECUTE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<wps:Execute service="WPS" version="1.0.0"
+    xmlns:wps="http://www.opengis.net/wps/1.0.0"
+    xmlns:ows="http://www.opengis.net/ows/1.1"
+    xmlns:gml="http://www.opengis.net/gml">
+  <ows:Identifier>subset</ows:Identifier>
+  <wps:DataInputs>
+    <wps:Input>
+      <ows:Identifier>polygons</ows:Identifier>
+      <wps:Data>
+        <wps:ComplexData mimeType="text/xml">
+          <gml:FeatureCollection>
+%s
+          </gml:FeatureCollection>
+        </wps:ComplexData>
+      </wps:Data>
+    </wps:Input>
+  </wps:DataInputs>
+</wps:Execute>"""
+
+FEATURE = b"""            <gml:featureMember><gml:Polygon><gml:exterior><gml:LinearRing>
+              <gml:posList>-73.6 45.5 -73.5 45.5 -73.5 45.6 -73.6 45.6 -73.6 45.5</gml:posList>
+            </gml:LinearRing></gml:exterior></gml:Polygon></gml:featureMember>"""
+
+
+def execute_request(size):
+    """
+    Returns an execute request with inline features of about ``size`` bytes.
+    """
+    return EXECUTE % (FEATURE * (size // len(FEATURE)))
+
+
+def parse_with_dom(body):
+    document = etree.fromstring(body)
+    lxml_strip_ns(document)
+    return document.tag.lower(), document.attrib['service'].lower()
+
+
+def parse_root(request):
+    ows_request = OWSRequest(request)
+    return ows_request.request, ows_request.service
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('size', [1024 ** 2, 10 * 1024 ** 2, 50 * 1024 ** 2])
+def test_parse_execute_request(size):
+    config = testing.setUp()
+    try:
+        body = execute_request(size)
+        request = Request.blank('/ows/proxy/emu', POST=body, content_type='text/xml')
+        request.registry = config.registry
+        assert parse_root(request) == parse_with_dom(body) == ('execute', 'wps')
+
+        dom_secs = timeit.timeit(lambda: parse_with_dom(body), number=NUMBER) / NUMBER
+        root_secs = timeit.timeit(lambda: parse_root(request), number=NUMBER) / NUMBER
+        print("parse execute request of {} MB: dom {:.1f} ms, root element {:.2f} ms".format(
+            len(body) // 1024 ** 2, dom_secs * 1000, root_secs * 1000))
+        # the parse time doesn't depend on the size of the document
+        assert root_secs < 0.01
+    finally:
+        testing.tearDown()
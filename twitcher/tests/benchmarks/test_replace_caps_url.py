@@ -0,0 +1,61 @@
+"""
+Benchmark of the url replacement in large WMS capabilities documents.
+"""
+import re
+import pytest
+import timeit
+from lxml import etree
+
+from twitcher.utils import CapsUrlRewriter
+from twitcher.tests.common import WMS_CAPS_NCWMS2_111_XML, WMS_CAPS_NCWMS2_130_XML
+
+SCALE = 100
+NUMBER = 3
+CHUNK_SIZE = 64 * 1024
+PROXY_URL = "https://localhost/ows/proxy/wms"
+
+
+def scaled_caps(path):
+    """
+    Returns the capabilities document with its layers repeated ``SCALE`` times.
+    """
+    with open(path, 'rb') as fp:
+        xml = fp.read()
+    start = re.search(br'<Layer[\s>]', xml).start()
+    end = xml.rindex(b'</Layer>') + len(b'</Layer>')
+    return xml[:start] + xml[start:end] * SCALE + xml[end:]
+
+
+def replace_with_dom(xml):
+    ns = {'xlink': 'http://www.w3.org/1999/xlink'}
+    doc = etree.fromstring(xml)
+    for element in doc.xpath('//*[local-name()="OnlineResource"][@xlink:href]', namespaces=ns):
+        element.set('{http://www.w3.org/1999/xlink}href', PROXY_URL)
+    return etree.tostring(doc)
+
+
+def replace_streaming(xml, max_buffer):
+    rewriter = CapsUrlRewriter(PROXY_URL)
+    out = []
+    for i in range(0, len(xml), CHUNK_SIZE):
+        out.append(rewriter.feed(xml[i:i + CHUNK_SIZE]))
+        max_buffer[0] = max(max_buffer[0], len(rewriter.buffer))
+    out.append(rewriter.close())
+    return b''.join(out)
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('path', [WMS_CAPS_NCWMS2_111_XML, WMS_CAPS_NCWMS2_130_XML])
+def test_replace_caps_url(path):
+    xml = scaled_caps(path)
+    max_buffer = [0]
+    result = replace_streaming(xml, max_buffer)
+    assert len(re.findall(br'OnlineResource[^>]*href="https://localhost/ows/proxy/wms', result)) == \
+        len(re.findall(br'<(?:\w+:)?OnlineResource', xml))
+
+    dom_secs = timeit.timeit(lambda: replace_with_dom(xml), number=NUMBER) / NUMBER
+    streaming_secs = timeit.timeit(lambda: replace_streaming(xml, max_buffer), number=NUMBER) / NUMBER
+    print("replace urls in {} kB: dom {:.1f} ms, streaming {:.1f} ms, max buffered {} bytes".format(
+        len(xml) // 1024, dom_secs * 1000, streaming_secs * 1000, max_buffer[0]))
+    # only the current tag is kept in memory
+    assert max_buffer[0] < CHUNK_SIZE
@@ -0,0 +1,36 @@
+"""
+Benchmark of the in-memory revocation check with many revoked tokens.
+"""
+import pytest
+import timeit
+
+from twitcher.datatype import AccessToken
+from twitcher.revocation import RevocationList
+from twitcher.store.memory import MemoryRevokedTokenStore
+from twitcher.tokengenerator import UuidTokenGenerator
+from twitcher.utils import expires_at
+
+NUM_REVOCATIONS = 10 ** 5
+NUMBER = 10 ** 5
+
+
+@pytest.mark.slow
+def test_is_revoked_latency():
+    generator = UuidTokenGenerator()
+    store = MemoryRevokedTokenStore()
+    for _ in range(NUM_REVOCATIONS):
+        store.save_revocation(generator.generate(), expires_at=expires_at(hours=1))
+    revocationlist = RevocationList(store, refresh_interval=3600)
+    revocationlist.refresh()
+    assert revocationlist.stats()['tokens'] == NUM_REVOCATIONS
+
+    revoked = AccessToken(token=store.fetch_revocations()[0]['token'])
+    valid = AccessToken(token=generator.generate())
+    assert revocationlist.is_revoked(revoked) is True
+    assert revocationlist.is_revoked(valid) is False
+
+    valid_secs = timeit.timeit(lambda: revocationlist.is_revoked(valid), number=NUMBER) / NUMBER
+    revoked_secs = timeit.timeit(lambda: revocationlist.is_revoked(revoked), number=NUMBER) / NUMBER
+    print("is_revoked with {} revocations: valid token {:.2f} us, revoked token {:.2f} us".format(
+        NUM_REVOCATIONS, valid_secs * 10 ** 6, revoked_secs * 10 ** 6))
+    assert valid_secs < 0.001
@@ -0,0 +1,61 @@
+"""
+Benchmark of proxied GetMap requests to a local stub WMS with and without the tile cache.
+"""
+import time
+import shutil
+import pytest
+import tempfile
+import timeit
+
+from pyramid import testing
+from pyramid.request import Request
+
+from twitcher.datatype import Service
+from twitcher.owsproxy import _send_request
+from twitcher.tests.common import StubHandler, start_server, stop_server, server_url
+
+NUMBER = 200
+# time the stub WMS needs to render a tile
+RENDER_SECS = 0.005
+TILE = b'\x89PNG\r\n\x1a\n' + b'\x00' * 20000
+
+
+class StubWMSHandler(StubHandler):
+    def do_GET(self):
+        time.sleep(RENDER_SECS)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(TILE)))
+        self.end_headers()
+        self.wfile.write(TILE)
+
+
+@pytest.mark.slow
+def test_getmap_latency():
+    server = start_server(StubWMSHandler)
+    directory = tempfile.mkdtemp()
+    config = testing.setUp(settings={'twitcher.tile_cache_dir': directory, 'twitcher.cache_invalidation': 'none'})
+    try:
+        url = server_url(server, '/wms')
+        params = {'service': 'WMS', 'request': 'GetMap', 'version': '1.3.0', 'layers': 'tasmax', 'styles': '',
+                  'crs': 'EPSG:4326', 'bbox': '-90,0,0,90', 'width': '256', 'height': '256',
+                  'format': 'image/png'}
+        query = '&'.join('{}={}'.format(key, value) for key, value in params.items())
+
+        def getmap(service):
+            request = Request.blank('/ows/proxy/wms?' + query)
+            request.registry = config.registry
+            response = _send_request(request, service, request_params=query)
+            assert len(b''.join(response.app_iter)) == len(TILE)
+
+        proxied = Service(name='wms', url=url, type='wms')
+        cached = Service(name='wms', url=url, type='wms', tile_cache=True)
+        proxied_secs = timeit.timeit(lambda: getmap(proxied), number=NUMBER) / NUMBER
+        cached_secs = timeit.timeit(lambda: getmap(cached), number=NUMBER) / NUMBER
+        print("GetMap through proxy: {:.2f} ms, with tile cache: {:.2f} ms".format(
+            proxied_secs * 1000, cached_secs * 1000))
+        assert cached_secs < proxied_secs
+    finally:
+        testing.tearDown()
+        shutil.rmtree(directory)
+        stop_server(server)
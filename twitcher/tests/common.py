@@ -1,7 +1,67 @@
 import os
+import threading
+from contextlib import contextmanager
+
+from twitcher._compat import PY2
+
+if PY2:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+else:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
 
 RESOURCES_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'resources'))
 
 WPS_CAPS_EMU_XML = os.path.join(RESOURCES_PATH, 'wps_caps_emu.xml')
 WMS_CAPS_NCWMS2_111_XML = os.path.join(RESOURCES_PATH, 'wms_caps_ncwms2_111.xml')
 WMS_CAPS_NCWMS2_130_XML = os.path.join(RESOURCES_PATH, 'wms_caps_ncwms2_130.xml')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Base class of the request handlers of a local stub service.
+    """
+    protocol_version = 'HTTP/1.1'
+    # don't wait for the ack of the headers before sending the body
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # connections kept alive by a client don't block the shutdown
+    daemon_threads = True
+
+
+def start_server(handler):
+    """
+    Starts a stub service with the request ``handler`` on a free local port.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+def server_url(server, path='/'):
+    return 'http://127.0.0.1:{}{}'.format(server.server_address[1], path)
+
+
+@contextmanager
+def stub_server(handler):
+    """
+    Runs a stub service with the request ``handler`` in a ``with`` block.
+    """
+    server = start_server(handler)
+    try:
+        yield server
+    finally:
+        stop_server(server)
@@ -1,5 +1,6 @@
 from pyramid import testing
 
+from twitcher.db import mongodb, ensure_indexes
 from twitcher.tokengenerator import tokengenerator_factory
 from twitcher.store import tokenstore_factory
 from twitcher.store import servicestore_factory
@@ -8,6 +9,7 @@ from twitcher.store import servicestore_factory
 def setup_with_mongodb():
     settings = {'mongodb.host': '127.0.0.1', 'mongodb.port': '27027', 'mongodb.db_name': 'twitcher_test'}
     config = testing.setUp(settings=settings)
+    ensure_indexes(mongodb(config.registry))
     return config
 
 
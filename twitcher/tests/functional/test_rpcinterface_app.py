@@ -54,7 +54,8 @@ class XMLRPCInterfaceAppTest(unittest.TestCase):
     @pytest.mark.online
     def test_register_service_and_unregister_it(self):
         service = {'url': 'http://localhost/wps', 'name': 'test_emu',
-                   'type': 'wps', 'public': False, 'auth': 'token'}
+                   'type': 'wps', 'public': False, 'auth': 'token',
+                   'tile_cache': False}
         # register
         resp = self._callFUT('register_service', (
             service['url'],
@@ -81,3 +82,8 @@ class XMLRPCInterfaceAppTest(unittest.TestCase):
         # clear
         resp = self._callFUT('clear_services', ())
         assert resp is True
+
+    @pytest.mark.online
+    def test_migrate(self):
+        resp = self._callFUT('migrate', ())
+        assert resp is True
@@ -0,0 +1,109 @@
+import pytest
+import unittest
+import mock
+
+from twitcher.cache import TTLCache
+from twitcher.datatype import Service
+from twitcher.exceptions import ServiceNotFound
+from twitcher.store.memory import MemoryServiceStore
+from twitcher.store.cached import CachedServiceStore
+
+
+class CachedServiceStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.backend = MemoryServiceStore()
+        self.backend.save_service(Service(url='http://localhost:8094/wps', name='emu'))
+        self.cache = TTLCache()
+        self.store = CachedServiceStore(self.backend, self.cache)
+
+    def test_fetch_by_name(self):
+        with mock.patch.object(self.backend, 'fetch_by_name', wraps=self.backend.fetch_by_name) as fetch:
+            assert self.store.fetch_by_name('emu').url == 'http://localhost:8094/wps'
+            assert self.store.fetch_by_name('emu').url == 'http://localhost:8094/wps'
+            assert fetch.call_count == 1
+        assert self.cache.stats()['hits'] == 1
+        assert self.cache.stats()['misses'] == 1
+
+    def test_fetch_by_url(self):
+        with mock.patch.object(self.backend, 'fetch_by_url', wraps=self.backend.fetch_by_url) as fetch:
+            self.store.fetch_by_url('http://localhost:8094/wps')
+            self.store.fetch_by_url('http://localhost:8094/wps?service=wps')
+            assert fetch.call_count == 1
+
+    def test_fetch_returns_copy(self):
+        self.store.fetch_by_name('emu')['url'] = 'http://changed'
+        assert self.store.fetch_by_name('emu').url == 'http://localhost:8094/wps'
+
+    def test_not_found_is_not_cached(self):
+        with pytest.raises(ServiceNotFound):
+            self.store.fetch_by_name('unknown')
+        assert len(self.cache) == 0
+
+    def test_invalidate_on_save(self):
+        self.store.fetch_by_name('emu')
+        self.store.save_service(Service(url='http://localhost:8094/wps', name='emu', public=True))
+        assert self.store.fetch_by_name('emu').public is True
+
+    def test_invalidate_on_delete(self):
+        self.store.fetch_by_name('emu')
+        self.store.delete_service('emu')
+        with pytest.raises(ServiceNotFound):
+            self.store.fetch_by_name('emu')
+
+    def test_invalidate_on_clear(self):
+        self.store.fetch_by_name('emu')
+        self.store.clear_services()
+        with pytest.raises(ServiceNotFound):
+            self.store.fetch_by_name('emu')
+
+
+from twitcher.datatype import AccessToken
+from twitcher.exceptions import AccessTokenNotFound
+from twitcher.store.memory import MemoryTokenStore
+from twitcher.store.cached import CachedTokenStore
+from twitcher.utils import expires_at
+
+
+class CachedTokenStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.access_token = AccessToken(token="abcdef", expires_at=expires_at(hours=1))
+        self.backend = MemoryTokenStore()
+        self.backend.save_token(self.access_token)
+        self.cache = TTLCache()
+        self.store = CachedTokenStore(self.backend, self.cache, negative_ttl=5)
+
+    def test_fetch_by_token(self):
+        with mock.patch.object(self.backend, 'fetch_by_token', wraps=self.backend.fetch_by_token) as fetch:
+            assert self.store.fetch_by_token('abcdef') == self.access_token
+            assert self.store.fetch_by_token('abcdef') == self.access_token
+            assert fetch.call_count == 1
+
+    def test_expired_token_is_not_cached(self):
+        self.backend.save_token(AccessToken(token="expired", expires_at=expires_at(hours=-1)))
+        assert self.store.fetch_by_token('expired').is_expired()
+        assert 'expired' not in self.cache
+
+    def test_negative_cache(self):
+        with mock.patch.object(self.backend, 'fetch_by_token', wraps=self.backend.fetch_by_token) as fetch:
+            for _ in range(3):
+                with pytest.raises(AccessTokenNotFound):
+                    self.store.fetch_by_token('unknown')
+            assert fetch.call_count == 1
+
+    def test_save_token_invalidates_negative_cache(self):
+        with pytest.raises(AccessTokenNotFound):
+            self.store.fetch_by_token('xyz')
+        self.store.save_token(AccessToken(token="xyz", expires_at=expires_at(hours=1)))
+        assert self.store.fetch_by_token('xyz').token == 'xyz'
+
+    def test_invalidate_on_delete(self):
+        self.store.fetch_by_token('abcdef')
+        self.store.delete_token('abcdef')
+        with pytest.raises(AccessTokenNotFound):
+            self.store.fetch_by_token('abcdef')
+
+    def test_invalidate_on_clear(self):
+        self.store.fetch_by_token('abcdef')
+        self.store.clear_tokens()
+        with pytest.raises(AccessTokenNotFound):
+            self.store.fetch_by_token('abcdef')
@@ -0,0 +1,75 @@
+import unittest
+import mock
+
+from pyramid.testing import Registry
+
+from twitcher.store import servicestore_factory
+from twitcher.store.cached import CachedServiceStore, InvalidatingServiceStore
+from twitcher.store.mongodb import MongodbServiceStore
+from twitcher.stats import collect_stats
+
+
+class ServiceStoreFactoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.registry.settings = {'twitcher.cache_invalidation': 'none'}
+
+    @mock.patch('twitcher.store._mongodb')
+    def test_service_cache_is_shared(self, mongodb_mock):
+        store = servicestore_factory(self.registry)
+        assert isinstance(store, CachedServiceStore)
+        assert servicestore_factory(self.registry).cache is store.cache
+        assert collect_stats(self.registry)['service_cache']['hits'] == 0
+
+    @mock.patch('twitcher.store._mongodb')
+    def test_service_cache_disabled(self, mongodb_mock):
+        self.registry.settings['twitcher.service_cache_ttl'] = '0'
+        assert isinstance(servicestore_factory(self.registry), MongodbServiceStore)
+        assert collect_stats(self.registry) == {}
+
+    @mock.patch('twitcher.store._mongodb')
+    def test_service_cache_disabled_with_invalidation(self, mongodb_mock):
+        self.registry.settings['twitcher.service_cache_ttl'] = '0'
+        self.registry.settings['twitcher.cache_invalidation'] = 'file'
+        self.registry.settings['twitcher.cache_invalidation_file'] = '/tmp/twitcher_test_generation'
+        store = servicestore_factory(self.registry)
+        # changes still clear the capabilities cache
+        assert isinstance(store, InvalidatingServiceStore)
+        assert store.channel is self.registry.invalidation_channel
+
+
+from twitcher.store import tokenstore_factory
+from twitcher.store.cached import CachedTokenStore
+
+
+class TokenStoreFactoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.registry.settings = {'twitcher.cache_invalidation': 'none',
+                                  'twitcher.token_cache_negative_ttl': '10'}
+
+    @mock.patch('twitcher.store._mongodb')
+    def test_token_cache_is_shared(self, mongodb_mock):
+        store = tokenstore_factory(self.registry)
+        assert isinstance(store, CachedTokenStore)
+        assert store.negative_ttl == 10
+        assert tokenstore_factory(self.registry).cache is store.cache
+
+
+from twitcher.invalidation import FileGenerationCounter
+
+
+class InvalidationChannelFactoryTestCase(unittest.TestCase):
+    @mock.patch('twitcher.store._mongodb')
+    def test_file_invalidation(self, mongodb_mock):
+        registry = Registry()
+        registry.settings = {'twitcher.cache_invalidation': 'file',
+                             'twitcher.cache_invalidation_file': '/tmp/twitcher_test_generation'}
+        service_store = servicestore_factory(registry)
+        token_store = tokenstore_factory(registry)
+        channel = registry.invalidation_channel
+        assert isinstance(channel.counter, FileGenerationCounter)
+        assert channel.counter.path == '/tmp/twitcher_test_generation'
+        assert service_store.channel is channel
+        assert token_store.channel is channel
+        assert channel.subscribers == [service_store.cache, token_store.cache]
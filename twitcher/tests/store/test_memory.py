@@ -28,6 +28,7 @@ class MemoryServiceStoreTestCase(unittest.TestCase):
                              'name': 'emu',
                              'public': False,
                              'auth': 'token',
+                             'tile_cache': False,
                              'type': 'WPS',
                              }
         self.test_store = MemoryServiceStore()
@@ -5,6 +5,7 @@ Based on unitests in https://github.com/wndhydrnt/python-oauth2/tree/master/oaut
 import pytest
 import unittest
 import mock
+from datetime import datetime
 
 from twitcher.datatype import AccessToken
 from twitcher.utils import expires_at
@@ -31,19 +32,63 @@ class MongodbTokenStoreTestCase(unittest.TestCase):
         store = MongodbTokenStore(collection=collection_mock)
         store.save_token(self.access_token)
 
-        collection_mock.insert_one.assert_called_with(self.access_token)
+        collection_mock.insert_one.assert_called_with(dict(
+            self.access_token,
+            expires=datetime.utcfromtimestamp(self.access_token.expires_at)))
+        # the given access token is not modified
+        assert 'expires' not in self.access_token
 
 
+from twitcher.store.mongodb import MongodbRevokedTokenStore
+
+
+class MongodbRevokedTokenStoreTestCase(unittest.TestCase):
+    def test_save_revocation(self):
+        collection_mock = mock.Mock(spec=["replace_one"])
+
+        store = MongodbRevokedTokenStore(collection=collection_mock)
+        store.save_revocation('abcdef', expires_at=0, revoked_at=10)
+
+        collection_mock.replace_one.assert_called_with(
+            {'token': 'abcdef'},
+            {'token': 'abcdef', 'expires_at': 0, 'revoked_at': 10, 'expires': datetime.utcfromtimestamp(0)},
+            upsert=True)
+
+    def test_fetch_revocations(self):
+        collection_mock = mock.Mock(spec=["find"])
+        collection_mock.find.return_value = [{'token': 'abcdef', 'expires_at': 0, 'revoked_at': 10}]
+
+        store = MongodbRevokedTokenStore(collection=collection_mock)
+        assert store.fetch_revocations(since=5) == [{'token': 'abcdef', 'expires_at': 0, 'revoked_at': 10}]
+        assert collection_mock.find.call_args[0][0] == {'revoked_at': {'$gte': 5}}
+
+
+import pymongo
+from pymongo.errors import DuplicateKeyError, BulkWriteError, InvalidOperation
+
 from twitcher.datatype import Service
+from twitcher.exceptions import ServiceRegistrationError
 from twitcher.store.mongodb import MongodbServiceStore
 
 
+def service_collection(methods):
+    """
+    Returns a mock of the services collection with the unique indexes.
+    """
+    collection_mock = mock.Mock(spec=methods + ["index_information"])
+    collection_mock.index_information.return_value = {
+        '_id_': {'key': [('_id', 1)]},
+        'name_1': {'key': [('name', 1)], 'unique': True},
+        'url_1': {'key': [('url', 1)], 'unique': True}}
+    return collection_mock
+
+
 class MongodbServiceStoreTestCase(unittest.TestCase):
     def setUp(self):
         self.service = dict(name="loving_flamingo", url="http://somewhere.over.the/ocean", type="wps",
-                            public=False, auth='token')
+                            public=False, auth='token', tile_cache=False)
         self.service_public = dict(name="open_pingu", url="http://somewhere.in.the/deep_ocean", type="wps",
-                                   public=True, auth='token')
+                                   public=True, auth='token', tile_cache=True)
         self.service_special = dict(url="http://wonderload", name="A special Name", type='wps',
                                     auth='token')
 
@@ -58,32 +103,139 @@ class MongodbServiceStoreTestCase(unittest.TestCase):
         assert isinstance(service, dict)
 
     def test_save_service_default(self):
-        collection_mock = mock.Mock(spec=["insert_one", "find_one", "count"])
-        collection_mock.count.return_value = 0
-        collection_mock.find_one.return_value = self.service
+        collection_mock = service_collection(["find_one_and_replace"])
+        collection_mock.find_one_and_replace.return_value = self.service
 
         store = MongodbServiceStore(collection=collection_mock)
         store.save_service(Service(self.service))
 
-        collection_mock.insert_one.assert_called_with(self.service)
+        collection_mock.find_one_and_replace.assert_called_with(
+            {'url': self.service['url']}, self.service,
+            upsert=True, return_document=pymongo.ReturnDocument.AFTER)
 
     def test_save_service_with_special_name(self):
-        collection_mock = mock.Mock(spec=["insert_one", "find_one", "count"])
-        collection_mock.count.return_value = 0
-        collection_mock.find_one.return_value = self.service_special
+        collection_mock = service_collection(["find_one_and_replace"])
+        collection_mock.find_one_and_replace.return_value = self.service_special
 
         store = MongodbServiceStore(collection=collection_mock)
         store.save_service(Service(self.service_special))
 
-        collection_mock.insert_one.assert_called_with({
-            'url': 'http://wonderload', 'type': 'wps', 'name': 'a_special_name', 'public': False, 'auth': 'token'})
+        collection_mock.find_one_and_replace.assert_called_with(
+            {'url': 'http://wonderload'},
+            {'url': 'http://wonderload', 'type': 'wps', 'name': 'a_special_name', 'public': False, 'auth': 'token',
+             'tile_cache': False},
+            upsert=True, return_document=pymongo.ReturnDocument.AFTER)
 
     def test_save_service_public(self):
-        collection_mock = mock.Mock(spec=["insert_one", "find_one", "count"])
-        collection_mock.count.return_value = 0
-        collection_mock.find_one.return_value = self.service_public
+        collection_mock = service_collection(["find_one_and_replace"])
+        collection_mock.find_one_and_replace.return_value = self.service_public
 
         store = MongodbServiceStore(collection=collection_mock)
         store.save_service(Service(self.service_public))
 
-        collection_mock.insert_one.assert_called_with(self.service_public)
+        collection_mock.find_one_and_replace.assert_called_with(
+            {'url': self.service_public['url']}, self.service_public,
+            upsert=True, return_document=pymongo.ReturnDocument.AFTER)
+
+    def test_save_service_overwrite_name(self):
+        collection_mock = service_collection(["find_one_and_replace", "delete_one"])
+        collection_mock.find_one_and_replace.side_effect = [
+            DuplicateKeyError("E11000 duplicate key error index: twitcher.services.$name_1"),
+            self.service]
+
+        store = MongodbServiceStore(collection=collection_mock)
+        store.save_service(Service(self.service))
+
+        collection_mock.delete_one.assert_called_with(
+            {'name': self.service['name'], 'url': {'$ne': self.service['url']}})
+        assert collection_mock.find_one_and_replace.call_count == 2
+
+    def test_save_service_without_indexes(self):
+        collection_mock = service_collection(["insert_one", "bulk_write"])
+        collection_mock.index_information.return_value = {'_id_': {'key': [('_id', 1)]},
+                                                         'name_1': {'key': [('name', 1)]}}
+
+        store = MongodbServiceStore(collection=collection_mock)
+        with pytest.raises(ServiceRegistrationError) as e:
+            store.save_service(Service(self.service), overwrite=False)
+        assert 'name, url' in str(e.value)
+        with pytest.raises(ServiceRegistrationError):
+            store.save_services([Service(self.service)], overwrite=False)
+        assert collection_mock.insert_one.called is False
+        assert collection_mock.bulk_write.called is False
+
+    def test_save_service_no_overwrite(self):
+        collection_mock = service_collection(["insert_one"])
+        collection_mock.insert_one.side_effect = DuplicateKeyError(
+            "E11000 duplicate key error index: twitcher.services.$url_1")
+
+        store = MongodbServiceStore(collection=collection_mock)
+        with pytest.raises(ServiceRegistrationError):
+            store.save_service(Service(self.service), overwrite=False)
+
+    def test_save_services(self):
+        collection_mock = service_collection(["bulk_write"])
+
+        store = MongodbServiceStore(collection=collection_mock)
+        results = store.save_services([Service(self.service), Service(self.service_public)])
+
+        assert [service.name for service in results] == ['loving_flamingo', 'open_pingu']
+        assert collection_mock.bulk_write.call_count == 2
+        deletes, upserts = [call[0][0] for call in collection_mock.bulk_write.call_args_list]
+        assert deletes[0] == pymongo.DeleteOne(
+            {'name': self.service['name'], 'url': {'$ne': self.service['url']}})
+        assert upserts[1] == pymongo.ReplaceOne(
+            {'url': self.service_public['url']}, self.service_public, upsert=True)
+
+    def test_save_services_generated_names(self):
+        def bulk_write(requests, ordered):
+            if not requests:
+                raise InvalidOperation('No operations to execute')
+        collection_mock = service_collection(["bulk_write"])
+        collection_mock.bulk_write.side_effect = bulk_write
+
+        store = MongodbServiceStore(collection=collection_mock)
+        results = store.save_services([Service(url='http://somewhere.over.the/ocean', name=None),
+                                       Service(url='http://somewhere.in.the/deep_ocean', name=None)])
+
+        assert [isinstance(service, Service) for service in results] == [True, True]
+        # nothing to delete
+        assert collection_mock.bulk_write.call_count == 1
+
+    def test_save_services_generated_name_collides(self):
+        collection_mock = service_collection(["bulk_write", "find_one_and_replace", "delete_one"])
+        collection_mock.bulk_write.side_effect = BulkWriteError({'writeErrors': [
+            {'index': 0, 'code': 11000, 'keyPattern': {'name': 1},
+             'errmsg': "E11000 duplicate key error index: twitcher.services.$name_1"}]})
+        collection_mock.find_one_and_replace.side_effect = lambda query, document, **kwargs: document
+
+        store = MongodbServiceStore(collection=collection_mock)
+        with mock.patch('twitcher.namesgenerator.get_random_name', side_effect=['happy_turing', 'brave_hopper']):
+            results = store.save_services([Service(url='http://somewhere.over.the/ocean', name=None)])
+
+        # saved with a new generated name, the service which owns the colliding name is kept
+        assert results[0].name == 'brave_hopper'
+        assert collection_mock.delete_one.call_count == 0
+
+    def test_save_services_no_overwrite(self):
+        collection_mock = service_collection(["bulk_write"])
+        collection_mock.bulk_write.side_effect = BulkWriteError({'writeErrors': [
+            {'index': 1, 'code': 11000, 'keyPattern': {'url': 1},
+             'errmsg': "E11000 duplicate key error index: twitcher.services.$url_1"}]})
+
+        store = MongodbServiceStore(collection=collection_mock)
+        results = store.save_services([Service(self.service), Service(self.service_public)], overwrite=False)
+
+        assert results[0].name == 'loving_flamingo'
+        assert isinstance(results[1], ServiceRegistrationError)
+        collection_mock.bulk_write.assert_called_once_with(
+            [pymongo.InsertOne(self.service), pymongo.InsertOne(self.service_public)], ordered=False)
+
+    def test_delete_services(self):
+        collection_mock = mock.Mock(spec=["find", "delete_many"])
+        collection_mock.find.return_value = [{'name': 'loving_flamingo'}]
+
+        store = MongodbServiceStore(collection=collection_mock)
+        assert store.delete_services(['loving_flamingo', 'unknown']) == [True, False]
+
+        collection_mock.delete_many.assert_called_with({'name': {'$in': ['loving_flamingo']}})
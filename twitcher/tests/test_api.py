@@ -3,6 +3,7 @@ Testing the Twitcher API.
 """
 import pytest
 import unittest
+import mock
 
 from twitcher.api import TokenManager
 from twitcher.tokengenerator import UuidTokenGenerator
@@ -39,6 +40,19 @@ class TokenManagerTest(unittest.TestCase):
         assert access_token.data == {'esgf_token': 'abcdef'}
 
 
+    def test_generate_token_with_esgf_data(self):
+        credentials = mock.Mock(spec=['provision'])
+        credentials.provision.return_value = '/tmp/twitcher_esgf_abc'
+        tokenmgr = TokenManager(tokengenerator=UuidTokenGenerator(), tokenstore=MemoryTokenStore(),
+                                credentials=credentials, workdir='/tmp')
+        resp = tokenmgr.generate_token(valid_in_hours=1, data={'esgf_access_token': 'abcdef'})
+        credentials.provision.assert_called_once_with({'esgf_access_token': 'abcdef'}, workdir='/tmp',
+                                                      prefix='twitcher_', expires_at=mock.ANY)
+        # the location of the credentials is stored with the token
+        access_token = tokenmgr.store.fetch_by_token(resp['access_token'])
+        assert access_token.data == {'esgf_access_token': 'abcdef', 'esgf_workdir': '/tmp/twitcher_esgf_abc'}
+
+
 from twitcher.api import Registry
 from twitcher.store.memory import MemoryServiceStore
 
@@ -50,7 +64,7 @@ class RegistryTest(unittest.TestCase):
 
     def test_register_service_and_unregister_it(self):
         service = {'url': 'http://localhost/wps', 'name': 'test_emu',
-                   'type': 'wps', 'public': False, 'auth': 'token'}
+                   'type': 'wps', 'public': False, 'auth': 'token', 'tile_cache': False}
         # register
         resp = self.reg.register_service(
             service['url'],
@@ -77,3 +91,57 @@ class RegistryTest(unittest.TestCase):
         # clear
         resp = self.reg.clear_services()
         assert resp is True
+
+    def test_register_services_and_unregister_them(self):
+        services = [{'url': 'http://localhost/wps', 'name': 'test_emu',
+                     'type': 'wps', 'public': False, 'auth': 'token', 'tile_cache': False},
+                    {'url': 'http://localhost/ncwms', 'name': 'test_wms',
+                     'type': 'wms', 'public': True, 'auth': 'token', 'tile_cache': True},
+                    {'name': 'no_url'}]
+        # register
+        resp = self.reg.register_services(services, False)
+        assert resp[:2] == services[:2]
+        assert resp[2]['url'] == ''
+        assert 'error' in resp[2]
+
+        # register again
+        resp = self.reg.register_services(services[:1], False)
+        assert 'error' in resp[0]
+
+        # list
+        resp = self.reg.list_services()
+        assert len(resp) == 2
+
+        # unregister
+        resp = self.reg.unregister_services(['test_emu', 'unknown', 'test_wms'])
+        assert resp == [True, False, True]
+        assert self.reg.list_services() == []
+
+
+from twitcher.tokengenerator import HmacTokenGenerator
+from twitcher.revocation import RevocationList
+from twitcher.store.memory import MemoryRevokedTokenStore
+
+
+class SignedTokenManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.revocationlist = RevocationList(MemoryRevokedTokenStore())
+        self.tokenmgr = TokenManager(
+            tokengenerator=HmacTokenGenerator(secret='my secret'),
+            tokenstore=MemoryTokenStore(),
+            revocationlist=self.revocationlist,
+        )
+
+    def test_generate_token_and_revoke_it(self):
+        resp = self.tokenmgr.generate_token()
+        access_token = self.tokenmgr.tokengenerator.verify(resp['access_token'])
+        assert self.revocationlist.is_revoked(access_token) is False
+        assert self.tokenmgr.revoke_token(resp['access_token']) is True
+        assert self.revocationlist.is_revoked(access_token) is True
+
+    def test_revoke_all_tokens(self):
+        resp = self.tokenmgr.generate_token()
+        access_token = self.tokenmgr.tokengenerator.verify(resp['access_token'])
+        assert self.tokenmgr.revoke_all_tokens() is True
+        assert self.revocationlist.is_revoked(access_token) is True
@@ -0,0 +1,54 @@
+import unittest
+
+from twitcher.cache import TTLCache
+
+
+class Timer(object):
+    def __init__(self):
+        self.now = 1000
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.timer = Timer()
+        self.cache = TTLCache(maxsize=2, ttl=10, timer=self.timer)
+
+    def test_get_and_set(self):
+        assert self.cache.get('a') is None
+        self.cache.set('a', 1)
+        assert self.cache.get('a') == 1
+        assert 'a' in self.cache
+        assert self.cache.stats() == {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 2}
+
+    def test_expired(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2, ttl=20)
+        self.timer.now += 10
+        assert self.cache.get('a') is None
+        assert self.cache.get('b') == 2
+        assert self.cache.get('a', 'default') == 'default'
+
+    def test_zero_ttl_is_not_cached(self):
+        self.cache.set('a', 1, ttl=0)
+        assert 'a' not in self.cache
+
+    def test_lru(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        assert 'a' in self.cache
+        assert 'b' not in self.cache
+        assert len(self.cache) == 2
+
+    def test_pop_and_clear(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.pop('a')
+        self.cache.pop('unknown')
+        assert 'a' not in self.cache
+        self.cache.clear()
+        assert len(self.cache) == 0
@@ -0,0 +1,160 @@
+import unittest
+import mock
+
+from pyramid import testing
+from pyramid.testing import DummyRequest
+
+from twitcher.cache import TTLCache
+from twitcher.capscache import CapabilitiesCache, cache_key
+from twitcher.owsproxy import _send_cached_request
+
+SERVICE = {'name': 'emu', 'url': 'http://localhost:8094/wps', 'type': 'wps'}
+
+CAPS_XML = b'<wps:Capabilities xmlns:wps="http://www.opengis.net/wps/1.0.0" ' \
+           b'xmlns:ows="http://www.opengis.net/ows/1.1" xmlns:xlink="http://www.w3.org/1999/xlink">' \
+           b'<ows:OperationsMetadata><ows:Operation name="GetCapabilities">' \
+           b'<ows:Get xlink:href="http://localhost:8094/wps"/></ows:Operation></ows:OperationsMetadata>' \
+           b'</wps:Capabilities>'
+
+
+def upstream_response(status_code=200, content=CAPS_XML, headers=None):
+    resp = mock.Mock()
+    resp.status_code = status_code
+    resp.ok = status_code < 400
+    resp.content = content
+    resp.headers = headers or {'Content-Type': 'text/xml', 'ETag': '"v1"'}
+    return resp
+
+
+class CapabilitiesCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+        self.config.add_route('owsproxy', '/ows/proxy/{service_name}')
+        self.now = 1000
+        self.capscache = CapabilitiesCache(TTLCache(ttl=60), timer=lambda: self.now)
+        self.sessions = mock.Mock(spec=['request'])
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def send(self, params):
+        request = DummyRequest(params=params)
+        key = cache_key(request, SERVICE)
+        return _send_cached_request(request, SERVICE, SERVICE['url'], {}, self.sessions, self.capscache, key)
+
+    def test_cache_key(self):
+        key = cache_key(DummyRequest(params={'service': 'WPS', 'request': 'GetCapabilities'}), SERVICE)
+        assert key == cache_key(DummyRequest(params={'REQUEST': 'getcapabilities', 'Service': 'wps',
+                                                     'access_token': 'abc'}), SERVICE)
+        assert key == cache_key(DummyRequest(params={'service': 'WPS', 'request': 'GetCapabilities',
+                                                     'token': 'abc'}), SERVICE)
+        assert key != cache_key(DummyRequest(params={'service': 'WPS', 'request': 'GetCapabilities'}), SERVICE,
+                                extra_path='other')
+        assert cache_key(DummyRequest(params={'service': 'WPS', 'request': 'Execute'}), SERVICE) is None
+        assert cache_key(DummyRequest(params={'service': 'WPS', 'request': 'GetCapabilities'}, post={}),
+                         SERVICE) is None
+        # users with credentials don't share responses
+        assert key != cache_key(DummyRequest(params={'service': 'WPS', 'request': 'GetCapabilities'},
+                                             headers={'Cookie': 'JSESSIONID=alice'}), SERVICE)
+        assert key != cache_key(DummyRequest(params={'service': 'WPS', 'request': 'GetCapabilities'},
+                                             headers={'Authorization': 'Bearer alice'}), SERVICE)
+
+    def test_hit(self):
+        self.sessions.request.return_value = upstream_response()
+        resp = self.send({'service': 'wps', 'request': 'getcapabilities'})
+        assert b'xlink:href="http://example.com/ows/proxy/emu"' in resp.body
+        resp = self.send({'service': 'WPS', 'request': 'GetCapabilities'})
+        assert b'xlink:href="http://example.com/ows/proxy/emu"' in resp.body
+        assert resp.content_type == 'text/xml'
+        assert self.sessions.request.call_count == 1
+
+    def test_revalidate(self):
+        self.sessions.request.return_value = upstream_response()
+        self.send({'service': 'wps', 'request': 'getcapabilities'})
+        self.now += 61
+        self.sessions.request.return_value = upstream_response(status_code=304, content=b'')
+        resp = self.send({'service': 'wps', 'request': 'getcapabilities'})
+        assert b'http://example.com/ows/proxy/emu' in resp.body
+        assert self.sessions.request.call_args[1]['headers'] == {'If-None-Match': '"v1"'}
+        # fresh again
+        self.send({'service': 'wps', 'request': 'getcapabilities'})
+        assert self.sessions.request.call_count == 2
+
+    def test_error_is_not_cached(self):
+        self.sessions.request.return_value = upstream_response(
+            status_code=500, content=b'<ows:ExceptionReport/>')
+        resp = self.send({'service': 'wps', 'request': 'getcapabilities'})
+        assert resp.status_code == 500
+        self.send({'service': 'wps', 'request': 'getcapabilities'})
+        assert self.sessions.request.call_count == 2
+
+    def test_cleared(self):
+        self.sessions.request.return_value = upstream_response()
+        self.send({'service': 'wps', 'request': 'getcapabilities'})
+        # a registration clears the subscribed caches
+        self.capscache.cache.clear()
+        self.send({'service': 'wps', 'request': 'getcapabilities'})
+        assert self.sessions.request.call_count == 2
+
+
+WMS_SERVICE = {'name': 'ncwms', 'url': 'http://localhost:8080/ncWMS2/wms', 'type': 'wms'}
+
+
+class OtherServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+        self.config.add_route('owsproxy', '/ows/proxy/{service_name}')
+        self.capscache = CapabilitiesCache(TTLCache(ttl=60))
+        self.sessions = mock.Mock(spec=['request'])
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def send(self, headers=None):
+        request = DummyRequest(params={'service': 'wms', 'request': 'GetCapabilities'}, headers=headers)
+        key = cache_key(request, WMS_SERVICE)
+        return _send_cached_request(request, WMS_SERVICE, WMS_SERVICE['url'], {}, self.sessions, self.capscache, key)
+
+    def test_headers(self):
+        self.sessions.request.return_value = upstream_response(content=b'<WMS_Capabilities/>', headers={
+            'Content-Type': 'application/vnd.ogc.wms_xml; charset=UTF-8', 'Cache-Control': 'max-age=60',
+            'Connection': 'keep-alive', 'Content-Length': '19'})
+        for _ in range(2):
+            resp = self.send()
+            assert resp.body == b'<WMS_Capabilities/>'
+            assert resp.headers['Content-Type'] == 'application/vnd.ogc.wms_xml; charset=UTF-8'
+            assert resp.headers['Cache-Control'] == 'max-age=60'
+            assert 'Connection' not in resp.headers
+        assert self.sessions.request.call_count == 1
+
+    def test_content_type_is_not_filtered(self):
+        self.sessions.request.return_value = upstream_response(content=b'<html/>', headers={
+            'Content-Type': 'text/html'})
+        resp = self.send()
+        assert resp.status_code == 200
+        assert resp.body == b'<html/>'
+        assert resp.content_type == 'text/html'
+
+    def test_error_is_passed_through(self):
+        self.sessions.request.return_value = upstream_response(status_code=404, content=b'not found', headers={
+            'Content-Type': 'text/plain', 'X-Reason': 'unknown layer'})
+        resp = self.send()
+        assert resp.status_code == 404
+        assert resp.body == b'not found'
+        assert resp.headers['X-Reason'] == 'unknown layer'
+        # errors are not cached
+        self.send()
+        assert self.sessions.request.call_count == 2
+
+    def test_cookies_are_not_cached(self):
+        self.sessions.request.return_value = upstream_response(content=b'<WMS_Capabilities/>', headers={
+            'Content-Type': 'application/vnd.ogc.wms_xml', 'Set-Cookie': 'JSESSIONID=alice-secret'})
+        resp = self.send()
+        assert resp.headers['Set-Cookie'] == 'JSESSIONID=alice-secret'
+        # another user gets the cached response without the cookie
+        resp = self.send()
+        assert resp.body == b'<WMS_Capabilities/>'
+        assert 'Set-Cookie' not in resp.headers
+        assert self.sessions.request.call_count == 1
@@ -0,0 +1,136 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import mock
+
+from OpenSSL import crypto
+
+from twitcher.credentials import CredentialsCache, credentials_key, certificate_not_after
+from twitcher.esgf import ESGF_CREDENTIALS
+from twitcher.workdirs import WorkdirManager, expires_at
+
+DATA = {'esgf_access_token': 'abc', 'esgf_slcs_service_url': 'https://slcs.example.org'}
+
+
+def certificate(expires_in):
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 1024)
+    cert = crypto.X509()
+    cert.get_subject().CN = 'test'
+    cert.set_serial_number(1)
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(expires_in)
+    cert.set_issuer(cert.get_subject())
+    cert.set_pubkey(key)
+    cert.sign(key, 'sha256')
+    return crypto.dump_certificate(crypto.FILETYPE_PEM, cert) + crypto.dump_privatekey(crypto.FILETYPE_PEM, key)
+
+
+class CredentialsCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.content = certificate(3600)
+        self.fetch = mock.patch('twitcher.credentials.fetch_certificate', side_effect=self._fetch_certificate)
+        self.fetch_certificate = self.fetch.start()
+
+    def tearDown(self):
+        self.fetch.stop()
+        shutil.rmtree(self.workdir)
+
+    def _fetch_certificate(self, workdir, data, **kwargs):
+        with open(os.path.join(workdir, ESGF_CREDENTIALS), 'wb') as fh:
+            fh.write(self.content)
+        return True
+
+    def test_credentials_key(self):
+        assert credentials_key({}) is None
+        assert credentials_key({'esgf_slcs_service_url': 'https://slcs.example.org'}) is None
+        assert credentials_key(DATA) == credentials_key(dict(DATA))
+        assert credentials_key(DATA) != credentials_key(dict(DATA, esgf_access_token='xyz'))
+        assert credentials_key({'esgf_credentials': 'https://example.org/cert.pem'}) is not None
+
+    def test_certificate_not_after(self):
+        path = os.path.join(self.workdir, 'cert.pem')
+        with open(path, 'wb') as fh:
+            fh.write(self.content)
+        assert abs(certificate_not_after(path) - (time.time() + 3600)) < 5
+        with open(path, 'wb') as fh:
+            fh.write(b'no certificate')
+        assert certificate_not_after(path) is None
+        assert certificate_not_after(os.path.join(self.workdir, 'missing.pem')) is None
+
+    def test_workdir_is_reused(self):
+        cache = CredentialsCache()
+        workdir = cache.workdir(DATA, self.workdir)
+        assert os.path.isfile(os.path.join(workdir, ESGF_CREDENTIALS))
+        assert cache.workdir(DATA, self.workdir) == workdir
+        assert self.fetch_certificate.call_count == 1
+        assert cache.stats() == {'hits': 1, 'fetches': 1, 'failures': 0, 'provisioned': 0, 'tokens': 1}
+        # another token
+        assert cache.workdir(dict(DATA, esgf_access_token='xyz'), self.workdir) != workdir
+        assert self.fetch_certificate.call_count == 2
+
+    def test_expired(self):
+        now = [time.time()]
+        cache = CredentialsCache(margin=300, timer=lambda: now[0])
+        workdir = cache.workdir(DATA, self.workdir)
+        # a new certificate is fetched shortly before the current one expires
+        now[0] += 3600 - 200
+        assert cache.workdir(DATA, self.workdir) != workdir
+        assert self.fetch_certificate.call_count == 2
+
+    def test_published_workdir(self):
+        workdir = CredentialsCache().workdir(DATA, self.workdir, prefix='twitcher_')
+        link = os.path.join(self.workdir, 'twitcher_esgf_' + credentials_key(DATA))
+        assert os.path.realpath(link) == os.path.realpath(workdir)
+        # the workdir is shared with other worker processes
+        assert os.path.realpath(CredentialsCache().workdir(DATA, self.workdir)) == os.path.realpath(workdir)
+        assert self.fetch_certificate.call_count == 1
+
+    def test_fetch_failed(self):
+        self.fetch_certificate.side_effect = None
+        self.fetch_certificate.return_value = False
+        cache = CredentialsCache()
+        assert cache.workdir(DATA, self.workdir) is None
+        assert os.listdir(self.workdir) == []
+        assert cache.stats()['failures'] == 1
+
+    def test_no_certificate(self):
+        self.content = b'no certificate'
+        cache = CredentialsCache()
+        workdir = cache.workdir(DATA, self.workdir)
+        assert workdir is not None
+        # not cached without an expiry
+        assert cache.workdir(DATA, self.workdir) != workdir
+        assert self.fetch_certificate.call_count == 2
+
+    def test_no_esgf_data(self):
+        assert CredentialsCache().workdir({}, self.workdir) is None
+        assert self.fetch_certificate.call_count == 0
+
+    def test_provision(self):
+        cache = CredentialsCache()
+        link = cache.provision(DATA, self.workdir, prefix='twitcher_')
+        assert link == os.path.join(self.workdir, 'twitcher_esgf_' + credentials_key(DATA))
+        deadline = time.time() + 5
+        while not os.path.exists(link) and time.time() < deadline:
+            time.sleep(0.01)
+        # a request finds the credentials at the stored location
+        assert CredentialsCache().workdir(dict(DATA, esgf_workdir=link), '/nowhere') == os.path.realpath(link)
+        assert self.fetch_certificate.call_count == 1
+        assert cache.stats()['provisioned'] == 1
+        assert cache.provision({}, self.workdir) is None
+
+    def test_workdir_expiry(self):
+        cache = CredentialsCache(workdirs=WorkdirManager(self.workdir, interval=0))
+        now = time.time()
+        workdir = cache.workdir(DATA, self.workdir, expires_at=now + 600)
+        # kept until the token expires
+        assert abs(expires_at(workdir) - (now + 600)) < 5
+        # or at most until the certificate expires
+        assert cache.workdir(DATA, self.workdir, expires_at=now + 7200) == workdir
+        assert abs(expires_at(workdir) - (now + 3600)) < 5
+        assert cache.workdirs.stats()['created'] == 1
@@ -57,5 +57,6 @@ class ServiceTestCase(unittest.TestCase):
         assert service.params == {'name': 'test_wps',
                                   'public': False,
                                   'auth': 'token',
+                                  'tile_cache': False,
                                   'type': 'WPS',
                                   'url': 'http://nowhere/wps'}
@@ -0,0 +1,109 @@
+import unittest
+import mock
+import pymongo
+from datetime import datetime
+
+from pyramid import testing
+from pyramid.testing import Registry
+from pymongo.errors import ServerSelectionTimeoutError
+
+from twitcher import db
+
+
+class MongodbClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.registry.settings = {'mongodb.host': '127.0.0.1', 'mongodb.port': '27027',
+                                  'mongodb.db_name': 'twitcher_test',
+                                  'mongodb.max_pool_size': '50',
+                                  'mongodb.server_selection_timeout_ms': '2000'}
+
+    def test_client_options(self):
+        assert db.client_options(self.registry.settings) == {
+            'maxPoolSize': 50, 'serverSelectionTimeoutMS': 2000}
+        assert db.client_options({'mongodb.socket_timeout_ms': ''}) == {}
+
+    @mock.patch('twitcher.db.pymongo.MongoClient')
+    def test_client_is_reused(self, client_mock):
+        client = db.mongodb_client(self.registry)
+        assert db.mongodb_client(self.registry) is client
+        assert db.mongodb(self.registry) is client['twitcher_test']
+        client_mock.assert_called_once_with(
+            '127.0.0.1', 27027, connect=False, maxPoolSize=50, serverSelectionTimeoutMS=2000)
+
+    @mock.patch('twitcher.db.pymongo.MongoClient')
+    def test_client_after_fork(self, client_mock):
+        db.mongodb_client(self.registry)
+        with mock.patch('twitcher.db.os.getpid', return_value=-1):
+            db.mongodb_client(self.registry)
+        assert client_mock.call_count == 2
+
+
+class EnsureIndexesTestCase(unittest.TestCase):
+    def test_ensure_indexes(self):
+        db_mock = mock.MagicMock()
+        db.ensure_indexes(db_mock)
+        db_mock.services.create_index.assert_any_call("name", unique=True)
+        db_mock.services.create_index.assert_any_call("url", unique=True)
+        db_mock.tokens.create_index.assert_any_call("token", unique=True)
+        db_mock.tokens.create_index.assert_any_call("expires", expireAfterSeconds=0)
+        db_mock.revoked_tokens.create_index.assert_any_call("token", unique=True)
+
+    def test_migrate_token_expiry(self):
+        collection_mock = mock.Mock(spec=["find", "bulk_write"])
+        collection_mock.find.return_value = [{'_id': 1, 'expires_at': 1500000000},
+                                             {'_id': 2, 'expires_at': 1500000060},
+                                             {'_id': 3, 'expires_at': 1500000120}]
+        collection_mock.bulk_write.side_effect = lambda requests, ordered: mock.Mock(modified_count=len(requests))
+        assert db.migrate_token_expiry(collection_mock, batch_size=2) == 3
+        collection_mock.find.assert_called_once_with(
+            {'expires': {'$exists': False}, 'expires_at': {'$type': 'number'}}, {'expires_at': True})
+        first, second = [call[0][0] for call in collection_mock.bulk_write.call_args_list]
+        assert first[0] == pymongo.UpdateOne({'_id': 1}, {'$set': {'expires': datetime(2017, 7, 14, 2, 40)}})
+        assert len(first) == 2
+        assert second == [pymongo.UpdateOne({'_id': 3}, {'$set': {'expires': datetime(2017, 7, 14, 2, 42)}})]
+
+    def test_migrate_token_expiry_nothing_to_do(self):
+        collection_mock = mock.Mock(spec=["find", "bulk_write"])
+        collection_mock.find.return_value = []
+        assert db.migrate_token_expiry(collection_mock) == 0
+        assert collection_mock.bulk_write.called is False
+
+    @mock.patch('twitcher.db.pymongo.MongoClient')
+    def test_ensure_indexes_on_startup(self, client_mock):
+        config = testing.setUp(settings={'mongodb.host': '127.0.0.1', 'mongodb.port': '27027',
+                                         'mongodb.db_name': 'twitcher_test'})
+        try:
+            config.include('twitcher.db')
+            config.include('twitcher.db')
+            config.make_wsgi_app()
+        finally:
+            testing.tearDown()
+        # indexes are created once with a short-lived client
+        client_mock.assert_called_once_with('127.0.0.1', 27027)
+        client_mock.return_value.close.assert_called_once_with()
+
+    @mock.patch('twitcher.db.pymongo.MongoClient')
+    def test_ensure_indexes_without_mongodb(self, client_mock):
+        config = testing.setUp(settings={'mongodb.host': '127.0.0.1', 'mongodb.port': '27027',
+                                         'mongodb.db_name': 'twitcher_test'})
+        try:
+            config.include('twitcher.db')
+            with mock.patch('twitcher.db.ensure_indexes', side_effect=ServerSelectionTimeoutError('down')):
+                with mock.patch.object(db.logger, 'warn') as warn:
+                    # the application starts anyway
+                    config.make_wsgi_app()
+        finally:
+            testing.tearDown()
+        assert 'twitcherctl migrate' in warn.call_args[0][0]
+        client_mock.return_value.close.assert_called_once_with()
+
+    @mock.patch('twitcher.db.pymongo.MongoClient')
+    def test_ensure_indexes_disabled(self, client_mock):
+        config = testing.setUp(settings={'mongodb.ensure_indexes': 'false'})
+        try:
+            config.include('twitcher.db')
+            config.make_wsgi_app()
+        finally:
+            testing.tearDown()
+        assert client_mock.called is False
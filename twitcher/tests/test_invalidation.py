@@ -0,0 +1,157 @@
+import os
+import pytest
+import unittest
+import mock
+import shutil
+import tempfile
+
+from pyramid import testing
+
+from twitcher.cache import TTLCache
+from twitcher.datatype import Service
+from twitcher.exceptions import ServiceNotFound
+from twitcher.invalidation import InvalidationChannel
+from twitcher.invalidation import FileGenerationCounter, MongodbGenerationCounter
+from twitcher.store.cached import CachedServiceStore, InvalidatingServiceStore
+from twitcher.capscache import CapabilitiesCache, CachedResponse
+from twitcher.store.memory import MemoryServiceStore
+
+
+class Timer(object):
+    def __init__(self):
+        self.now = 1000
+
+    def __call__(self):
+        return self.now
+
+
+class FileGenerationCounterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.counter = FileGenerationCounter(os.path.join(self.workdir, 'generation'))
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_increment(self):
+        assert self.counter.get() == 0
+        self.counter.increment()
+        self.counter.increment()
+        assert self.counter.get() == 2
+
+
+class MongodbGenerationCounterTestCase(unittest.TestCase):
+    def test_get(self):
+        collection_mock = mock.Mock(spec=["find_one"])
+        collection_mock.find_one.return_value = {'_id': 'caches', 'generation': 3}
+        assert MongodbGenerationCounter(collection_mock).get() == 3
+        collection_mock.find_one.assert_called_with({'_id': 'caches'})
+
+    def test_increment(self):
+        collection_mock = mock.Mock(spec=["update_one"])
+        MongodbGenerationCounter(collection_mock).increment()
+        collection_mock.update_one.assert_called_with(
+            {'_id': 'caches'}, {'$inc': {'generation': 1}}, upsert=True)
+
+
+class InvalidationChannelTestCase(unittest.TestCase):
+    """
+    Simulates two worker processes sharing a service store and a file generation counter.
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        path = os.path.join(self.workdir, 'generation')
+        self.timer = Timer()
+        backend = MemoryServiceStore()
+        backend.save_service(Service(url='http://localhost:8094/wps', name='emu'))
+        self.workers = []
+        for _ in range(2):
+            cache = TTLCache(ttl=3600, timer=self.timer)
+            channel = InvalidationChannel(FileGenerationCounter(path), poll_interval=1, timer=self.timer)
+            channel.subscribe(cache)
+            self.workers.append(CachedServiceStore(backend, cache, channel=channel))
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_delete_service_in_other_worker(self):
+        worker1, worker2 = self.workers
+        assert worker1.fetch_by_name('emu').name == 'emu'
+        worker2.delete_service('emu')
+        # changes are seen after the poll interval
+        assert worker1.fetch_by_name('emu').name == 'emu'
+        self.timer.now += 1
+        with pytest.raises(ServiceNotFound):
+            worker1.fetch_by_name('emu')
+
+    def test_poll_interval(self):
+        channel = self.workers[0].channel
+        with mock.patch.object(channel.counter, 'get', return_value=0) as get:
+            channel.poll()
+            channel.poll()
+            assert get.call_count == 1
+            self.timer.now += 1
+            channel.poll()
+            assert get.call_count == 2
+
+    def test_poll_error_clears_caches(self):
+        store = self.workers[0]
+        store.fetch_by_name('emu')
+        self.timer.now += 1
+        with mock.patch.object(store.channel.counter, 'get', side_effect=IOError):
+            store.channel.poll()
+        assert len(store.cache) == 0
+
+
+class CapabilitiesCacheInvalidationTestCase(unittest.TestCase):
+    """
+    Simulates two worker processes with a capabilities cache and without a service cache.
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        path = os.path.join(self.workdir, 'generation')
+        self.timer = Timer()
+        backend = MemoryServiceStore()
+        self.workers = []
+        for _ in range(2):
+            cache = TTLCache(ttl=3600, timer=self.timer)
+            channel = InvalidationChannel(FileGenerationCounter(path), poll_interval=1, timer=self.timer)
+            channel.subscribe(cache)
+            self.workers.append((InvalidatingServiceStore(backend, channel=channel),
+                                 CapabilitiesCache(cache, timer=self.timer, channel=channel)))
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_register_service_in_other_worker(self):
+        (_, capscache1), (store2, _) = self.workers
+        capscache1.cache.set('emu', CachedResponse(b'<Capabilities/>'))
+        assert capscache1.get('emu')[0] is not None
+        store2.save_service(Service(url='http://localhost:8094/wps', name='emu'))
+        self.timer.now += 1
+        assert capscache1.get('emu') == (None, False)
+
+    def test_register_service_in_same_worker(self):
+        store, capscache = self.workers[0]
+        store.save_service(Service(url='http://localhost:8094/wps', name='emu'))
+        capscache.cache.set('emu', CachedResponse(b'<Capabilities/>'))
+        store.delete_service('emu')
+        assert capscache.get('emu') == (None, False)
+
+
+@pytest.mark.online
+def test_mongodb_generation_counter():
+    from twitcher.db import mongodb
+    from twitcher.tests.functional.common import setup_with_mongodb
+    config = setup_with_mongodb()
+    try:
+        collection = mongodb(config.registry).generations
+        collection.drop()
+        counter = MongodbGenerationCounter(collection)
+        assert counter.get() == 0
+        counter.increment()
+        assert counter.get() == 1
+    finally:
+        testing.tearDown()
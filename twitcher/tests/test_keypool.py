@@ -0,0 +1,62 @@
+import time
+import unittest
+
+from pyramid import testing
+
+from twitcher.keypool import KeyPool, keypool_factory
+from twitcher.stats import collect_stats
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class KeyPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.count = [0]
+
+        def generate(bits):
+            self.count[0] += 1
+            return ('key', bits, self.count[0])
+        self.pool = KeyPool(size=2, bits=1024, generate=generate)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_inline_when_empty(self):
+        # without a background thread
+        self.pool.close()
+        assert self.pool.get() == ('key', 1024, 1)
+        assert self.pool.stats() == {'size': 2, 'available': 0, 'hits': 0, 'misses': 1, 'generated': 0}
+
+    def test_refill(self):
+        self.pool._start()
+        assert wait_for(lambda: self.pool.stats()['available'] == 2)
+        key = self.pool.get()
+        assert key[0] == 'key'
+        stats = self.pool.stats()
+        assert stats['hits'] == 1
+        # refilled up to the size of the pool
+        assert wait_for(lambda: self.pool.stats()['available'] == 2)
+        assert stats['size'] == 2
+
+    def test_factory(self):
+        config = testing.setUp(settings={'twitcher.esgf_key_pool_size': '3'})
+        try:
+            keypool = keypool_factory(config.registry)
+            assert keypool.size == 3
+            assert keypool_factory(config.registry) is keypool
+            assert collect_stats(config.registry)['esgf_key_pool']['available'] == 0
+        finally:
+            testing.tearDown()
+
+    def test_factory_disabled(self):
+        config = testing.setUp(settings={'twitcher.esgf_key_pool_size': '0'})
+        try:
+            assert keypool_factory(config.registry) is None
+        finally:
+            testing.tearDown()
@@ -6,14 +6,21 @@ pyramid testing:
 * http://docs.pylonsproject.org/projects/pyramid/en/latest/quick_tutorial/routing.html
 """
 
+import io
+import hashlib
 import unittest
+import mock
 
 from pyramid import testing
+from pyramid.request import Request
 from pyramid.testing import DummyRequest
 
+from twitcher.datatype import Service
 from twitcher.owsexceptions import OWSAccessFailed
 from twitcher import owsproxy
 from twitcher.owsproxy import owsproxy as owsproxy_view
+from twitcher.owsproxy import RequestBody, request_body, _send_request
+from twitcher.tests.common import StubHandler, stub_server, server_url
 
 
 class OWSProxyTests(unittest.TestCase):
@@ -34,3 +41,75 @@ class OWSProxyTests(unittest.TestCase):
                                params={'url': 'http://'})
         response = owsproxy_view(request)
         assert isinstance(response, OWSAccessFailed) is True
+
+
+    def test_service_of_security_tween(self):
+        request = DummyRequest(scheme='http', params={'service': 'wps', 'request': 'getcapabilities'})
+        request.matchdict = {'service_name': 'emu'}
+        request.ows_service = Service(name='emu', url='http://localhost:5000/wps', type='wps')
+        with mock.patch('twitcher.owsproxy.servicestore_factory') as store, \
+                mock.patch('twitcher.owsproxy._send_request', return_value='response') as send_request:
+            assert owsproxy_view(request) == 'response'
+        assert store.call_count == 0
+        assert send_request.call_args[0][1] is request.ows_service
+
+
+class EchoHandler(StubHandler):
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        self.server.received = (self.headers.get('Transfer-Encoding'), length, hashlib.md5(body).hexdigest())
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+
+class RequestBodyTests(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp(settings={'twitcher.request_body_tempfile_limit': '1024',
+                                              'twitcher.cache_invalidation': 'none'})
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def blank(self, path, **kwargs):
+        request = Request.blank(path, **kwargs)
+        request.registry = self.config.registry
+        return request
+
+    def test_no_body(self):
+        assert request_body(self.blank('/ows/proxy/emu?service=wps&request=getcapabilities')) is None
+
+    def test_content_length(self):
+        request = self.blank('/ows/proxy/emu', POST=b'<Execute/>' * 1000)
+        request.is_body_seekable = False
+        body = request_body(request)
+        assert isinstance(body, RequestBody)
+        assert len(body) == 10000
+        # nothing is read before the body is sent
+        assert request.environ['wsgi.input'].tell() == 0
+        assert body.read(10) == b'<Execute/>'
+
+    def test_chunked(self):
+        request = self.blank('/ows/proxy/emu', method='POST')
+        request.environ.update({'wsgi.input': io.BytesIO(b'<Execute/>' * 1000), 'wsgi.input_terminated': True,
+                                'HTTP_TRANSFER_ENCODING': 'chunked'})
+        request.content_length = None
+        request.is_body_seekable = False
+        body = request_body(request)
+        # spooled to a temporary file larger than the limit
+        assert not isinstance(body, io.BytesIO)
+        assert request.content_length == 10000
+        assert body.read() == b'<Execute/>' * 1000
+
+    def test_send_request(self):
+        with stub_server(EchoHandler) as server:
+            url = server_url(server, '/wps')
+            content = b'<Execute>' + b'x' * 3 * 1024 * 1024 + b'</Execute>'
+            request = self.blank('/ows/proxy/emu', POST=content, content_type='text/xml')
+            request.is_body_seekable = False
+            response = _send_request(request, Service(name='emu', url=url, type='wps'))
+            assert b''.join(response.app_iter) == b'{}'
+            assert server.received == (None, len(content), hashlib.md5(content).hexdigest())
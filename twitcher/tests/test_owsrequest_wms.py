@@ -2,6 +2,7 @@ import pytest
 import unittest
 
 from pyramid import testing
+from pyramid.request import Request
 from pyramid.testing import DummyRequest
 
 from twitcher.owsrequest import OWSRequest
@@ -49,3 +50,13 @@ class OWSRequestWmsTestCase(unittest.TestCase):
         assert ows_req.version == '1.3.0'
 
 
+
+    def test_get_params_index(self):
+        request = Request.blank('/ows/proxy/wms?service=WMS&request=GetMap&VERSION=1.1.1&version=1.3.0')
+        request.registry = self.config.registry
+        ows_req = OWSRequest(request)
+        assert ows_req.request == 'getmap'
+        # the last value wins
+        assert ows_req.version == '1.3.0'
+        # the index is built once
+        assert ows_req.parser.request_params is ows_req.parser.request_params
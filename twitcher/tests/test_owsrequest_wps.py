@@ -3,10 +3,11 @@ import unittest
 import mock
 
 from pyramid import testing
+from pyramid.request import Request
 from pyramid.testing import DummyRequest
 
 from twitcher.owsrequest import OWSRequest
-from twitcher.owsexceptions import OWSInvalidParameterValue, OWSMissingParameterValue
+from twitcher.owsexceptions import OWSInvalidParameterValue, OWSMissingParameterValue, OWSNoApplicableCode
 
 
 class OWSRequestWpsTestCase(unittest.TestCase):
@@ -135,3 +136,23 @@ class OWSRequestWpsTestCase(unittest.TestCase):
         assert ows_req.request == 'execute'
         assert ows_req.service == 'wps'
         assert ows_req.version == '1.0.0'
+
+    def test_post_large_execute_request(self):
+        body = b'<wps:Execute service="WPS" version="1.0.0" xmlns:wps="http://www.opengis.net/wps/1.0.0">' + \
+            b'<wps:DataInputs>' + b'<wps:Input/>' * 100000
+        # the document is not read after the root element
+        body += b'<not xml'
+        request = Request.blank('/ows/proxy/emu', POST=body, content_type='text/xml')
+        request.registry = self.config.registry
+        ows_req = OWSRequest(request)
+        assert ows_req.request == 'execute'
+        assert ows_req.service == 'wps'
+        assert ows_req.version == '1.0.0'
+        # the body is rewound for the request to the service
+        assert request.body_file.read() == body
+
+    def test_post_invalid_request(self):
+        request = DummyRequest(post={})
+        request.body = "GetCapabilities"
+        with pytest.raises(OWSNoApplicableCode):
+            OWSRequest(request)
@@ -53,6 +53,47 @@ class OWSSecurityTestCase(unittest.TestCase):
         request.registry.settings = {'twitcher.ows_prox_protected_path': '/ows'}
         self.security.check_request(request)
 
+    def test_check_request_properties(self):
+        params = dict(request="Execute", service="WPS", version="1.0.0", token="cdefg")
+        request = DummyRequest(params=params, path='/ows/proxy/test_wps')
+        request.registry = Registry()
+        request.registry.settings = {}
+        self.security.check_request(request)
+        # the views reuse the parsed request, the service and the token
+        assert request.ows_request.request == 'execute'
+        assert request.ows_service.name == 'test_wps'
+        assert request.access_token.token == "cdefg"
+
+    def test_get_service(self):
+        request = DummyRequest(path='/ows/proxy/test_wps/extra')
+        request.registry = Registry()
+        request.registry.settings = {}
+        assert self.security.get_service(request).name == 'test_wps'
+        request = DummyRequest(path='/ows/proxy/unknown')
+        request.registry = Registry()
+        request.registry.settings = {}
+        assert self.security.get_service(request) is None
+
+    def test_get_access_token(self):
+        request = DummyRequest(params=dict(token="cdefg"))
+        assert self.security.get_access_token(request) == self.access_token
+        request = DummyRequest(params=dict(token="xyz"))
+        assert self.security.get_access_token(request) is None
+
+    def test_prepare_headers(self):
+        credentials = mock.Mock(spec=['workdir'])
+        credentials.workdir.return_value = '/tmp/twitcher_esgf'
+        security = OWSSecurity(tokenstore=self.tokenstore, servicestore=self.servicestore, credentials=credentials)
+        request = DummyRequest()
+        request.workdir = '/tmp'
+        request.prefix = 'twitcher_'
+        access_token = AccessToken(token="cdefg", expires_at=1000, data={'esgf_access_token': 'abc'})
+        security.prepare_headers(request, access_token)
+        credentials.workdir.assert_called_once_with(access_token.data, workdir='/tmp', prefix='twitcher_',
+                                                    expires_at=1000)
+        assert request.headers['X-Requested-Workdir'] == '/tmp/twitcher_esgf'
+        assert request.headers['X-X509-User-Proxy'] == '/tmp/twitcher_esgf/credentials.pem'
+
     def test_check_request_invalid(self):
         security = OWSSecurity(tokenstore=self.empty_tokenstore, servicestore=self.servicestore)
 
@@ -92,3 +133,39 @@ class OWSSecurityTestCase(unittest.TestCase):
         request.registry = Registry()
         request.registry.settings = {'twitcher.ows_prox_protected_path': '/ows'}
         security.check_request(request)
+
+
+from twitcher.tokengenerator import HmacTokenGenerator
+from twitcher.revocation import RevocationList
+from twitcher.store.memory import MemoryRevokedTokenStore
+
+
+class OWSSecuritySignedTokenTestCase(unittest.TestCase):
+    def setUp(self):
+        self.generator = HmacTokenGenerator(secret='my secret')
+        self.access_token = self.generator.create_access_token()
+        self.revocationlist = RevocationList(MemoryRevokedTokenStore())
+        servicestore = MemoryServiceStore()
+        servicestore.save_service(Service(url='http://nowhere/wps', name='test_wps', public=False))
+        # signed tokens are verified without the token store
+        self.security = OWSSecurity(tokenstore=MemoryTokenStore(), servicestore=servicestore,
+                                    tokengenerator=self.generator, revocationlist=self.revocationlist)
+
+    def _request(self, token):
+        params = dict(request="Execute", service="WPS", version="1.0.0", token=token)
+        request = DummyRequest(params=params, path='/ows/proxy/test_wps')
+        request.registry = Registry()
+        request.registry.settings = {}
+        return request
+
+    def test_check_request(self):
+        self.security.check_request(self._request(self.access_token.token))
+
+    def test_check_request_tampered(self):
+        with pytest.raises(OWSAccessForbidden):
+            self.security.check_request(self._request(self.access_token.token + 'x'))
+
+    def test_check_request_revoked(self):
+        self.revocationlist.revoke(self.access_token.token, expires_at=self.access_token.expires_at)
+        with pytest.raises(OWSAccessForbidden):
+            self.security.check_request(self._request(self.access_token.token))
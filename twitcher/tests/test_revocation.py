@@ -0,0 +1,68 @@
+import unittest
+import mock
+
+from twitcher.datatype import AccessToken
+from twitcher.revocation import RevocationList
+from twitcher.store.memory import MemoryRevokedTokenStore
+from twitcher.utils import expires_at
+
+
+class Timer(object):
+    def __init__(self):
+        self.now = 1000
+
+    def __call__(self):
+        return self.now
+
+
+class RevocationListTestCase(unittest.TestCase):
+    def setUp(self):
+        self.timer = Timer()
+        self.store = MemoryRevokedTokenStore()
+        self.revocationlist = RevocationList(self.store, refresh_interval=1, timer=self.timer)
+        self.access_token = AccessToken(token='abc', issued_at=900, expires_at=2000)
+
+    def test_revoke(self):
+        assert self.revocationlist.is_revoked(self.access_token) is False
+        self.revocationlist.revoke('abc', expires_at=2000)
+        assert self.revocationlist.is_revoked(self.access_token) is True
+        assert self.store.fetch_revocations()[0]['token'] == 'abc'
+
+    def test_revoke_all(self):
+        self.revocationlist.revoke_all()
+        assert self.revocationlist.is_revoked(self.access_token) is True
+        new_token = AccessToken(token='def', issued_at=self.timer.now + 1, expires_at=2000)
+        assert self.revocationlist.is_revoked(new_token) is False
+
+    def test_refresh_from_store(self):
+        # revoked by another worker process
+        other = RevocationList(self.store, timer=self.timer)
+        assert self.revocationlist.is_revoked(self.access_token) is False
+        other.revoke('abc', expires_at=2000)
+        assert self.revocationlist.is_revoked(self.access_token) is False
+        self.timer.now += 1
+        assert self.revocationlist.is_revoked(self.access_token) is True
+
+    def test_incremental_refresh(self):
+        self.revocationlist.revoke('abc', expires_at=2000)
+        with mock.patch.object(self.store, 'fetch_revocations', return_value=[]) as fetch:
+            self.timer.now += 1
+            self.revocationlist.refresh()
+            fetch.assert_called_with(since=1000 - self.revocationlist.margin)
+
+    def test_expired_revocations_are_dropped(self):
+        revocationlist = RevocationList(self.store, prune_interval=10, timer=self.timer)
+        revocationlist.revoke('abc', expires_at=1001)
+        revocationlist.revoke('def', expires_at=5000)
+        self.timer.now += 10
+        revocationlist.refresh()
+        assert revocationlist.tokens == {'def': 5000}
+        assert revocationlist.is_revoked(AccessToken(token='abc')) is False
+
+    def test_many_revocations(self):
+        revocationlist = RevocationList(self.store, timer=self.timer)
+        for i in range(100):
+            revocationlist.revoke('token{}'.format(i), expires_at=2000)
+        assert all(revocationlist.is_revoked(AccessToken(token='token{}'.format(i))) for i in range(100))
+        assert revocationlist.stats()['tokens'] == 100
+
@@ -0,0 +1,82 @@
+import unittest
+
+from pyramid import testing
+
+from twitcher.sessions import SessionRegistry, session_registry_factory
+from twitcher.stats import collect_stats
+from twitcher.tests.common import StubHandler, start_server, stop_server, server_url
+
+
+class KeepAliveHandler(StubHandler):
+    def do_GET(self):
+        body = b'<Capabilities/>'
+        self.server.cookies.append(self.headers.get('Cookie'))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Set-Cookie', 'JSESSIONID=alice-session; Path=/')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class SessionRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = start_server(KeepAliveHandler)
+        self.server.cookies = []
+        self.url = server_url(self.server, '/wms')
+
+    def tearDown(self):
+        stop_server(self.server)
+
+    def test_session_per_host(self):
+        sessions = SessionRegistry()
+        session = sessions.session('http://localhost:8094/wps')
+        assert sessions.session('HTTP://LOCALHOST:8094/ncwms?service=wms') is session
+        assert sessions.session('https://localhost:8094/wps') is not session
+        assert sessions.session('http://localhost:8095/wps') is not session
+
+    def test_max_hosts(self):
+        sessions = SessionRegistry(max_hosts=2)
+        session = sessions.session('http://one/wps')
+        sessions.session('http://two/wps')
+        sessions.session('http://three/wps')
+        assert sessions.stats()['hosts'] == 2
+        assert sessions.session('http://one/wps') is not session
+
+    def test_connection_is_reused(self):
+        sessions = SessionRegistry()
+        for _ in range(3):
+            resp = sessions.request('GET', self.url)
+            assert resp.content == b'<Capabilities/>'
+        assert sessions.stats() == {'hosts': 1, 'requests': 3, 'connections': 1, 'reused': 2}
+        sessions.close()
+        assert sessions.stats() == {'hosts': 0, 'requests': 3, 'connections': 1, 'reused': 2}
+
+    def test_no_keep_alive(self):
+        sessions = SessionRegistry(keep_alive=False)
+        resp = sessions.request('GET', self.url)
+        assert resp.request.headers['Connection'] == 'close'
+
+    def test_cookies_are_not_shared(self):
+        sessions = SessionRegistry()
+        try:
+            # the first client gets a session cookie of the service
+            resp = sessions.request('GET', self.url)
+            assert resp.cookies['JSESSIONID'] == 'alice-session'
+            # which is not sent with the request of the next client
+            sessions.request('GET', self.url)
+            assert self.server.cookies == [None, None]
+            assert len(sessions.session(self.url).cookies) == 0
+        finally:
+            sessions.close()
+
+    def test_factory(self):
+        config = testing.setUp(settings={'twitcher.http_pool_maxsize': '2'})
+        try:
+            sessions = session_registry_factory(config.registry)
+            assert sessions.pool_maxsize == 2
+            assert session_registry_factory(config.registry) is sessions
+            assert collect_stats(config.registry)['http_sessions']['hosts'] == 0
+        finally:
+            testing.tearDown()
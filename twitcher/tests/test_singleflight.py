@@ -0,0 +1,73 @@
+import threading
+import unittest
+
+import pytest
+
+from twitcher.singleflight import SingleFlight, request_key
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.singleflight = SingleFlight()
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.count = 0
+
+    def fetch(self):
+        self.count += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.count > 10:
+            raise ValueError('too many calls')
+        return b'<Capabilities/>'
+
+    def run_concurrently(self, key, num=10):
+        results = []
+
+        def call():
+            try:
+                results.append(self.singleflight.do(key, self.fetch))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(num)]
+        threads[0].start()
+        self.started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # wait until all callers share the running call
+        while self.singleflight.stats()['shared'] < num - 1:
+            threading.Event().wait(0.001)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_concurrent_calls_are_coalesced(self):
+        results = self.run_concurrently('key')
+        assert results == [b'<Capabilities/>'] * 10
+        assert self.count == 1
+        assert self.singleflight.stats() == {'calls': 1, 'shared': 9, 'running': 0}
+
+    def test_error_is_shared(self):
+        self.count = 10
+        results = self.run_concurrently('key', num=3)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert self.count == 11
+
+    def test_sequential_calls(self):
+        self.release.set()
+        self.singleflight.do('key', self.fetch)
+        self.singleflight.do('key', self.fetch)
+        assert self.count == 2
+        with pytest.raises(ValueError):
+            self.singleflight.do('other', lambda: int('x'))
+
+
+def test_request_key():
+    key = request_key('get', 'http://localhost/wms?request=GetMap', {'Accept': 'image/png', 'User-Agent': 'a'})
+    assert key == request_key('GET', 'http://localhost/wms?request=GetMap', {'accept': 'image/png'})
+    assert key != request_key('GET', 'http://localhost/wms?request=GetMap', {'Accept': 'image/png',
+                                                                           'Authorization': 'Basic abc'})
+    assert key != request_key('GET', 'http://localhost/wms?request=GetCapabilities', {'Accept': 'image/png'})
@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+
+from pyramid import testing
+from pyramid.request import Request
+from pyramid.testing import DummyRequest
+
+from twitcher.datatype import Service
+from twitcher.owsproxy import _send_request
+from twitcher.tilecache import TileCache, tile_key
+
+SERVICE = Service(name='ncwms', url='http://localhost:8080/ncWMS2/wms', type='wms', tile_cache=True)
+
+GETMAP = {'SERVICE': 'WMS', 'REQUEST': 'GetMap', 'VERSION': '1.3.0', 'LAYERS': 'tasmax', 'STYLES': '',
+          'CRS': 'EPSG:4326', 'BBOX': '-90,0,0,90', 'WIDTH': '256', 'HEIGHT': '256', 'FORMAT': 'image/png'}
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 100
+
+
+def getmap(**params):
+    query = dict(GETMAP)
+    query.update(params)
+    return DummyRequest(params=query)
+
+
+class TileKeyTest(unittest.TestCase):
+
+    def test_canonical(self):
+        key = tile_key(getmap(), SERVICE)
+        assert key[1] == 'image/png'
+        params = dict((name.lower(), value) for name, value in GETMAP.items())
+        params['request'] = 'getmap'
+        assert tile_key(DummyRequest(params=params), SERVICE) == key
+        assert tile_key(getmap(BBOX='-90.0000000001,0,0,90.00000000002'), SERVICE) == key
+        assert tile_key(getmap(access_token='abc'), SERVICE) == key
+        assert tile_key(getmap(token='abc'), SERVICE) == key
+
+    def test_other_tile(self):
+        key = tile_key(getmap(), SERVICE)
+        assert tile_key(getmap(BBOX='-90,90,0,180'), SERVICE) != key
+        assert tile_key(getmap(BBOX='-45,0,0,45'), SERVICE) != key
+        assert tile_key(getmap(LAYERS='tasmin'), SERVICE) != key
+        assert tile_key(getmap(), SERVICE, extra_path='other') != key
+
+    def test_not_cacheable(self):
+        assert tile_key(getmap(REQUEST='GetFeatureInfo'), SERVICE) is None
+        assert tile_key(getmap(FORMAT='application/json'), SERVICE) is None
+        assert tile_key(getmap(BBOX='0,0,0,0'), SERVICE) is None
+        assert tile_key(getmap(BBOX='a,b'), SERVICE) is None
+
+
+class TileCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = testing.setUp(settings={'twitcher.tile_cache_dir': self.directory,
+                                              'twitcher.cache_invalidation': 'none'})
+        self.config.add_route('owsproxy', '/ows/proxy/{service_name}')
+
+    def tearDown(self):
+        testing.tearDown()
+        shutil.rmtree(self.directory)
+
+    def test_store_and_response(self):
+        cache = TileCache(self.directory)
+        assert cache.response(getmap(), 'abc', 'image/png') is None
+        cache.store('abc', 'image/png', PNG)
+        response = cache.response(getmap(), 'abc', 'image/png')
+        assert response.content_type == 'image/png'
+        assert b''.join(response.app_iter) == PNG
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'files': 1, 'kbytes': 0}
+
+    def test_lru(self):
+        cache = TileCache(self.directory, max_bytes=250)
+        cache.store('aaa', 'image/png', PNG)
+        cache.store('bbb', 'image/png', PNG)
+        assert cache.response(getmap(), 'aaa', 'image/png') is not None
+        cache.store('ccc', 'image/png', PNG)
+        assert os.path.exists(cache.path('aaa', 'image/png'))
+        assert not os.path.exists(cache.path('bbb', 'image/png'))
+        # the size is restored from the files
+        os.remove(os.path.join(self.directory, 'index'))
+        assert TileCache(self.directory).stats()['files'] == 2
+
+    def test_shared_by_workers(self):
+        worker1 = TileCache(self.directory, max_bytes=350)
+        worker2 = TileCache(self.directory, max_bytes=350)
+        worker1.store('aaa', 'image/png', PNG)
+        worker2.store('bbb', 'image/png', PNG)
+        worker1.store('ccc', 'image/png', PNG)
+        assert worker2.stats()['files'] == 3
+        # a hit in one worker is seen by the other
+        assert worker2.response(getmap(), 'aaa', 'image/png') is not None
+        # the size of the tiles of both workers is bounded
+        worker2.store('ddd', 'image/png', PNG)
+        assert not os.path.exists(worker1.path('bbb', 'image/png'))
+        assert os.path.exists(worker1.path('aaa', 'image/png'))
+        assert worker1.stats()['files'] == 2
+        total = sum(len(files) for _, _, files in os.walk(self.directory)) - 1
+        assert total == 2
+
+    def test_replace(self):
+        cache = TileCache(self.directory)
+        cache.store('aaa', 'image/png', PNG)
+        cache.store('aaa', 'image/png', PNG * 20)
+        assert cache.stats()['files'] == 1
+        with open(os.path.join(self.directory, 'index')) as fh:
+            assert fh.read() == '1 {}'.format(len(PNG) * 20)
+
+    def test_send_request(self):
+        resp = mock.Mock()
+        resp.status_code = 200
+        resp.content = PNG
+        resp.headers = {'Content-Type': 'image/png'}
+        sessions = mock.Mock(spec=['request'])
+        sessions.request.return_value = resp
+        with mock.patch('twitcher.owsproxy.session_registry_factory', return_value=sessions):
+            for _ in range(3):
+                response = _send_request(getmap(), SERVICE)
+                assert response.body == PNG
+            assert sessions.request.call_count == 1
+            # not enabled for this service
+            request = Request.blank('/ows/proxy/ncwms')
+            request.registry = self.config.registry
+            _send_request(request, Service(SERVICE, tile_cache=False))
+            assert sessions.request.call_count == 2
+
+    def test_service_exception(self):
+        resp = mock.Mock()
+        resp.status_code = 200
+        resp.content = b'<ServiceExceptionReport/>'
+        resp.headers = {'Content-Type': 'application/vnd.ogc.se_xml', 'X-Layer': 'tasmax'}
+        sessions = mock.Mock(spec=['request'])
+        sessions.request.return_value = resp
+        with mock.patch('twitcher.owsproxy.session_registry_factory', return_value=sessions):
+            for _ in range(2):
+                response = _send_request(getmap(), SERVICE)
+                # passed on with the headers of the service
+                assert response.body == b'<ServiceExceptionReport/>'
+                assert response.headers['X-Layer'] == 'tasmax'
+            # and not cached
+            assert sessions.request.call_count == 2
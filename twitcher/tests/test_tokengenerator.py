@@ -26,3 +26,60 @@ class UuidTokenGeneratorTestCase(unittest.TestCase):
         access_token = self.generator.create_access_token(valid_in_hours=2)
         assert len(access_token.token) == 32
         assert access_token.expires_in <= 3600 * 2
+
+
+from pyramid.testing import Registry
+
+from twitcher.exceptions import AccessTokenNotFound
+from twitcher.tokengenerator import HmacTokenGenerator, tokengenerator_factory, _b64decode
+
+
+class HmacTokenGeneratorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.generator = HmacTokenGenerator(secret='my secret')
+
+    def test_create_and_verify(self):
+        access_token = self.generator.create_access_token(valid_in_hours=2, data={'esgf_token': 'abc'})
+        assert access_token.expires_in <= 3600 * 2
+        verified = self.generator.verify(access_token.token)
+        assert verified.token == access_token.token
+        assert verified.expires_at == access_token.expires_at
+        assert verified.issued_at == access_token.issued_at
+        assert verified.data == {'esgf_token': 'abc'}
+
+    def test_data_is_encrypted(self):
+        access_token = self.generator.create_access_token(data={'esgf_access_token': 'my-esgf-secret'})
+        payload, _ = access_token.token.split('.')
+        # the secret can't be read from the token passed in urls
+        assert 'my-esgf-secret' not in access_token.token
+        assert b'my-esgf-secret' not in _b64decode(payload)
+        assert b'esgf_access_token' not in _b64decode(payload)
+        assert self.generator.verify(access_token.token).data == {'esgf_access_token': 'my-esgf-secret'}
+
+    def test_verify_unicode_token(self):
+        access_token = self.generator.create_access_token()
+        assert self.generator.verify(u'' + access_token.token).token == access_token.token
+
+    def test_verify_tampered_token(self):
+        access_token = self.generator.create_access_token()
+        payload, signature = access_token.token.split('.')
+        with pytest.raises(AccessTokenNotFound):
+            self.generator.verify(payload + 'x.' + signature)
+        with pytest.raises(AccessTokenNotFound):
+            HmacTokenGenerator(secret='other secret').verify(access_token.token)
+
+    def test_verify_not_signed_token(self):
+        assert self.generator.verify(UuidTokenGenerator().generate()) is None
+        assert self.generator.verify(None) is None
+
+    def test_secret_is_required(self):
+        with pytest.raises(ValueError):
+            HmacTokenGenerator(secret=None)
+
+
+def test_tokengenerator_factory():
+    registry = Registry()
+    registry.settings = {}
+    assert isinstance(tokengenerator_factory(registry), UuidTokenGenerator)
+    registry.settings = {'twitcher.token_generator': 'hmac', 'twitcher.token_secret': 'my secret'}
+    assert isinstance(tokengenerator_factory(registry), HmacTokenGenerator)
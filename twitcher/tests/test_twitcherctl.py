@@ -0,0 +1,42 @@
+import io
+import pytest
+import mock
+
+from twitcher import twitcherctl
+from twitcher.twitcherctl import file_format, load_services, dump_services
+
+SERVICES = [{'name': 'emu', 'url': 'http://localhost:5000/wps', 'type': 'wps', 'public': False,
+             'auth': 'token', 'tile_cache': False}]
+
+
+def test_file_format():
+    assert file_format('services.json') == 'json'
+    assert file_format('services.yml') == 'yaml'
+    assert file_format('SERVICES.YAML') == 'yaml'
+    assert file_format('-') == 'json'
+    assert file_format('-', 'yaml') == 'yaml'
+
+
+@pytest.mark.parametrize('fmt', ['json', 'yaml'])
+def test_dump_and_load(fmt):
+    if fmt == 'yaml':
+        # PyYAML is an optional dependency
+        pytest.importorskip('yaml')
+    fp = io.BytesIO()
+    dump_services(SERVICES, fp, fmt)
+    fp.seek(0)
+    assert load_services(fp, fmt) == SERVICES
+
+
+def test_yaml_not_installed():
+    with mock.patch.object(twitcherctl, 'yaml', None):
+        with pytest.raises(Exception) as e:
+            load_services(io.BytesIO(b'- name: emu'), 'yaml')
+    assert 'PyYAML' in str(e.value)
+
+
+def test_migrate():
+    ctl = twitcherctl.TwitcherCtl()
+    with mock.patch.object(twitcherctl, 'TwitcherService') as service:
+        service.return_value.migrate.return_value = True
+        assert ctl.run(ctl.create_parser().parse_args(['migrate'])) is True
@@ -80,3 +80,37 @@ def test_replace_caps_url_wms_130():
     xml = utils.replace_caps_url(xml, "https://localhost/ows/proxy/wms")
     # assert 'http://localhost:8080/ncWMS2/wms' not in xml
     assert 'https://localhost/ows/proxy/wms' in xml
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('path', [WPS_CAPS_EMU_XML, WMS_CAPS_NCWMS2_111_XML, WMS_CAPS_NCWMS2_130_XML])
+def test_iter_replace_caps_url_chunked(path):
+    with open(path, 'rb') as fp:
+        xml = fp.read()
+    expected = utils.replace_caps_url(xml, "https://localhost/ows/proxy/emu")
+    for size in (1, 7, 4096):
+        chunks = utils.iter_replace_caps_url(_chunks(xml, size), "https://localhost/ows/proxy/emu")
+        assert b''.join(chunks) == expected
+
+
+def test_iter_replace_caps_url_wms():
+    xml = b'<?xml version="1.0"?>\n<!-- <OnlineResource xlink:href="http://localhost:8080/a"/> -->\n' \
+          b'<WMS_Capabilities xmlns:xlink="http://www.w3.org/1999/xlink">' \
+          b'<OnlineResource xlink:href="http://localhost:8080/wms?REQUEST=GetLegendGraphic&amp;STYLES=a"/>' \
+          b'<Title>http://localhost:8080/wms</Title></WMS_Capabilities>'
+    result = b''.join(utils.iter_replace_caps_url(_chunks(xml, 5), "https://localhost/ows/proxy/wms"))
+    assert b'xlink:href="https://localhost/ows/proxy/wms?REQUEST=GetLegendGraphic&amp;STYLES=a"' in result
+    # comments and text are not changed
+    assert b'<!-- <OnlineResource xlink:href="http://localhost:8080/a"/> -->' in result
+    assert b'<Title>http://localhost:8080/wms</Title>' in result
+
+
+def test_iter_replace_caps_url_prev_url():
+    xml = b'<ExecuteResponse><Reference href="http://localhost:8094/wps/outputs/a.nc"/></ExecuteResponse>'
+    result = b''.join(utils.iter_replace_caps_url(
+        _chunks(xml, 3), "https://localhost/ows/proxy/emu", "http://localhost:8094/wps"))
+    assert result == b'<ExecuteResponse><Reference href="https://localhost/ows/proxy/emu/outputs/a.nc"/>' \
+                     b'</ExecuteResponse>'
@@ -0,0 +1,125 @@
+import os
+import time
+import fcntl
+import shutil
+import tempfile
+import unittest
+
+from pyramid import testing
+
+from twitcher._compat import xmlrpclib
+from twitcher.stats import collect_stats
+from twitcher.workdirs import WorkdirManager, workdirs_factory, expires_at
+
+
+class WorkdirManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.now = [time.time()]
+        self.workdirs = WorkdirManager(self.workdir, grace=60, max_age=3600, interval=0, timer=lambda: self.now[0])
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def _create(self, expires=None, size=0):
+        path = self.workdirs.create()
+        with open(os.path.join(path, 'credentials.pem'), 'wb') as fh:
+            fh.write(b'x' * size)
+        if expires is not None:
+            self.workdirs.expire_at(path, expires)
+        return path
+
+    def test_create(self):
+        path = self.workdirs.create()
+        assert os.path.isdir(path)
+        assert os.path.basename(path).startswith('twitcher_')
+        assert os.path.dirname(path) == self.workdir
+        assert expires_at(path) is None
+
+    def test_expire_at(self):
+        path = self._create(expires=self.now[0] + 100)
+        assert expires_at(path) == int(self.now[0] + 100)
+        # the workdir is kept for the token which expires last
+        self.workdirs.expire_at(path, self.now[0] + 50)
+        assert expires_at(path) == int(self.now[0] + 100)
+        self.workdirs.expire_at(path, self.now[0] + 200)
+        assert expires_at(path) == int(self.now[0] + 200)
+
+    def test_sweep(self):
+        expired = self._create(expires=self.now[0] + 100, size=1000)
+        valid = self._create(expires=self.now[0] + 1000)
+        assert self.workdirs.sweep() == (0, 0)
+        # kept during the grace period
+        self.now[0] += 150
+        assert self.workdirs.sweep() == (0, 0)
+        self.now[0] += 20
+        # the size includes the expiry file
+        assert self.workdirs.sweep() == (1, 1000 + len(str(int(self.now[0]))))
+        assert not os.path.exists(expired)
+        assert os.path.isdir(valid)
+        # two workdirs and the lock file
+        stats = self.workdirs.stats()
+        assert (stats['created'], stats['sweeps'], stats['scanned'], stats['removed']) == (2, 3, 9, 1)
+        assert stats['reclaimed_kbytes'] == 0
+        assert self.workdirs.reclaimed_bytes > 1000
+
+    def test_sweep_without_expiry(self):
+        path = self._create()
+        assert self.workdirs.sweep() == (0, 0)
+        # workdirs of older versions are removed after max_age
+        self.now[0] += 3600 + 61
+        assert self.workdirs.sweep()[0] == 1
+        assert not os.path.exists(path)
+
+    def test_sweep_batch(self):
+        self.workdirs.batch_size = 2
+        for _ in range(5):
+            self._create(expires=self.now[0])
+        self.now[0] += 61
+        removed = [self.workdirs.sweep()[0] for _ in range(3)]
+        assert max(removed) <= 2
+        assert sum(removed) == 5
+        assert self.workdirs.stats()['scanned'] == 6
+        assert os.listdir(self.workdir) == ['twitcher_sweep.lock']
+
+    def test_sweep_links(self):
+        path = self._create(expires=self.now[0])
+        link = os.path.join(self.workdir, 'twitcher_esgf_abc')
+        os.symlink(path, link)
+        other = os.path.join(self.workdir, 'other')
+        os.mkdir(other)
+        self.now[0] += 61
+        # the link is removed with its workdir
+        self.workdirs.sweep()
+        self.workdirs.sweep()
+        assert not os.path.lexists(link)
+        # only directories with the prefix are removed
+        assert os.path.isdir(other)
+
+    def test_sweep_locked(self):
+        self._create(expires=self.now[0])
+        self.now[0] += 61
+        with open(os.path.join(self.workdir, 'twitcher_sweep.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # another process is sweeping
+            assert self.workdirs.sweep() == (0, 0)
+        assert self.workdirs.sweep()[0] == 1
+
+
+def test_workdirs_factory():
+    config = testing.setUp(settings={'twitcher.workdir': '/tmp/twitcher', 'twitcher.workdir_sweep_interval': '0'})
+    try:
+        workdirs = workdirs_factory(config.registry)
+        assert workdirs_factory(config.registry) is workdirs
+        assert workdirs.workdir == '/tmp/twitcher'
+        assert workdirs.interval == 0
+        assert collect_stats(config.registry)['workdirs']['removed'] == 0
+        # more than 2 GB reclaimed
+        workdirs.reclaimed_bytes = 3 * 1024 ** 3
+        stats = collect_stats(config.registry)
+        assert stats['workdirs']['reclaimed_kbytes'] == 3 * 1024 ** 2
+        # the stats can be sent with XML-RPC
+        assert xmlrpclib.loads(xmlrpclib.dumps((stats, )))[0][0] == stats
+    finally:
+        testing.tearDown()
@@ -0,0 +1,263 @@
+"""
+Disk cache of WMS GetMap responses (tiles) of the OWS proxy.
+
+Web map clients request the same tiles over and over. When the cache is enabled
+(setting ``twitcher.tile_cache_dir``) the tiles of services registered with the
+``tile_cache`` flag are stored on disk and served from there. The cache is shared
+by all worker processes on a host and its size is bounded: the least recently used
+tiles are removed first.
+
+The number and size of the cached tiles of all workers are kept in the file ``index``
+of the cache directory, which is updated under a file lock when a tile is stored. When
+the cache is too large, the worker storing a tile scans the directory and removes the
+tiles with the oldest modification times (which are updated on each hit).
+"""
+
+import os
+import time
+import errno
+import fcntl
+import hashlib
+import tempfile
+import threading
+
+from pyramid.response import FileResponse
+
+from twitcher.stats import add_stats_provider
+from twitcher.utils import token_params
+
+import logging
+LOGGER = logging.getLogger("TWITCHER")
+
+# image formats which are cached and their file extensions
+tile_formats = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/gif': '.gif',
+}
+
+# parameters which don't change the response
+ignored_params = token_params
+
+# a bbox coordinate is rounded to this fraction of the tile extent
+GRID_FRACTION = 1000.0
+
+INDEX_FILE = 'index'
+# a full cache is reduced to this fraction of its maximum size, so that it is not scanned on each store
+LOW_WATERMARK = 0.9
+
+_lock = threading.Lock()
+
+
+def tilecache_factory(registry):
+    """
+    Returns the tile cache of this registry or ``None`` when the setting ``twitcher.tile_cache_dir``
+    is not set. The size of the cache is limited by ``twitcher.tile_cache_max_bytes`` (default: 512 MB).
+    """
+    settings = registry.settings or {}
+    if not settings.get('twitcher.tile_cache_dir'):
+        return None
+    tilecache = getattr(registry, 'tilecache', None)
+    if tilecache is None:
+        with _lock:
+            tilecache = getattr(registry, 'tilecache', None)
+            if tilecache is None:
+                tilecache = registry.tilecache = TileCache(
+                    settings['twitcher.tile_cache_dir'],
+                    max_bytes=int(settings.get('twitcher.tile_cache_max_bytes', 512 * 1024 * 1024)))
+                add_stats_provider(registry, 'tile_cache', tilecache.stats)
+    return tilecache
+
+
+def _snap_bbox(bbox):
+    """
+    Rounds the bbox coordinates to a grid of a fraction of the tile extent, so that
+    coordinates which only differ by floating point noise give the same key.
+    """
+    minx, miny, maxx, maxy = [float(value) for value in bbox.split(',')]
+    span = min(maxx - minx, maxy - miny)
+    if span <= 0:
+        raise ValueError('empty bbox')
+    step = float('%.6g' % (span / GRID_FRACTION))
+    coordinates = ','.join(str(int(round(value / step))) for value in (minx, miny, maxx, maxy))
+    return '{}:{}'.format('%.6g' % step, coordinates)
+
+
+def tile_key(request, service, extra_path=None):
+    """
+    Returns a tuple of the cache key of a GetMap request and its image format.
+    Returns ``None`` if the request can not be cached.
+
+    The key is built from the service url, the sorted parameters with lowercase names and
+    the bbox rounded to the tile grid.
+    """
+    if request.method != 'GET':
+        return None
+    params = []
+    request_type = image_format = None
+    for key, value in request.GET.items():
+        key = key.lower()
+        if key in ignored_params:
+            continue
+        if key in ('service', 'request', 'format'):
+            value = value.lower()
+        if key == 'request':
+            request_type = value
+        elif key == 'format':
+            image_format = value
+        elif key == 'bbox':
+            try:
+                value = _snap_bbox(value)
+            except ValueError:
+                return None
+        params.append((key, value))
+    if request_type != 'getmap' or image_format not in tile_formats:
+        return None
+    canonical = '&'.join('{}={}'.format(key, value) for key, value in sorted(params))
+    text = u'{}\n{}\n{}'.format(service['url'], extra_path or '', canonical)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest(), image_format
+
+
+def _touch(path):
+    # the current time with a finer resolution than the file timestamps of the kernel
+    now = time.time()
+    os.utime(path, (now, now))
+
+
+class TileCache(object):
+    """
+    A size-bounded LRU cache of tiles stored in ``directory``, shared by the worker processes of a host.
+
+    The size of the cache is kept in its index file. The recently used order is given by the
+    modification times of the files, which are updated on each hit.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path(self, key, image_format):
+        return os.path.join(self.directory, key[:2], key + tile_formats[image_format])
+
+    def response(self, request, key, image_format):
+        """
+        Returns a ``FileResponse`` of the cached tile or ``None`` if it is not cached.
+        """
+        path = self.path(key, image_format)
+        try:
+            response = FileResponse(path, request=request, content_type=image_format)
+        except (IOError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # keep the recently used order for all workers
+            _touch(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return response
+
+    def store(self, key, image_format, content):
+        """
+        Writes a tile to the cache and removes the least recently used tiles if the cache is too large.
+        """
+        path = self.path(key, image_format)
+        dirname = os.path.dirname(path)
+        try:
+            os.makedirs(dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # write to a temporary file and rename it, so that readers never see a partial tile
+        fd, tmp_path = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(content)
+        _touch(tmp_path)
+        with open(os.path.join(self.directory, INDEX_FILE), 'a+') as index:
+            fcntl.flock(index, fcntl.LOCK_EX)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = None
+            os.rename(tmp_path, path)
+            totals = self._read_index(index)
+            if totals is None:
+                files, size = self._scan_totals()
+            elif replaced is None:
+                files, size = totals[0] + 1, totals[1] + len(content)
+            else:
+                files, size = totals[0], totals[1] + len(content) - replaced
+            if size > self.max_bytes:
+                files, size = self._evict(int(self.max_bytes * LOW_WATERMARK))
+            self._write_index(index, files, size)
+
+    def stats(self):
+        """
+        Returns a dict with the number of ``hits``, ``misses`` of this worker, and the cached
+        ``files`` of all workers and their size in ``kbytes``.
+        """
+        files, size = self._totals()
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'files': files, 'kbytes': size // 1024}
+
+    def _totals(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE)) as index:
+                totals = self._read_index(index)
+        except IOError:
+            totals = None
+        return totals or self._scan_totals()
+
+    def _read_index(self, index):
+        index.seek(0)
+        try:
+            files, size = [int(value) for value in index.read().split()]
+        except ValueError:
+            return None
+        return files, size
+
+    def _write_index(self, index, files, size):
+        index.seek(0)
+        index.truncate()
+        index.write('{} {}'.format(files, size))
+        index.flush()
+
+    def _scan(self):
+        entries = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.splitext(filename)[1] not in tile_formats.values():
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def _scan_totals(self):
+        entries = self._scan()
+        return len(entries), sum(size for _, _, size in entries)
+
+    def _evict(self, max_bytes):
+        # the least recently used tiles are removed first, the result is the new size of the cache
+        entries = sorted(self._scan())
+        size = sum(size for _, _, size in entries)
+        removed = 0
+        for _, path, file_size in entries:
+            if size <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= file_size
+            removed += 1
+        LOGGER.debug('Removed %s tiles from the tile cache.', removed)
+        return len(entries) - removed, size
@@ -2,9 +2,17 @@
 Provides various implementations of algorithms to generate an Access Token.
 """
 
+import hmac
+import json
+import time
 import uuid
+import base64
+import hashlib
+
+from cryptography.fernet import Fernet, InvalidToken
 
 from twitcher.datatype import AccessToken
+from twitcher.exceptions import AccessTokenNotFound
 from twitcher.utils import expires_at
 
 import logging
@@ -12,6 +20,14 @@ logger = logging.getLogger(__name__)
 
 
 def tokengenerator_factory(registry):
+    """
+    Creates the token generator selected with the setting ``twitcher.token_generator``:
+    "uuid" (default) or "hmac". The "hmac" generator needs a ``twitcher.token_secret``.
+    """
+    settings = registry.settings or {}
+    generator = settings.get('twitcher.token_generator') or 'uuid'
+    if generator == 'hmac':
+        return HmacTokenGenerator(secret=settings.get('twitcher.token_secret'))
     return UuidTokenGenerator()
 
 
@@ -29,6 +45,7 @@ class TokenGenerator(object):
         data = data or {}
         token = AccessToken(
             token=self.generate(),
+            issued_at=time.time(),
             expires_at=expires_at(hours=valid_in_hours),
             data=data)
         return token
@@ -36,6 +53,16 @@ class TokenGenerator(object):
     def generate(self):
         raise NotImplementedError
 
+    def verify(self, token):
+        """
+        Verifies a self-contained token.
+
+        :return: An instance of :class:`twitcher.datatype.AccessToken` or ``None`` if the token
+                 must be fetched from the token store.
+        :raises AccessTokenNotFound: if the token is not valid.
+        """
+        return None
+
 
 class UuidTokenGenerator(TokenGenerator):
     """
@@ -46,3 +73,78 @@ class UuidTokenGenerator(TokenGenerator):
         :return: A new token
         """
         return uuid.uuid4().get_hex()
+
+
+def _b64encode(data):
+    return str(base64.urlsafe_b64encode(data).decode('ascii').rstrip('='))
+
+
+def _b64decode(data):
+    data = data.encode('ascii')
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+class HmacTokenGenerator(TokenGenerator):
+    """
+    Generate a self-contained token signed with HMAC-SHA256.
+
+    The token carries its expiration time and data, so it can be verified without
+    a lookup in the token store. Tokens are passed in urls, so the data (like an ESGF
+    access token) is encrypted with a key derived from the secret.
+    """
+    def __init__(self, secret):
+        if not secret:
+            raise ValueError("A secret is needed to sign tokens.")
+        if not isinstance(secret, bytes):
+            secret = secret.encode('utf-8')
+        self.secret = secret
+        key = hmac.new(self.secret, b'twitcher token data', hashlib.sha256).digest()
+        self._fernet = Fernet(base64.urlsafe_b64encode(key))
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.secret, payload.encode('ascii'), hashlib.sha256).digest())
+
+    def create_access_token(self, valid_in_hours=1, data=None):
+        """
+        Creates a signed access token.
+        """
+        data = data or {}
+        claims = {
+            'jti': self.generate(),
+            'iat': time.time(),
+            'exp': expires_at(hours=valid_in_hours),
+            'data': self._fernet.encrypt(json.dumps(data).encode('utf-8')).decode('ascii')}
+        payload = _b64encode(json.dumps(claims, separators=(',', ':'), sort_keys=True).encode('utf-8'))
+        return AccessToken(
+            token='{}.{}'.format(payload, self._sign(payload)),
+            issued_at=claims['iat'],
+            expires_at=claims['exp'],
+            data=data)
+
+    def generate(self):
+        """
+        :return: A new unique token id
+        """
+        return uuid.uuid4().hex
+
+    def verify(self, token):
+        """
+        Verifies the signature of the token and returns the access token it carries.
+        Tokens which are not signed (like uuid tokens) are left to the token store.
+        """
+        try:
+            payload, signature = str(token).split('.')
+        except (ValueError, UnicodeError):
+            return None
+        if not hmac.compare_digest(self._sign(payload), signature):
+            raise AccessTokenNotFound
+        try:
+            claims = json.loads(_b64decode(payload).decode('utf-8'))
+            data = json.loads(self._fernet.decrypt(claims['data'].encode('ascii')).decode('utf-8'))
+            return AccessToken(
+                token=token,
+                issued_at=claims['iat'],
+                expires_at=claims['exp'],
+                data=data)
+        except (ValueError, KeyError, TypeError, AttributeError, InvalidToken):
+            raise AccessTokenNotFound
@@ -1,15 +1,58 @@
 import sys
+import json
 import getpass
 import argcomplete
 import argparse
 
 from twitcher.client import TwitcherService
 
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
 import logging
 logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.WARN)
 LOGGER = logging.getLogger(__name__)
 
 
+def file_format(path, fmt=None):
+    """
+    Returns the format of a services file: ``fmt`` if given, "yaml" for the extensions
+    ``.yml`` and ``.yaml`` and "json" otherwise (also for stdin and stdout).
+    """
+    if fmt:
+        return fmt
+    if path.lower().endswith(('.yml', '.yaml')):
+        return 'yaml'
+    return 'json'
+
+
+def _yaml():
+    if yaml is None:
+        raise Exception("PyYAML is needed for YAML files (pip install pyramid_twitcher[yaml]).")
+    return yaml
+
+
+def load_services(fp, fmt='json'):
+    """
+    Reads a list of services from the JSON or YAML file object ``fp``.
+    """
+    if fmt == 'yaml':
+        return _yaml().safe_load(fp)
+    return json.load(fp)
+
+
+def dump_services(services, fp, fmt='json'):
+    """
+    Writes a list of services to the file object ``fp`` as JSON or YAML.
+    """
+    if fmt == 'yaml':
+        _yaml().safe_dump(services, fp, default_flow_style=False)
+    else:
+        json.dump(services, fp, indent=2, sort_keys=True)
+
+
 class TwitcherCtl(object):
     """
     Command line to interact with the xmlrpc interface of the ``twitcher`` service.
@@ -84,11 +127,44 @@ class TwitcherCtl(object):
                                help="If set then service has no access restrictions.")
         subparser.add_argument('--auth', default='token',
                                help="Authentication method (token, cert). Default: token.")
+        subparser.add_argument('--tile-cache', action='store_true',
+                               help="If set then GetMap responses of this service are cached.")
 
         # unregister
         subparser = subparsers.add_parser('unregister', help="Removes OWS service from the registry.")
         subparser.add_argument('name', help="Service name.")
 
+        # import
+        subparser = subparsers.add_parser(
+            'import', help="Adds the OWS services of a JSON or YAML file (like the output of export).")
+        subparser.add_argument('file', help="JSON or YAML (.yml, .yaml) file with a list of services. "
+                                            "Use - to read from stdin.")
+        subparser.add_argument('--format', choices=['json', 'yaml'],
+                               help="File format. Default: yaml for .yml and .yaml files, otherwise json.")
+        subparser.add_argument('--no-overwrite', action='store_true',
+                               help="Don't replace services which are already registered.")
+
+        # export
+        subparser = subparsers.add_parser('export',
+                                          help="Writes all registered OWS services to a JSON or YAML file.")
+        subparser.add_argument('file', nargs='?', default='-',
+                               help="Output file. Default: - (stdout).")
+        subparser.add_argument('--format', choices=['json', 'yaml'],
+                               help="File format. Default: yaml for .yml and .yaml files, otherwise json.")
+
+        # statistics
+        # ----------
+
+        # stats
+        subparser = subparsers.add_parser('stats', help="Shows runtime statistics like cache hits and misses.")
+
+        # database
+        # --------
+
+        # migrate
+        subparser = subparsers.add_parser(
+            'migrate', help="Creates the indexes of the mongodb collections and updates the tokens of older versions.")
+
         return parser
 
     def run(self, args):
@@ -116,11 +192,31 @@ class TwitcherCtl(object):
             elif args.cmd == 'register':
                 result = service.register_service(
                     url=args.url,
-                    data={'name': args.name, 'type': args.type, 'public': args.public, 'auth': args.auth})
+                    data={'name': args.name, 'type': args.type, 'public': args.public, 'auth': args.auth,
+                          'tile_cache': args.tile_cache})
             elif args.cmd == 'unregister':
                 result = service.unregister_service(name=args.name)
             elif args.cmd == 'clear':
                 result = service.clear_services()
+            elif args.cmd == 'import':
+                fmt = file_format(args.file, args.format)
+                if args.file == '-':
+                    services = load_services(sys.stdin, fmt)
+                else:
+                    with open(args.file) as fp:
+                        services = load_services(fp, fmt)
+                result = service.register_services(services, overwrite=not args.no_overwrite)
+                for item in result:
+                    if 'error' in item:
+                        LOGGER.warn("Could not import %s: %s", item['url'], item['error'])
+            elif args.cmd == 'export':
+                result = service.list_services()
+                fmt = file_format(args.file, args.format)
+                if args.file == '-':
+                    dump_services(result, sys.stdout, fmt)
+                else:
+                    with open(args.file, 'w') as fp:
+                        dump_services(result, fp, fmt)
             elif args.cmd == 'gentoken':
                 data = {k: v for k, v in (x.split('=') for x in args.env)}
                 if args.esgf_access_token:
@@ -134,6 +230,10 @@ class TwitcherCtl(object):
                     result = service.revoke_all_tokens()
                 else:
                     result = service.revoke_token(token=args.token)
+            elif args.cmd == 'stats':
+                result = service.get_stats()
+            elif args.cmd == 'migrate':
+                result = service.migrate()
         except Exception as e:
             LOGGER.error("Error: %s", e.message)
         else:
@@ -1,7 +1,7 @@
+import re
 import time
 from datetime import datetime
 import pytz
-from lxml import etree
 
 from twitcher.exceptions import ServiceNotFound
 
@@ -10,6 +10,9 @@ from twitcher._compat import urlparse
 import logging
 logger = logging.getLogger(__name__)
 
+# request parameters with the access token, in the order they are looked up
+token_params = ('token', 'access_token')
+
 
 def is_valid_url(url):
     try:
@@ -79,6 +82,17 @@ def path_elements(path):
     return elements
 
 
+def seekable_body_file(request):
+    """
+    Returns the body of ``request`` as a seekable file object at its start.
+    A body which is not seekable yet (like ``wsgi.input``) is copied, to a temporary file
+    when it is larger than the setting ``twitcher.request_body_tempfile_limit`` (default: 1 MB).
+    """
+    settings = request.registry.settings or {}
+    request.request_body_tempfile_limit = int(settings.get('twitcher.request_body_tempfile_limit', 1024 * 1024))
+    return request.body_file_seekable
+
+
 def lxml_strip_ns(tree):
     for node in tree.iter():
         try:
@@ -89,37 +103,234 @@ def lxml_strip_ns(tree):
             node.tag = node.tag.split('}', 1)[1]
 
 
+# start and end tags. Attribute values may contain ">".
+_TAG_RE = re.compile(br'<[^"\'>]*(?:(?:"[^"]*"|\'[^\']*\')[^"\'>]*)*>')
+_TAG_NAME_RE = re.compile(br'<(/?)(?:[\w.-]+:)?([\w.-]+)')
+# doctype declaration with an optional internal subset
+_DECL_RE = re.compile(br'<![^\[>]*(?:\[[^\]]*\])?[^>]*>')
+_HREF_RE = re.compile(br'(\s[\w.-]+:href\s*=\s*)("[^"]*"|\'[^\']*\')')
+# markup which may contain "<" and ">"
+_SECTIONS = {b'<!--': b'-->', b'<![CDATA[': b']]>', b'<?': b'?>'}
+_SECTION_RE = br'<!--|<!\[CDATA\[|<\?|'
+_ONLINE_RESOURCE_RE = re.compile(_SECTION_RE + br'<(?:[\w.-]+:)?OnlineResource(?=[\s/>])')
+_OPERATIONS_METADATA_RE = re.compile(_SECTION_RE + br'<(?:[\w.-]+:)?OperationsMetadata(?=[\s/>])')
+_START_TAG_RE = re.compile(_SECTION_RE + br'</?(?![!?])')
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+
+class CapsUrlRewriter(object):
+    """
+    Replaces the service urls in an OWS capabilities document which is fed in chunks.
+
+    Only the ``xlink:href`` attributes of the ``OnlineResource`` elements (WMS) or of the
+    elements in ``OperationsMetadata`` (WPS and other OWS services) are rewritten. All other
+    content is passed through unchanged without parsing the whole document, so that only
+    the current tag is kept in memory. Other documents are passed through and ``prev_url``
+    is replaced by ``url`` when it is given.
+
+    The document must use an ASCII compatible encoding like UTF-8.
+
+    :param url: the proxy url.
+    :param prev_url: the url of the service which is replaced in other documents.
+    :param max_tag_size: maximum size of a tag. The rest of a document with larger tags is passed
+                         through unchanged.
+    """
+
+    def __init__(self, url, prev_url=None, max_tag_size=1024 * 1024):
+        self.url = _to_bytes(url)
+        self.escaped_url = self.url.replace(b'&', b'&amp;').replace(b'<', b'&lt;').replace(b'"', b'&quot;')
+        self.prev_url = _to_bytes(prev_url) if prev_url else None
+        self.max_tag_size = max_tag_size
+        self.mode = None
+        self.section_end = None
+        self.in_operations = False
+        self.buffer = b''
+
+    def feed(self, data):
+        """
+        Adds a chunk of the document and returns the rewritten content which is complete.
+        """
+        self.buffer += data
+        if self.mode is None and not self._detect_mode():
+            if len(self.buffer) <= self.max_tag_size:
+                return b''
+            self.mode = 'copy'
+        return self._process(final=False)
+
+    def close(self):
+        """
+        Returns the rest of the rewritten document.
+        """
+        if self.mode is None and not self._detect_mode():
+            self.mode = 'copy'
+        return self._process(final=True)
+
+    def _detect_mode(self):
+        # find the root element after the xml declaration, comments and doctype
+        buf = self.buffer
+        pos = 0
+        while True:
+            start = buf.find(b'<', pos)
+            if start < 0 or len(buf) - start < 2:
+                return False
+            if buf.startswith(b'<!', start) or buf.startswith(b'<?', start):
+                for opener, closer in _SECTIONS.items():
+                    if buf.startswith(opener, start):
+                        end = buf.find(closer, start + len(opener))
+                        if end < 0:
+                            return False
+                        pos = end + len(closer)
+                        break
+                else:
+                    match = _DECL_RE.match(buf, start)
+                    if match is None:
+                        return False
+                    pos = match.end()
+                continue
+            match = _TAG_RE.match(buf, start)
+            if match is None:
+                return False
+            match = _TAG_NAME_RE.match(match.group(0))
+            if match is None:
+                self.mode = 'copy'
+                return True
+            root = match.group(2)
+            if root in (b'WMT_MS_Capabilities', b'WMS_Capabilities'):
+                logger.debug("replace proxy urls in wms")
+                self.mode = 'wms'
+            elif b'Capabilities' in root:
+                self.mode = 'operations'
+            elif self.prev_url:
+                self.mode = 'replace'
+            else:
+                self.mode = 'copy'
+            return True
+
+    def _process(self, final):
+        if self.mode == 'copy':
+            out, self.buffer = self.buffer, b''
+            return out
+        if self.mode == 'replace':
+            return self._replace(final)
+        out = []
+        buf = self.buffer
+        pos = 0
+        while True:
+            if self.section_end is not None:
+                # inside a comment, CDATA section or processing instruction
+                end = buf.find(self.section_end, pos)
+                if end < 0:
+                    cut = max(pos, len(buf) - len(self.section_end) + 1)
+                    out.append(buf[pos:cut])
+                    pos = cut
+                    break
+                end += len(self.section_end)
+                out.append(buf[pos:end])
+                pos = end
+                self.section_end = None
+                continue
+            # skip to the next tag which may need a replacement
+            if self.mode == 'wms':
+                pattern = _ONLINE_RESOURCE_RE
+            elif self.in_operations:
+                pattern = _START_TAG_RE
+            else:
+                pattern = _OPERATIONS_METADATA_RE
+            match = pattern.search(buf, pos)
+            if match is None:
+                # keep a tag which may be incomplete
+                cut = buf.rfind(b'<', pos)
+                if final or cut < 0:
+                    cut = len(buf)
+                out.append(buf[pos:cut])
+                pos = cut
+                break
+            start = match.start()
+            out.append(buf[pos:start])
+            pos = start
+            section_end = _SECTIONS.get(match.group(0))
+            if section_end is not None:
+                out.append(match.group(0))
+                pos = match.end()
+                self.section_end = section_end
+                continue
+            match = _TAG_RE.match(buf, start)
+            if match is None:
+                break
+            out.append(self._rewrite_tag(match.group(0)))
+            pos = match.end()
+        self.buffer = buf[pos:]
+        if final or len(self.buffer) > self.max_tag_size:
+            if not final:
+                logger.warn('tag too large, stop replacing urls.')
+            self.mode = 'copy'
+            out.append(self.buffer)
+            self.buffer = b''
+        return b''.join(out)
+
+    def _rewrite_tag(self, tag):
+        match = _TAG_NAME_RE.match(tag)
+        if match is None:
+            return tag
+        closing, name = match.groups()
+        if self.mode == 'wms':
+            if not closing and name == b'OnlineResource':
+                tag = _HREF_RE.sub(self._replace_online_resource, tag)
+        elif name == b'OperationsMetadata':
+            self.in_operations = not closing and not tag.endswith(b'/>')
+        elif self.in_operations and not closing:
+            tag = _HREF_RE.sub(self._replace_operation, tag)
+        return tag
+
+    def _replace_online_resource(self, match):
+        value = match.group(2)
+        quote = value[:1]
+        query = value[1:-1].partition(b'?')[2].partition(b'#')[0]
+        new_url = self.escaped_url
+        if query:
+            new_url += b'?' + query
+        return match.group(1) + quote + new_url + quote
+
+    def _replace_operation(self, match):
+        quote = match.group(2)[:1]
+        return match.group(1) + quote + self.escaped_url + quote
+
+    def _replace(self, final):
+        buf = self.buffer
+        cut = len(buf)
+        if not final:
+            # keep the bytes which may be the start of prev_url
+            cut = max(0, len(buf) - len(self.prev_url) + 1)
+            straddling = buf.find(self.prev_url, max(0, cut - len(self.prev_url) + 1))
+            if 0 <= straddling < cut:
+                cut = straddling + len(self.prev_url)
+        self.buffer = buf[cut:]
+        return buf[:cut].replace(self.prev_url, self.url)
+
+
+def iter_replace_caps_url(chunks, url, prev_url=None):
+    """
+    Replaces the service urls in the chunks of a capabilities document (see :class:`CapsUrlRewriter`).
+
+    :return: an iterator of rewritten chunks.
+    """
+    rewriter = CapsUrlRewriter(url, prev_url)
+    for chunk in chunks:
+        data = rewriter.feed(chunk)
+        if data:
+            yield data
+    data = rewriter.close()
+    if data:
+        yield data
+
+
 def replace_caps_url(xml, url, prev_url=None):
-    ns = {
-        'ows': 'http://www.opengis.net/ows/1.1',
-        'xlink': 'http://www.w3.org/1999/xlink'}
-    doc = etree.fromstring(xml)
-    # wms 1.1.1 onlineResource
-    if 'WMT_MS_Capabilities' in doc.tag:
-        logger.debug("replace proxy urls in wms 1.1.1")
-        for element in doc.findall('.//OnlineResource[@xlink:href]', namespaces=ns):
-            parsed_url = urlparse(element.get('{http://www.w3.org/1999/xlink}href'))
-            new_url = url
-            if parsed_url.query:
-                new_url += '?' + parsed_url.query
-            element.set('{http://www.w3.org/1999/xlink}href', new_url)
-        xml = etree.tostring(doc)
-    # wms 1.3.0 onlineResource
-    elif 'WMS_Capabilities' in doc.tag:
-        logger.debug("replace proxy urls in wms 1.3.0")
-        for element in doc.findall('.//{http://www.opengis.net/wms}OnlineResource[@xlink:href]', namespaces=ns):
-            parsed_url = urlparse(element.get('{http://www.w3.org/1999/xlink}href'))
-            new_url = url
-            if parsed_url.query:
-                new_url += '?' + parsed_url.query
-            element.set('{http://www.w3.org/1999/xlink}href', new_url)
-        xml = etree.tostring(doc)
-    # wps operations
-    elif 'Capabilities' in doc.tag:
-        for element in doc.findall('ows:OperationsMetadata//*[@xlink:href]', namespaces=ns):
-            element.set('{http://www.w3.org/1999/xlink}href', url)
-        xml = etree.tostring(doc)
-    elif prev_url:
-        xml = xml.decode('utf-8', 'ignore')
-        xml = xml.replace(prev_url, url)
-    return xml
+    """
+    Replaces the service urls in a capabilities document with the proxy ``url``.
+    """
+    return b''.join(iter_replace_caps_url([_to_bytes(xml)], url, prev_url))
@@ -0,0 +1,264 @@
+"""
+Lifecycle of the workdirs which twitcher creates for the ESGF credentials of requests.
+
+Each workdir gets an expiry time, linked to the expiry of the certificate and of the access
+tokens using it, which is stored in the file ``.twitcher_expires`` of the workdir. A background
+thread removes expired workdirs (and workdirs of older twitcher versions without an expiry
+after ``max_age`` seconds) in bounded batches, so that the twitcher workdir doesn't grow
+without limit. Only one worker process of a host sweeps at a time.
+"""
+
+import os
+import time
+import errno
+import fcntl
+import shutil
+import tempfile
+import threading
+
+from twitcher.stats import add_stats_provider
+
+import logging
+LOGGER = logging.getLogger("TWITCHER")
+
+EXPIRES_FILE = '.twitcher_expires'
+LOCK_FILE = 'sweep.lock'
+
+_lock = threading.Lock()
+
+
+def workdir_path(settings):
+    """
+    Returns the twitcher workdir of the settings (``twitcher.workdir``, default: the temp directory).
+    """
+    return settings.get('twitcher.workdir') or tempfile.gettempdir()
+
+
+def workdir_prefix(settings):
+    """
+    Returns the prefix of the directories created in the twitcher workdir (``twitcher.prefix``).
+    """
+    return settings.get('twitcher.prefix') or 'twitcher_'
+
+
+def workdirs_factory(registry):
+    """
+    Returns the :class:`WorkdirManager` of this registry. The sweep can be configured with the settings
+    ``twitcher.workdir_sweep_interval`` (seconds between two sweeps, default: 60, 0 disables it),
+    ``twitcher.workdir_sweep_batch`` (directories checked per sweep, default: 1000) and
+    ``twitcher.workdir_max_age`` (age of directories without an expiry, default: 86400 seconds).
+    """
+    workdirs = getattr(registry, 'workdirs', None)
+    if workdirs is None:
+        with _lock:
+            workdirs = getattr(registry, 'workdirs', None)
+            if workdirs is None:
+                settings = registry.settings or {}
+                workdirs = registry.workdirs = WorkdirManager(
+                    workdir_path(settings),
+                    prefix=workdir_prefix(settings),
+                    interval=float(settings.get('twitcher.workdir_sweep_interval', 60)),
+                    batch_size=int(settings.get('twitcher.workdir_sweep_batch', 1000)),
+                    max_age=int(settings.get('twitcher.workdir_max_age', 86400)))
+                add_stats_provider(registry, 'workdirs', workdirs.stats)
+    return workdirs
+
+
+def expires_at(path):
+    """
+    Returns the expiry time of the workdir ``path`` or ``None`` if it has none.
+    """
+    try:
+        with open(os.path.join(path, EXPIRES_FILE)) as fh:
+            return float(fh.read().strip())
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def disk_usage(path):
+    """
+    Returns the size of the files in ``path`` in bytes.
+    """
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class WorkdirManager(object):
+    """
+    Creates workdirs in ``workdir`` and removes them after they expired.
+
+    :param grace: seconds an expired workdir is kept for requests which are still running.
+    :param max_age: seconds after which a workdir without an expiry is removed.
+    :param batch_size: maximum number of directories checked by one :meth:`sweep`.
+    :param interval: seconds between two sweeps of the background thread (0 disables it).
+    """
+
+    def __init__(self, workdir, prefix='twitcher_', grace=300, max_age=86400, batch_size=1000, interval=60,
+                 timer=time.time):
+        self.workdir = workdir
+        self.prefix = prefix
+        self.grace = grace
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timer = timer
+        self.created = 0
+        self.scanned = 0
+        self.removed = 0
+        self.reclaimed_bytes = 0
+        self.sweeps = 0
+        # path -> expiry time set by this process
+        self._expires = {}
+        self._pending = []
+        self._pid = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def create(self, workdir=None, prefix=None):
+        """
+        Creates a new workdir and returns its path. It expires after ``max_age`` seconds
+        unless :meth:`expire_at` is called.
+        """
+        self._start()
+        path = tempfile.mkdtemp(prefix=prefix or self.prefix, dir=workdir or self.workdir)
+        with self._lock:
+            self.created += 1
+        return path
+
+    def expire_at(self, path, expires):
+        """
+        Sets the expiry time of the workdir ``path``. An earlier expiry time than the current one is ignored,
+        so that the workdir is kept for the token which expires last.
+        """
+        self._start()
+        with self._lock:
+            current = self._expires.get(path)
+        if current is None:
+            current = expires_at(path)
+        if current is not None and current >= expires:
+            return
+        tmp_path = os.path.join(path, '{}.{}.{}'.format(EXPIRES_FILE, os.getpid(), threading.current_thread().ident))
+        try:
+            with open(tmp_path, 'w') as fh:
+                fh.write(str(int(expires)))
+            os.rename(tmp_path, os.path.join(path, EXPIRES_FILE))
+        except (IOError, OSError):
+            LOGGER.warn('Could not set the expiry of workdir %s.', path)
+            return
+        with self._lock:
+            self._expires[path] = expires
+
+    def sweep(self):
+        """
+        Checks up to ``batch_size`` directories of the workdir and removes the expired ones.
+        Returns the number of removed directories and their size in bytes.
+        """
+        lock_path = os.path.join(self.workdir, self.prefix + LOCK_FILE)
+        try:
+            lock = open(lock_path, 'a')
+        except IOError:
+            LOGGER.warn('Could not open %s.', lock_path)
+            return 0, 0
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError as e:
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    # another process is sweeping
+                    return 0, 0
+                raise
+            return self._sweep_batch()
+
+    def stats(self):
+        """
+        Returns a dict with the number of ``created`` workdirs, ``sweeps``, ``scanned`` and ``removed``
+        directories and the size of the removed directories in ``reclaimed_kbytes``.
+        """
+        with self._lock:
+            return {'created': self.created, 'sweeps': self.sweeps, 'scanned': self.scanned,
+                    'removed': self.removed, 'reclaimed_kbytes': self.reclaimed_bytes // 1024}
+
+    def close(self):
+        """
+        Stops the background thread.
+        """
+        self._stopped.set()
+
+    def _sweep_batch(self):
+        if not self._pending:
+            try:
+                names = os.listdir(self.workdir)
+            except OSError:
+                return 0, 0
+            self._pending = [name for name in names if name.startswith(self.prefix)]
+        batch = self._pending[:self.batch_size]
+        del self._pending[:self.batch_size]
+        now = self.timer()
+        removed = reclaimed = 0
+        for name in batch:
+            path = os.path.join(self.workdir, name)
+            size = self._remove_expired(path, now)
+            if size is not None:
+                removed += 1
+                reclaimed += size
+        with self._lock:
+            self.sweeps += 1
+            self.scanned += len(batch)
+            self.removed += removed
+            self.reclaimed_bytes += reclaimed
+            for name in batch:
+                self._expires.pop(os.path.join(self.workdir, name), None)
+        if removed:
+            LOGGER.debug('Removed %s expired workdirs (%s bytes).', removed, reclaimed)
+        return removed, reclaimed
+
+    def _remove_expired(self, path, now):
+        # returns the size of the removed directory or None
+        try:
+            if os.path.islink(path):
+                # a link to the current workdir of a token
+                if not os.path.exists(path):
+                    os.remove(path)
+                    return 0
+                return None
+            if not os.path.isdir(path):
+                return None
+            expires = expires_at(path)
+            if expires is None:
+                expires = os.path.getmtime(path) + self.max_age
+            if expires + self.grace > now:
+                return None
+            size = disk_usage(path)
+            shutil.rmtree(path)
+            return size
+        except OSError:
+            LOGGER.warn('Could not remove workdir %s.', path)
+            return None
+
+    def _start(self):
+        if self.interval <= 0:
+            return
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                # threads don't survive a fork
+                self._pid = pid
+                thread = threading.Thread(target=self._run, name='twitcher-workdirs')
+                thread.daemon = True
+                thread.start()
+
+    def _run(self):
+        pid = os.getpid()
+        while not self._stopped.wait(self.interval) and self._pid == pid:
+            try:
+                self.sweep()
+            except Exception:
+                LOGGER.exception('Could not sweep the workdir.')